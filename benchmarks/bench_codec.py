@@ -0,0 +1,121 @@
+'''
+Per-primitive microbenchmark of JEPacketBuffer against the previous implementation,
+which rebuilt the struct format string on every call and went through read_uint8/write_uint8 for varints.
+
+$ python benchmarks/bench_codec.py
+'''
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from networking.mcpacket.io import Buffer, JEPacketBuffer
+
+class _LegacyPacketBuffer(Buffer):
+    # 以前のJEPacketBufferの実装 (比較用)
+    def read_uint8(self):
+        return self.read(1)[0]
+
+    def write_uint8(self, value: int):
+        if not 0 <= value < 256:
+            raise ValueError('Value must be between 0 and 255.')
+        self.write(bytes([value]))
+
+    def read_int16(self, byte_order='big'):
+        return struct.unpack(f'{">" if byte_order == "big" else "<"}h', self.read(2))[0]
+
+    def write_int16(self, value: int, byte_order='big'):
+        if not -32768 <= value < 32768:
+            raise ValueError('Value must be between -32768 and 32767.')
+        self.write(struct.pack(f'{">" if byte_order == "big" else "<"}h', value))
+
+    def read_int32(self, byte_order='big'):
+        if len(self._buffer) < 4:
+            return None
+        return struct.unpack(f'{">" if byte_order == "big" else "<"}i', self.read(4))[0]
+
+    def write_int32(self, value: int, byte_order='big'):
+        if not -2147483648 <= value < 2147483648:
+            raise ValueError('Value must be between -2147483648 and 2147483647.')
+        self.write(struct.pack(f'{">" if byte_order == "big" else "<"}i', value))
+
+    def read_int64(self, byte_order='big'):
+        if len(self._buffer) < 8:
+            return None
+        return struct.unpack(f'{">" if byte_order == "big" else "<"}q', self.read(8))[0]
+
+    def write_int64(self, value: int, byte_order='big'):
+        if not -9223372036854775808 <= value < 9223372036854775808:
+            raise ValueError("Value must be between -9223372036854775808 and 9223372036854775807.")
+        self.write(struct.pack(f'{">" if byte_order == "big" else "<"}q', value))
+
+    def read_double(self, byte_order='big'):
+        if len(self._buffer) < 8:
+            return None
+        return struct.unpack(f'{">" if byte_order == "big" else "<"}d', self.read(8))[0]
+
+    def write_double(self, value: float, byte_order='big'):
+        self.write(struct.pack(f'{">" if byte_order == "big" else "<"}d', value))
+
+    def read_varint(self):
+        value = 0
+        position = 0
+        while True:
+            current_byte = self.read_uint8()
+            value |= (current_byte & 0x7F) << position
+            if (current_byte & 0x80) == 0:
+                break
+            position += 7
+            if position >= 32:
+                raise ValueError('Varint is too long')
+        return value
+
+    def write_varint(self, value: int):
+        while True:
+            if value & ~0x7F == 0:
+                self.write_uint8(value)
+                return
+            self.write_uint8((value & 0x7F) | 0x80)
+            value >>= 7
+
+# (プリミティブ名, 書き込む値)
+PRIMITIVES = [
+    ('int16', -1234),
+    ('int32', 123456789),
+    ('int64', 1234567890123),
+    ('double', 3.141592653589793),
+    ('varint', 1),
+    ('varint', 300),
+    ('varint', 2147483647),
+]
+COUNT = 1000
+
+def _bench(buffer_class, primitive: str, value) -> tuple[float, float]:
+    write = getattr(buffer_class, f'write_{primitive}')
+    read = getattr(buffer_class, f'read_{primitive}')
+    def write_all():
+        buffer = buffer_class()
+        for _ in range(COUNT):
+            write(buffer, value)
+        return buffer
+    data = write_all().get_value()
+    def read_all():
+        buffer = buffer_class(data, read_only=True)
+        for _ in range(COUNT):
+            read(buffer)
+    write_time = min(timeit.repeat(write_all, number=20, repeat=5)) / (20 * COUNT)
+    read_time = min(timeit.repeat(read_all, number=20, repeat=5)) / (20 * COUNT)
+    return read_time, write_time
+
+def main():
+    print(f'{"primitive":<18} {"read ns (legacy)":>18} {"read ns":>9} {"write ns (legacy)":>18} {"write ns":>9}')
+    for primitive, value in PRIMITIVES:
+        legacy_read, legacy_write = _bench(_LegacyPacketBuffer, primitive, value)
+        read, write = _bench(JEPacketBuffer, primitive, value)
+        name = f'{primitive}({value})' if primitive == 'varint' else primitive
+        print(f'{name:<18} {legacy_read * 1e9:>18.0f} {read * 1e9:>9.0f} {legacy_write * 1e9:>18.0f} {write * 1e9:>9.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Microbenchmark of PacketCompressor.compress against the previous implementation,
+which copied a per-level compressobj template for every packet.
+Packets are a varint packet ID segment followed by a payload segment, as produced by frame_packet.
+
+$ python benchmarks/bench_compression.py
+'''
+import os
+import sys
+import timeit
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from networking.compression import PacketCompressor
+
+LEVEL = 6
+# ペイロードのサイズ (既定のしきい値256バイト前後から、offload_sizeの64KiBまで)
+SIZES = [300, 1024, 4 * 1024, 16 * 1024, 64 * 1024]
+
+_template = zlib.compressobj(LEVEL)
+
+def _legacy_compress(chunks) -> bytes:
+    # 以前の実装 (テンプレートのcompressobjをパケットごとにcopyする)
+    compressor = _template.copy()
+    return b''.join([compressor.compress(chunk) for chunk in chunks]) + compressor.flush()
+
+def _payload(size: int) -> bytes:
+    # 半分は圧縮できるデータ、半分はランダムなデータ
+    return (b'pyncraft' * size)[:size // 2] + os.urandom(size - size // 2)
+
+def main():
+    compressor = PacketCompressor(LEVEL, workers=0)
+    print(f'{"payload":>8} {"template copy us":>17} {"zlib.compress us":>17} {"compress us":>12}')
+    for size in SIZES:
+        chunks = [b'\x27', _payload(size)]
+        assert zlib.decompress(compressor.compress(chunks)) == b''.join(chunks)
+        number = max(20, 200000 // size)
+        legacy = min(timeit.repeat(lambda: _legacy_compress(chunks), number=number, repeat=5)) / number
+        plain = min(timeit.repeat(lambda: zlib.compress(b''.join(chunks), LEVEL), number=number, repeat=5)) / number
+        current = min(timeit.repeat(lambda: compressor.compress(chunks), number=number, repeat=5)) / number
+        print(f'{size:>8} {legacy * 1e6:>17.1f} {plain * 1e6:>17.1f} {current * 1e6:>12.1f}')
+
+if __name__ == '__main__':
+    main()
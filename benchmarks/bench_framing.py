@@ -0,0 +1,92 @@
+'''
+Decode throughput of JEPacketWrapper.read_packet for pipelined packets.
+The legacy column reproduces the previous bytearray framing (copy the whole pending input, then delete the consumed prefix).
+
+$ python benchmarks/bench_framing.py
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import core
+from networking.enum import JEPacketConnectionState
+from networking.mcpacket import jepacket_class_registry
+from networking.mcpacket.io import JEPacketBuffer, JEPacketWrapper
+
+class _State:
+    compression_threshold = -1
+
+    def get_state(self):
+        return JEPacketConnectionState.STATUS
+
+class _Socket:
+    # recv_intoで事前に用意したデータを返すだけのソケット
+    def __init__(self, data: bytes, chunk_size: int = 0x10000):
+        self._data = memoryview(data)
+        self._chunk_size = chunk_size
+
+    def recv_into(self, buffer, nbytes=0):
+        n = min(len(buffer), self._chunk_size, len(self._data))
+        buffer[:n] = self._data[:n]
+        self._data = self._data[n:]
+        return n
+
+def _ping_stream(count: int) -> bytes:
+    packet = JEPacketBuffer()
+    for timestamp in range(count):
+        packet.write_varint(9)
+        packet.write_varint(0x01)
+        packet.write_int64(timestamp)
+    return packet.get_value()
+
+def _legacy_read_packet(input_buffer: bytearray, con_state):
+    if len(input_buffer) < 1:
+        return None
+    packet_buffer = JEPacketBuffer(bytes(input_buffer), read_only=True)
+    length = packet_buffer.read_varint()
+    expected_length = packet_buffer._position + length
+    if expected_length > len(input_buffer):
+        return None
+    del input_buffer[:expected_length]
+    packet_buffer = JEPacketBuffer(packet_buffer.read(length), read_only=True)
+    packet_id = packet_buffer.read_varint()
+    return jepacket_class_registry[(con_state.get_state(), packet_id)].from_bytes(packet_buffer)
+
+def bench_frame_buffer(data: bytes, count: int) -> float:
+    con_state = _State()
+    wrapper = JEPacketWrapper(_Socket(data))
+    decoded = 0
+    start = time.perf_counter()
+    while decoded < count:
+        wrapper.recv_to_buffer(None)
+        while wrapper.read_packet(con_state) is not None:
+            decoded += 1
+    return time.perf_counter() - start
+
+def bench_legacy(data: bytes, count: int) -> float:
+    con_state = _State()
+    source = _Socket(data, chunk_size=4096)
+    input_buffer = bytearray()
+    chunk = bytearray(4096)
+    decoded = 0
+    start = time.perf_counter()
+    while decoded < count:
+        n = source.recv_into(chunk)
+        input_buffer.extend(chunk[:n])
+        while _legacy_read_packet(input_buffer, con_state) is not None:
+            decoded += 1
+    return time.perf_counter() - start
+
+def main():
+    print(f'{"packets":>8} {"frame buffer (pkt/s)":>22} {"legacy (pkt/s)":>16}')
+    for count in (1, 100, 10_000):
+        data = _ping_stream(count)
+        repeat = max(1, 10_000 // count)
+        current = min(bench_frame_buffer(data, count) for _ in range(repeat))
+        legacy = min(bench_legacy(data, count) for _ in range(repeat))
+        print(f'{count:>8} {count / current:>22,.0f} {count / legacy:>16,.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Replays a packet capture through read_packet/handle/write_packet/flush without sockets
+and reports the time spent in each stage. Record a capture by setting capture_path in server.ini.
+
+$ python benchmarks/bench_replay.py resources/capture.bin
+$ python benchmarks/bench_replay.py resources/capture.bin --speed 1   # original timing
+'''
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import core
+from networking.capture import read_capture
+from networking.replay import CaptureReplayer
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('capture')
+    parser.add_argument('--speed', type=float, default=0, help='playback speed relative to the capture (0: as fast as possible)')
+    parser.add_argument('--repeat', type=int, default=5, help='replays to run (the fastest is reported)')
+    parser.add_argument('--compression-threshold', type=int, default=256)
+    args = parser.parse_args()
+    # ログインなどのINFOログをコンソールへ出さない
+    logging.disable(logging.INFO)
+
+    records = list(read_capture(args.capture))
+    results = []
+    for _ in range(args.repeat if args.speed == 0 else 1):
+        replayer = CaptureReplayer(records, args.speed, args.compression_threshold)
+        results.append(replayer.run())
+    result = max(results, key=lambda result: result['packets_per_second'])
+    print(f'{len(records)} records, {result["connections"]} connections, {result["packets_in"]} packets in, '
+          f'{result["packets_out"]} packets out ({result["recorded_out"]} recorded)')
+    print(f'{"stage":<8} {"total (ms)":>12} {"per packet (us)":>16}')
+    for stage, seconds in result['stage_seconds'].items():
+        print(f'{stage:<8} {seconds * 1000:>12.2f} {seconds * 1e6 / max(result["packets_in"], 1):>16.2f}')
+    print(f'{result["packets_per_second"]:,.0f} packets/s')
+    for error, count in result['errors'].items():
+        print(f'{count:>8}  {error}')
+
+if __name__ == '__main__':
+    main()
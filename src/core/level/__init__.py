@@ -0,0 +1,3 @@
+from core.level.level import Chunk, Level, Region
+from core.level.region import RegionCache, RegionFile
+from core.level.compression import COMPRESSION_TYPES, compression_type, custom_compression
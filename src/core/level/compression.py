@@ -0,0 +1,254 @@
+import io
+import struct
+import threading
+import zlib
+
+from core.logger import logger
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Chunk compression types (https://minecraft.wiki/w/Region_file_format)
+COMPRESSION_GZIP = 1
+COMPRESSION_ZLIB = 2
+COMPRESSION_NONE = 3
+COMPRESSION_LZ4 = 4
+COMPRESSION_CUSTOM = 127
+
+# Names accepted by the region_compression config option
+COMPRESSION_TYPES = {
+    'gzip': COMPRESSION_GZIP,
+    'zlib': COMPRESSION_ZLIB,
+    'none': COMPRESSION_NONE,
+    'lz4': COMPRESSION_LZ4,
+}
+
+# Payloads at least this large (compressed) are inflated piece by piece into a per-thread buffer.
+STREAM_THRESHOLD = 1 << 16
+STREAM_PIECE = 1 << 16
+
+# Namespaced id -> decompress function for payloads of type 127
+CUSTOM_COMPRESSIONS = {}
+
+def custom_compression(name: str):
+    # Registers the decompressor of a custom compression type, e.g. @custom_compression('mymod:zstd')
+    def wrapper(function):
+        CUSTOM_COMPRESSIONS[name] = function
+        return function
+    return wrapper
+
+def compression_type(name: str) -> int:
+    try:
+        compression_type = COMPRESSION_TYPES[name.lower()]
+    except KeyError:
+        raise ValueError(f'Unknown region compression {name!r}, expected one of {", ".join(COMPRESSION_TYPES)}') from None
+    if compression_type == COMPRESSION_LZ4 and lz4_block is None:
+        logger.warning('Region compression lz4 was selected but the lz4 package is not installed, chunks will be written uncompressed (pip install pyncraft_server[lz4])')
+    return compression_type
+
+_local = threading.local()
+
+def _inflate(payload, wbits: int) -> tuple[io.BytesIO, int]:
+    # Reuses one buffer per thread, so a large chunk is never held as a second full-size bytes object.
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        buffer = _local.buffer = io.BytesIO()
+    buffer.seek(0)
+    inflater = zlib.decompressobj(wbits)
+    data = payload
+    while data:
+        buffer.write(inflater.decompress(data, STREAM_PIECE))
+        data = inflater.unconsumed_tail
+    buffer.write(inflater.flush())
+    size = buffer.tell()
+    buffer.truncate(size)
+    buffer.seek(0)
+    return buffer, size
+
+def decompress(compression_type: int, payload) -> tuple[io.BytesIO, int]:
+    '''
+    Returns a stream over the uncompressed chunk data and its size.
+    The stream may be a buffer shared by later calls on the same thread, so it has to be read before the next call.
+    '''
+    if compression_type in (COMPRESSION_GZIP, COMPRESSION_ZLIB):
+        wbits = zlib.MAX_WBITS | 16 if compression_type == COMPRESSION_GZIP else zlib.MAX_WBITS
+        if len(payload) >= STREAM_THRESHOLD:
+            return _inflate(payload, wbits)
+        data = zlib.decompress(payload, wbits)
+    elif compression_type == COMPRESSION_NONE:
+        data = bytes(payload)
+    elif compression_type == COMPRESSION_LZ4:
+        data = lz4_block_stream_decompress(payload)
+    elif compression_type == COMPRESSION_CUSTOM:
+        # The payload starts with the namespaced id of the algorithm (2-byte length + UTF-8).
+        length = int.from_bytes(payload[:2], 'big')
+        name = bytes(payload[2:2 + length]).decode('utf-8')
+        if name not in CUSTOM_COMPRESSIONS:
+            raise ValueError(f'Unsupported custom chunk compression {name!r}')
+        data = CUSTOM_COMPRESSIONS[name](payload[2 + length:])
+    else:
+        raise ValueError(f'Unknown chunk compression type {compression_type}')
+    return io.BytesIO(data), len(data)
+
+def compress(compression_type: int, data: bytes) -> bytes:
+    if compression_type == COMPRESSION_GZIP:
+        deflater = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        return deflater.compress(data) + deflater.flush()
+    elif compression_type == COMPRESSION_ZLIB:
+        return zlib.compress(data)
+    elif compression_type == COMPRESSION_NONE:
+        return data
+    elif compression_type == COMPRESSION_LZ4:
+        return lz4_block_stream_compress(data)
+    raise ValueError(f'Cannot write chunks with compression type {compression_type}')
+
+# LZ4 chunks use the block stream of lz4-java (LZ4BlockOutputStream):
+# per block "LZ4Block" + token (method | level) + compressed length + original length + checksum (little-endian int32) + data,
+# terminated by an empty block.
+LZ4_MAGIC = b'LZ4Block'
+LZ4_HEADER = struct.Struct('<8sBiii')
+LZ4_METHOD_RAW = 0x10
+LZ4_METHOD_LZ4 = 0x20
+LZ4_BLOCK_SIZE = 1 << 16
+LZ4_LEVEL = 6 # log2(LZ4_BLOCK_SIZE) - 10
+LZ4_SEED = 0x9747B28C
+
+def lz4_block_stream_decompress(payload) -> bytes:
+    # Checksums are not verified, the region file is trusted like the zlib payloads are.
+    output = bytearray()
+    position = 0
+    while position + LZ4_HEADER.size <= len(payload):
+        magic, token, compressed_length, original_length, _ = LZ4_HEADER.unpack_from(payload, position)
+        if magic != LZ4_MAGIC:
+            raise ValueError('Invalid LZ4 block stream')
+        position += LZ4_HEADER.size
+        if original_length == 0:
+            break
+        block = payload[position:position + compressed_length]
+        position += compressed_length
+        if token & 0xF0 == LZ4_METHOD_RAW:
+            output += block
+        elif lz4_block is not None:
+            output += lz4_block.decompress(block, uncompressed_size=original_length)
+        else:
+            _lz4_decompress_block(block, output)
+    return bytes(output)
+
+def lz4_block_stream_compress(data: bytes) -> bytes:
+    # Without the lz4 package the blocks are stored uncompressed (method RAW), which every reader accepts.
+    output = bytearray()
+    for start in range(0, len(data), LZ4_BLOCK_SIZE):
+        block = data[start:start + LZ4_BLOCK_SIZE]
+        method, compressed = LZ4_METHOD_RAW, block
+        if lz4_block is not None:
+            candidate = lz4_block.compress(block, store_size=False)
+            if len(candidate) < len(block):
+                method, compressed = LZ4_METHOD_LZ4, candidate
+        output += LZ4_HEADER.pack(LZ4_MAGIC, method | LZ4_LEVEL, len(compressed), len(block), _lz4_checksum(block))
+        output += compressed
+    output += LZ4_HEADER.pack(LZ4_MAGIC, LZ4_METHOD_RAW | LZ4_LEVEL, 0, 0, 0)
+    return bytes(output)
+
+def _lz4_checksum(block: bytes) -> int:
+    # lz4-java masks the xxhash32 of the original block to 28 bits.
+    value = xxhash.xxh32_intdigest(block, LZ4_SEED) if xxhash is not None else xxhash32(block, LZ4_SEED)
+    value &= 0x0FFFFFFF
+    return value - (1 << 32) if value >= 1 << 31 else value
+
+def _lz4_decompress_block(block, output: bytearray):
+    # Pure Python LZ4 block decoder (sequences of literals followed by a match copy).
+    # Blocks are independent, so a match may only reach back to the start of this block's output.
+    block_start = len(output)
+    position = 0
+    end = len(block)
+    while position < end:
+        token = block[position]
+        position += 1
+        literal_length = token >> 4
+        if literal_length == 15:
+            while True:
+                extra = block[position]
+                position += 1
+                literal_length += extra
+                if extra != 255:
+                    break
+        output += block[position:position + literal_length]
+        position += literal_length
+        if position >= end:
+            break # the last sequence has only literals
+        if position + 2 > end:
+            raise ValueError('Corrupt LZ4 block')
+        offset = block[position] | block[position + 1] << 8
+        position += 2
+        if offset == 0 or offset > len(output) - block_start:
+            raise ValueError('Corrupt LZ4 block')
+        match_length = token & 0x0F
+        if match_length == 15:
+            while True:
+                extra = block[position]
+                position += 1
+                match_length += extra
+                if extra != 255:
+                    break
+        match_length += 4
+        start = len(output) - offset
+        if offset >= match_length:
+            output += output[start:start + match_length]
+        else:
+            # Overlapping match, the copied bytes repeat with period offset
+            pattern = output[start:]
+            output += (pattern * (match_length // offset + 1))[:match_length]
+
+_PRIME1 = 0x9E3779B1
+_PRIME2 = 0x85EBCA77
+_PRIME3 = 0xC2B2AE3D
+_PRIME4 = 0x27D4EB2F
+_PRIME5 = 0x165667B1
+_MASK = 0xFFFFFFFF
+
+def _round(accumulator: int, lane: int) -> int:
+    accumulator = (accumulator + lane * _PRIME2) & _MASK
+    accumulator = (accumulator << 13 | accumulator >> 19) & _MASK
+    return accumulator * _PRIME1 & _MASK
+
+def xxhash32(data: bytes, seed: int = 0) -> int:
+    # Pure Python XXH32, used when the xxhash package is not installed.
+    length = len(data)
+    position = 0
+    if length >= 16:
+        v1 = (seed + _PRIME1 + _PRIME2) & _MASK
+        v2 = (seed + _PRIME2) & _MASK
+        v3 = seed
+        v4 = (seed - _PRIME1) & _MASK
+        lanes = struct.unpack_from(f'<{length // 16 * 4}I', data)
+        for index in range(0, len(lanes), 4):
+            v1 = _round(v1, lanes[index])
+            v2 = _round(v2, lanes[index + 1])
+            v3 = _round(v3, lanes[index + 2])
+            v4 = _round(v4, lanes[index + 3])
+        position = len(lanes) * 4
+        value = ((v1 << 1 | v1 >> 31) + (v2 << 7 | v2 >> 25) + (v3 << 12 | v3 >> 20) + (v4 << 18 | v4 >> 14)) & _MASK
+    else:
+        value = (seed + _PRIME5) & _MASK
+    value = (value + length) & _MASK
+    while position + 4 <= length:
+        value = (value + int.from_bytes(data[position:position + 4], 'little') * _PRIME3) & _MASK
+        value = (value << 17 | value >> 15) * _PRIME4 & _MASK
+        position += 4
+    while position < length:
+        value = (value + data[position] * _PRIME5) & _MASK
+        value = (value << 11 | value >> 21) * _PRIME1 & _MASK
+        position += 1
+    value ^= value >> 15
+    value = value * _PRIME2 & _MASK
+    value ^= value >> 13
+    value = value * _PRIME3 & _MASK
+    value ^= value >> 16
+    return value
@@ -0,0 +1,291 @@
+from array import array
+from collections import OrderedDict
+import io
+import mmap
+import os
+import sys
+import threading
+import time
+
+import nbtlib
+
+from core import WORLD_PATH
+from core.tracing import tracer
+from core.level.compression import COMPRESSION_ZLIB, compress, decompress
+from core.level.level import Chunk
+
+SECTOR_SIZE = 0x1000
+HEADER_SIZE = 2 * SECTOR_SIZE
+# The sector count of a location entry is one byte, larger chunks are stored in c.<x>.<z>.mcc next to the region file.
+MAX_CHUNK_SECTORS = 0xFF
+EXTERNAL_FLAG = 0x80
+
+def region_path(region_x: int, region_z: int, world_path: str = WORLD_PATH) -> str:
+    return f'{world_path}/region/r.{region_x}.{region_z}.mca'
+
+def external_path(chunk_x: int, chunk_z: int, world_path: str = WORLD_PATH) -> str:
+    return f'{world_path}/region/c.{chunk_x}.{chunk_z}.mcc'
+
+def _read_table(data) -> array:
+    # A header table is 1024 big-endian 32-bit integers.
+    table = array('I', bytes(data))
+    if sys.byteorder == 'little':
+        table.byteswap()
+    return table
+
+class RegionFile:
+    '''
+    Lazy reader for one Anvil region file (r.<x>.<z>.mca, 32x32 chunks).
+    The file is memory-mapped and only the 8KiB header is parsed up front into a location/timestamp index;
+    a chunk is sliced, decompressed and parsed only when it is requested with read().
+    Writes go through positioned writes of the chunk's sectors and its two header entries only,
+    with free sectors tracked in a per-sector usage map built from the header.
+    '''
+    def __init__(self, region_x: int, region_z: int, world_path: str = WORLD_PATH, compression: int = COMPRESSION_ZLIB):
+        self.region_x = region_x
+        self.region_z = region_z
+        self.world_path = world_path
+        self.path = region_path(region_x, region_z, world_path)
+        self.compression = compression # compression type used for writing
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._locations: array = None # (sector offset << 8) | sector count, per chunk index
+        self._timestamps: array = None # last modification time (epoch seconds), per chunk index
+        self._used: bytearray = None # 1 for every sector in use (both header sectors included)
+        self._opened = False
+        self._writable = False
+
+    @staticmethod
+    def index(chunk_x: int, chunk_z: int) -> int:
+        # Chunk coordinates may be absolute or region-local, only the low 5 bits are used.
+        return (chunk_x & 31) + (chunk_z & 31) * 32
+
+    def _open(self):
+        # Maps the file and parses the header on first use. A missing or truncated file reads as an empty region.
+        if self._opened:
+            return
+        self._opened = True
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER_SIZE:
+            return
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._locations = _read_table(self._map[:SECTOR_SIZE])
+        self._timestamps = _read_table(self._map[SECTOR_SIZE:HEADER_SIZE])
+
+    def _open_for_write(self):
+        # Reopens the file read-write, creating it with an empty header if it does not exist yet.
+        self._open()
+        if self._writable:
+            return
+        if self._map is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'wb') as file:
+                file.write(bytes(HEADER_SIZE))
+            self._locations = array('I', bytes(SECTOR_SIZE))
+            self._timestamps = array('I', bytes(SECTOR_SIZE))
+        else:
+            self._map.close()
+            self._file.close()
+        self._file = open(self.path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._writable = True
+        self._used = self._sector_usage()
+
+    def _sector_usage(self) -> bytearray:
+        # Sectors past the end of the file are free, so the map only covers the current file size.
+        used = bytearray(-(-len(self._map) // SECTOR_SIZE))
+        used[0:2] = b'\x01\x01'
+        for location in self._locations:
+            sector_offset, sector_count = location >> 8, location & 0xFF
+            if sector_offset >= 2 and sector_count:
+                end = sector_offset + sector_count
+                if end > len(used):
+                    used.extend(bytes(end - len(used)))
+                used[sector_offset:end] = b'\x01' * sector_count
+        return used
+
+    def _allocate(self, sector_count: int) -> int:
+        # Returns the first sector of a free run of sector_count sectors, appending to the file without a large enough run.
+        # The chunk's previous sectors are still in use here, so a crash before the header is updated leaves the old copy intact.
+        run = bytes(sector_count)
+        sector_offset = self._used.find(run, 2)
+        if sector_offset == -1:
+            # A free run at the end of the file can be extended instead of leaving it unused.
+            sector_offset = len(self._used.rstrip(b'\x00'))
+            self._used.extend(bytes(max(0, sector_offset + sector_count - len(self._used))))
+        self._used[sector_offset:sector_offset + sector_count] = b'\x01' * sector_count
+        return sector_offset
+
+    def has_chunk(self, chunk_x: int, chunk_z: int) -> bool:
+        with self._lock:
+            self._open()
+            return self._locations is not None and self._locations[self.index(chunk_x, chunk_z)] != 0
+
+    def timestamp(self, chunk_x: int, chunk_z: int) -> int:
+        with self._lock:
+            self._open()
+            return 0 if self._timestamps is None else self._timestamps[self.index(chunk_x, chunk_z)]
+
+    def read_payload(self, chunk_x: int, chunk_z: int) -> tuple[int, bytes] | None:
+        # Returns (compression type, compressed payload) of a chunk, or None if the chunk has not been generated.
+        with self._lock:
+            self._open()
+            if self._locations is None:
+                return None
+            location = self._locations[self.index(chunk_x, chunk_z)]
+            sector_offset, sector_count = location >> 8, location & 0xFF
+            if sector_offset == 0 or sector_count == 0:
+                return None
+            start = sector_offset * SECTOR_SIZE
+            if start + 5 > len(self._map):
+                return None
+            length = int.from_bytes(self._map[start:start + 4], 'big')
+            compression_type = self._map[start + 4]
+            if compression_type & EXTERNAL_FLAG:
+                # The chunk is too large for the region file, the payload is the whole .mcc file.
+                base_x, base_z = self.region_x * 32, self.region_z * 32
+                mcc_path = external_path(base_x + (chunk_x & 31), base_z + (chunk_z & 31), self.world_path)
+                if not os.path.exists(mcc_path):
+                    return None
+                with open(mcc_path, 'rb') as file:
+                    return compression_type & ~EXTERNAL_FLAG, file.read()
+            # The length includes the compression type byte.
+            return compression_type, self._map[start + 5:start + 4 + length]
+
+    def read(self, chunk_x: int, chunk_z: int) -> Chunk:
+        # Decodes a single chunk. Chunks that have not been generated are returned without chunk data.
+        base_x, base_z = self.region_x * 32, self.region_z * 32
+        chunk = Chunk(base_x + (chunk_x & 31), base_z + (chunk_z & 31))
+        with tracer.span('chunk_load', 'level', x=chunk.x, z=chunk.z):
+            payload = self.read_payload(chunk_x, chunk_z)
+            if payload is None:
+                return chunk
+            stream, size = decompress(*payload)
+            chunk.chunk_data = None if size == 1 else nbtlib.File.parse(stream)
+        return chunk
+
+    def write_payload(self, chunk_x: int, chunk_z: int, compression_type: int, payload: bytes, timestamp: int = None):
+        # Stores an already compressed chunk, writing only its sectors and its location and timestamp entries.
+        index = self.index(chunk_x, chunk_z)
+        if timestamp is None:
+            timestamp = int(time.time())
+        base_x, base_z = self.region_x * 32, self.region_z * 32
+        mcc_path = external_path(base_x + (chunk_x & 31), base_z + (chunk_z & 31), self.world_path)
+        with self._lock:
+            self._open_for_write()
+            data = (len(payload) + 1).to_bytes(4, 'big') + bytes((compression_type,)) + payload
+            external = len(data) > MAX_CHUNK_SECTORS * SECTOR_SIZE
+            if external:
+                # The .mcc file is replaced atomically, a crash never leaves a partially written one behind.
+                with open(mcc_path + '.tmp', 'wb') as file:
+                    file.write(payload)
+                os.replace(mcc_path + '.tmp', mcc_path)
+                data = (1).to_bytes(4, 'big') + bytes((compression_type | EXTERNAL_FLAG,))
+            # Chunks are padded to whole sectors so that the file size stays a multiple of the sector size.
+            data += bytes(-len(data) % SECTOR_SIZE)
+            sector_count = len(data) // SECTOR_SIZE
+            old_location = self._locations[index]
+            sector_offset = self._allocate(sector_count)
+
+            fileno = self._file.fileno()
+            os.pwrite(fileno, data, sector_offset * SECTOR_SIZE)
+            self._locations[index] = sector_offset << 8 | sector_count
+            self._timestamps[index] = timestamp
+            os.pwrite(fileno, self._locations[index].to_bytes(4, 'big'), index * 4)
+            os.pwrite(fileno, timestamp.to_bytes(4, 'big'), SECTOR_SIZE + index * 4)
+            # The header points at the new copy, so the previous sectors (and .mcc file) can be released.
+            old_offset, old_count = old_location >> 8, old_location & 0xFF
+            if old_offset >= 2:
+                self._used[old_offset:old_offset + old_count] = bytes(old_count)
+            if not external and os.path.exists(mcc_path):
+                os.remove(mcc_path)
+            if (sector_offset + sector_count) * SECTOR_SIZE > len(self._map):
+                # The mapping has the file size from when it was made, remap so the appended sectors can be read.
+                self._map.close()
+                self._map = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+
+    def write(self, chunk: Chunk, timestamp: int = None):
+        # Encodes and stores a single chunk.
+        with tracer.span('chunk_save', 'level', x=chunk.x, z=chunk.z):
+            buffer = io.BytesIO()
+            chunk.chunk_data.write(buffer)
+            self.write_payload(chunk.x, chunk.z, self.compression, compress(self.compression, buffer.getvalue()), timestamp)
+        chunk.dirty = False
+
+    def save(self, chunks) -> int:
+        # Writes the chunks that were modified since they were loaded or last saved, returns how many were written.
+        saved = 0
+        for chunk in chunks:
+            if chunk.dirty and chunk.chunk_data is not None:
+                self.write(chunk)
+                saved += 1
+        return saved
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._file.close()
+            self._map = self._file = None
+            self._locations = self._timestamps = None
+            self._used = None
+            self._opened = False
+            self._writable = False
+
+class RegionCache:
+    '''
+    Keeps up to max_open region files open (least recently used are closed first),
+    so loading a chunk from an already opened region costs one decompress and one parse.
+    Chunks loaded through read_chunk stay in chunks until they are unloaded, so save_all can write the dirty ones.
+    '''
+    def __init__(self, world_path: str = WORLD_PATH, max_open: int = 64, compression: int = COMPRESSION_ZLIB):
+        self.world_path = world_path
+        self.max_open = max_open
+        self.compression = compression
+        self._lock = threading.Lock()
+        self._regions: OrderedDict[tuple[int, int], RegionFile] = OrderedDict()
+        self.chunks: dict[tuple[int, int], Chunk] = {} # loaded chunks by chunk position
+
+    def region(self, region_x: int, region_z: int) -> RegionFile:
+        key = (region_x, region_z)
+        with self._lock:
+            region_file = self._regions.get(key)
+            if region_file is not None:
+                self._regions.move_to_end(key)
+                return region_file
+            region_file = self._regions[key] = RegionFile(region_x, region_z, self.world_path, self.compression)
+            if len(self._regions) > self.max_open:
+                _, evicted = self._regions.popitem(last=False)
+                evicted.close()
+            return region_file
+
+    def read_chunk(self, chunk_x: int, chunk_z: int) -> Chunk:
+        chunk = self.chunks.get((chunk_x, chunk_z))
+        if chunk is None:
+            chunk = self.chunks[(chunk_x, chunk_z)] = self.region(chunk_x >> 5, chunk_z >> 5).read(chunk_x, chunk_z)
+        return chunk
+
+    def unload_chunk(self, chunk_x: int, chunk_z: int):
+        # Saves the chunk if it was modified and forgets it.
+        chunk = self.chunks.pop((chunk_x, chunk_z), None)
+        if chunk is not None:
+            self.save((chunk,))
+
+    def save(self, chunks) -> int:
+        # Writes the dirty chunks to their region files, returns how many were written.
+        by_region: dict[tuple[int, int], list[Chunk]] = {}
+        for chunk in chunks:
+            if chunk.dirty:
+                by_region.setdefault((chunk.x >> 5, chunk.z >> 5), []).append(chunk)
+        return sum(self.region(*key).save(region_chunks) for key, region_chunks in by_region.items())
+
+    def save_all(self) -> int:
+        # Writes the dirty chunks among the loaded ones.
+        return self.save(list(self.chunks.values()))
+
+    def close(self):
+        with self._lock:
+            for region_file in self._regions.values():
+                region_file.close()
+            self._regions.clear()
@@ -1,66 +1,111 @@
+import atexit
 import logging
-import threading
+import logging.handlers
+import queue
 import os
 
-class Logger(logging.Logger):
+class _ThreadFormatter(logging.Formatter):
+    # メッセージの前にスレッド名を付ける (log_thread=Falseで出力したレコードは除く)
+    def format(self, record):
+        record.thread_prefix = f'[{record.threadName}] ' if getattr(record, 'log_thread', True) else ''
+        return super().format(record)
+
+class _LogFileHandler(logging.FileHandler):
+    # 最初のレコードを書き込む時にディレクトリとファイルを作成する (ログを出力しなければ何も作らない)
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
 
-    def __init__(self):
-        # ログ保存先ディレクトリを作成（既に存在していてもOK）
-        os.makedirs('resources/logs', exist_ok=True)
+def _log_file_path(log_dir: str) -> str:
+    # log.log, log1.log, log2.log... のうち存在しない最初のパス
+    full_path = os.path.join(log_dir, 'log.log')
+    logger_count = 1
+    while os.path.exists(full_path):
+        full_path = os.path.join(log_dir, f'log{logger_count}.log')
+        logger_count += 1
+    return full_path
 
+class Logger(logging.Logger):
+    '''
+    コンソールとファイルへ出力するlogger。
+    呼び出し元のスレッドはレコードをキューへ積むだけで、フォーマット後の書き込みはQueueListenerのスレッドで行う
+    (ネットワークのスレッドがログのI/Oで止まらないようにするため)。
+    メッセージは logger.debug('Incoming packet: %s', packet) のように引数を渡すと、
+    そのレベルのログが無効な場合はフォーマットされない。
+    '''
+    def __init__(self, log_dir: str = 'resources/logs'):
         # 名前付きloggerを取得（または新規作成）
         self.logger = logging.getLogger('file_and_console')
-        self.logger.setLevel(logging.DEBUG)  # ログレベルをDEBUGに設定
+        self.logger.setLevel(logging.DEBUG)  # ログレベル (set_levelで変更)
 
         # コンソール出力用のハンドラを作成
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
+        self._console_handler = console_handler
 
-        # ファイル出力用のハンドラを作成
-        log_path = 'resources/logs/'
-        log_name = 'log'
-        full_path = log_path + log_name + '.log'
-        if os.path.exists(full_path):
-            logger_count = 1
-            full_path = log_path + log_name + f'{logger_count}.log'
-            while os.path.exists(full_path):
-                full_path = log_path + log_name + f'{logger_count}.log'
-                logger_count += 1
-        file_handler = logging.FileHandler(full_path, mode='w')
+        # ファイル出力用のハンドラを作成 (ファイルは最初の書き込み時に開く)
+        file_handler = _LogFileHandler(_log_file_path(log_dir), mode='w', delay=True)
         file_handler.setLevel(logging.DEBUG)
+        self._file_handler = file_handler
 
-        # ログのフォーマットを定義
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        # ログのフォーマットを定義 (スレッド名はレコードを作った時点のものを使う)
+        formatter = _ThreadFormatter('%(asctime)s - %(levelname)s - %(thread_prefix)s%(message)s')
         console_handler.setFormatter(formatter)
         file_handler.setFormatter(formatter)
 
-        # コンソールとファイルの両方にハンドラを追加
-        self.logger.addHandler(console_handler)
-        self.logger.addHandler(file_handler)
+        # コンソールとファイルへの書き込みはバックグラウンドのスレッドで行う
+        log_queue = queue.SimpleQueue()
+        self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        self._listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+        self._listener.start()
+        # 終了時にキューに残ったログを書き出す
+        atexit.register(self._listener.stop)
+
+    def set_log_dir(self, log_dir: str):
+        # ログファイルの保存先を変更する (以降のレコードは新しいファイルへ書き込む)
+        handler = self._file_handler
+        handler.acquire()
+        try:
+            if handler.stream is not None:
+                handler.stream.close()
+                handler.stream = None
+            handler.baseFilename = os.path.abspath(_log_file_path(log_dir))
+        finally:
+            handler.release()
+
+    def set_level(self, level: str | int, file_level: str | int = logging.DEBUG):
+        # コンソールとファイルへ出力するログレベルを変更する ('DEBUG'、'INFO'など)
+        # どちらにも出力しないレベルのログはレコードを作らない (引数もフォーマットされない)
+        self._console_handler.setLevel(level.upper() if isinstance(level, str) else level)
+        self._file_handler.setLevel(file_level.upper() if isinstance(file_level, str) else file_level)
+        self.logger.setLevel(min(self._console_handler.level, self._file_handler.level))
+
+    def is_enabled_for(self, level: int) -> bool:
+        # ログメッセージの組み立て自体が重い場合に、事前にレベルを確認する
+        return self.logger.isEnabledFor(level)
 
-    def info(self, msg, log_thread=True):
-        # スレッド名を付けて info ログを出力（オプションで付加）
-        self.logger.info(f'{"[" + threading.current_thread().name + "] " if log_thread else ""}{msg}')
+    def info(self, msg, *args, log_thread=True):
+        # info ログを出力（スレッド名の付加はオプション）
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(msg, *args, extra={'log_thread': log_thread})
 
-    def debug(self, msg):
-        # スレッド名付きの debug ログを出力
-        self.logger.debug(f'[{threading.current_thread().name}] {msg}')
+    def debug(self, msg, *args):
+        # debug ログを出力 (無効な場合は引数をフォーマットしない)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(msg, *args)
 
-    def error(self, msg):
-        # スレッド名付きの error ログを出力
-        self.logger.error(f'[{threading.current_thread().name}] {msg}')
+    def error(self, msg, *args):
+        self.logger.error(msg, *args)
 
-    def warning(self, msg):
-        # スレッド名付きの warning ログを出力
-        self.logger.warning(f'[{threading.current_thread().name}] {msg}')
+    def warning(self, msg, *args):
+        self.logger.warning(msg, *args)
 
-    def critical(self, msg):
-        # スレッド名付きの critical ログを出力
-        self.logger.critical(f'[{threading.current_thread().name}] {msg}')
+    def critical(self, msg, *args):
+        self.logger.critical(msg, *args)
 
-    def exception(self, msg):
-        # スレッド名付きの例外ログ（スタックトレース付き）を出力
-        self.logger.exception(f'[{threading.current_thread().name}] {msg}')
+    def exception(self, msg, *args):
+        # 例外ログ（スタックトレース付き）を出力
+        self.logger.exception(msg, *args)
 
 # グローバルで使える logger インスタンスを作成
-logger = Logger()
\ No newline at end of file
+logger = Logger()
@@ -14,4 +14,5 @@ def start_server():
         pyncraft_server.start_loop()
     except KeyboardInterrupt:
         logger.info('Stopping Pyncraft server...')
+        pyncraft_server.stop_loop()
         networking.stop_server()
\ No newline at end of file
@@ -4,15 +4,25 @@ import time
 import threading
 import configparser
 
+from core import WORLD_PATH
+from core.level import RegionCache, compression_type
 from core.logger import logger
+from core.registry import DataPackRegistry, REGISTRY_DATA_PATH
+from core.tick import TickScheduler
+from core.tracing import tracer
 
 from networking.enum import JEPacketConnectionState
 import networking.mcpacket.clientbound.configuration as configuration
 import networking.mcpacket.clientbound.play as play
 from networking.connection import Connection
+from networking.mcpacket.io import PreEncodedPacket
+from networking.metrics import metrics
 from networking import get_listener
 
 class PyncraftServer:
+    # クライアントへ通知するサーバーのデータパック (namespace, id, version)
+    KNOWN_PACKS = [['minecraft', 'core', '1.21.8']]
+
     def __init__(self):
         # クライアント接続
         self._processor = None
@@ -21,42 +31,164 @@ class PyncraftServer:
         # Server config
         self.server_config = PyncraftConfig()
         self.server_config.load_config()
+        logger.set_level(self.server_config.get('pyncraft', 'log_level'), self.server_config.get('pyncraft', 'log_file_level'))
         # Live server information
         self.online_players = 0
+        # 全クライアント共通のコンフィグパケット (エンコード済み)
+        self.registry_packets: list[PreEncodedPacket] = []
+        self.region_cache: RegionCache = None
+        # 変更されたチャンクを保存する間隔 (秒, 0で無効)
+        self.autosave_interval = float(self.server_config.get('pyncraft', 'autosave_interval'))
+        self._next_autosave = time.monotonic() + self.autosave_interval
+        # コンフィグ設定中のクライアントの返信を待つ時間 (秒)
+        self.configuration_timeout = float(self.server_config.get('pyncraft', 'configuration_timeout'))
+        # ティック処理
+        self.scheduler = TickScheduler(
+            float(self.server_config.get('pyncraft', 'tps')),
+            int(self.server_config.get('pyncraft', 'max_tick_backlog')),
+        )
+        self.scheduler.add_handler('network_in', self.process_incoming)
+        self.scheduler.add_handler('network_out', self.process_outgoing)
+        if self.autosave_interval > 0:
+            self.scheduler.add_handler('world', self.autosave)
 
     def init(self):
         self._processor = get_listener()._connection_processor
+        # ティックの所要時間をメトリクスとして公開する
+        get_listener().metrics_sources['tick'] = self.scheduler.stats
+        # ティックのトレース (Chromeのtrace event形式で書き出す)
+        self.trace_path = self.server_config.get('pyncraft', 'trace_path')
+        tracer.configure(
+            self.server_config.get('pyncraft', 'trace_enabled').lower() == 'true',
+            int(self.server_config.get('pyncraft', 'trace_sample_every')),
+            float(self.server_config.get('pyncraft', 'trace_budget_ms')),
+            int(self.server_config.get('pyncraft', 'trace_max_events')),
+        )
+        # レジストリデータは全クライアントで同じバイト列になるので一度だけエンコードして共有する
+        # ワールドのリージョンファイル (チャンクの保存に使う圧縮形式は設定で選ぶ)
+        self.region_cache = RegionCache(WORLD_PATH, compression=compression_type(self.server_config.get('pyncraft', 'region_compression')))
+        registry = DataPackRegistry(os.path.join(REGISTRY_DATA_PATH, 'core'), 'minecraft')
+        registry.register_all()
+        self.registry_packets = [PreEncodedPacket(configuration.CRegistryData(registry_id, entries)) for registry_id, entries in registry.registry_data.items()]
 
     def start_loop(self):
-        while True:
-            # サーバーに接続するすべてのクライアントを取得
-            all_connections = self._processor.all_connections()
-            # 接続したクライアントがコンフィグ状態ならサーバーコンフィグを設定
-            config_connections = [c for c in all_connections if c.con_state.get_state() == JEPacketConnectionState.CONFIGURATION]
-            self.configurations(config_connections)
-            # 接続したクライアントがPLAY状態なら最後のtickで更新されたサーバー状態のパケットを送信
-            play_connections = [c for c in all_connections if c.con_state.get_state() == JEPacketConnectionState.PLAY]
-            self.send_server_updates(play_connections)
-            # ここでサーバーtick処理
-            time.sleep(0.2)
-
-    def configurations(self, connections: list[Connection]):
+        # stop_loopが呼ばれるまでティックを実行する
+        self.scheduler.run()
+
+    def stop_loop(self):
+        self.scheduler.stop()
+        if self.region_cache is not None:
+            self.save_chunks()
+            self.region_cache.close()
+        if tracer.enabled:
+            count = tracer.dump(self.trace_path)
+            logger.info(f'Wrote {count} trace events to {self.trace_path}')
+
+    def process_incoming(self):
+        # ネットワークスレッドで受信したPLAY状態のパケットをパケットの種類ごとにまとめて処理
+        for packet_class, batch in self._processor.inbound_packets.drain().items():
+            start = time.perf_counter_ns() if metrics.enabled else 0
+            try:
+                with tracer.span(packet_class.__name__, 'handle', count=len(batch)):
+                    packet_class.handle_batch(batch)
+            except Exception as e:
+                logger.exception(f'Error handling {len(batch)} {packet_class.__name__} packets: {e}')
+            # まとめて処理したパケットは1パケットあたりの平均を記録する
+            if start:
+                metrics.observe('handle', packet_class._state, packet_class._packet_id, (time.perf_counter_ns() - start) // len(batch), len(batch))
+        # 接続したクライアントがコンフィグ状態ならサーバーコンフィグを設定
+        config_connections = self._processor.connections_in(JEPacketConnectionState.CONFIGURATION)
+        self.configurations(config_connections)
+
+    def autosave(self):
+        # autosave_intervalごとに読み込み済みのチャンクのうち変更されたものだけを書き込む
+        now = time.monotonic()
+        if self.region_cache is None or now < self._next_autosave:
+            return
+        self._next_autosave = now + self.autosave_interval
+        self.save_chunks()
+
+    def save_chunks(self):
+        with tracer.span('autosave', 'level'):
+            saved = self.region_cache.save_all()
+        if saved:
+            logger.info(f'Saved {saved} chunks')
+
+    def process_outgoing(self):
+        # 接続したクライアントがPLAY状態なら最後のtickで更新されたサーバー状態のパケットを送信
+        play_connections = self._processor.connections_in(JEPacketConnectionState.PLAY)
+        self.send_server_updates(play_connections)
+        # 回線の状態の記録とkeep-alive
+        now = time.monotonic()
+        for con in play_connections:
+            con.update_link(now)
+
+    def configurations(self, connections: tuple[Connection, ...]):
         for con in connections:
             con_state = con.con_state
-            client_infos = con_state.configs()
-            if client_infos is None:
-                continue
-            client_info, plugin_message = client_infos
-            # ここでコンフィグ設定
-            # クライアントへPLAY状態へ移行するためのパケットを送信
-            if con.queue_packet(configuration.CFinishConfiguration(), 1) is None:
-                logger.error(f'Failed to send CFinishConfiguration to {con._address}')
+            # コンフィグ設定を開始済み、またはクライアント情報が揃っていない接続は飛ばす
+            if con_state.configuration is not None or con_state.configs() is None:
                 continue
-            logger.info(f'Configuration setup for {con._address} completed. Switching to PLAY')
+            # ここでコンフィグ設定 (以降は返信が届くたびにネットワークスレッドで進む)
+            con_state.configuration = ConfigurationSession(self, con)
+            con_state.configuration.start()
     
-    def send_server_updates(self, connections: list[Connection]):
-        for con in connections:
-            con.queue_packet(play.CDisconnect('ユーザー認証、通信暗号化、コンフィグ設定が完了しました'))
+    def send_server_updates(self, connections: tuple[Connection, ...]):
+        # 全員に同じパケットを送る場合は一度だけエンコードして共有する
+        self._processor.broadcast(play.CDisconnect('ユーザー認証、通信暗号化、コンフィグ設定が完了しました'), connections)
+
+class ConfigurationSession:
+    '''
+    1接続分のコンフィグ設定を進めるステートマシン。
+    パケットを送信したら返信のFutureにコールバックを登録するだけなので、ティックのスレッドはブロックしない。
+    KNOWN_PACKS -(SKnownPacks)-> FINISHING -(SFinishConfigurationAcknowledged)-> DONE
+    '''
+    KNOWN_PACKS = 'known_packs'
+    FINISHING = 'finishing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, server: PyncraftServer, connection: Connection):
+        self._server = server
+        self._connection = connection
+        self._timeout = server.configuration_timeout
+        self.stage = None
+        self.known_packs = None # クライアントが持っているデータパック
+
+    def start(self):
+        # サーバーのデータパックを通知してクライアントの返信を待つ
+        self.stage = self.KNOWN_PACKS
+        future = self._connection.request(configuration.CKnownPacks(self._server.KNOWN_PACKS), self._timeout)
+        future.add_done_callback(self._on_known_packs)
+
+    def _on_known_packs(self, future):
+        if not self._succeeded(future):
+            return
+        self.known_packs = future.result().packs
+        # レジストリを送信してからPLAY状態へ移行するためのパケットを送信
+        for packet in self._server.registry_packets:
+            self._connection.queue_packet(packet)
+        self.stage = self.FINISHING
+        future = self._connection.request(configuration.CFinishConfiguration(), self._timeout)
+        future.add_done_callback(self._on_finished)
+
+    def _on_finished(self, future):
+        if not self._succeeded(future):
+            return
+        self.stage = self.DONE
+        logger.info(f'Configuration setup for {self._connection._address} completed. Switching to PLAY')
+
+    def _succeeded(self, future) -> bool:
+        # 返信が届いたかどうか (切断された場合はキャンセル、タイムアウトした場合は切断して接続を閉じる)
+        if future.cancelled():
+            self.stage = self.FAILED
+            return False
+        if future.exception() is not None:
+            logger.error(f'Configuration of {self._connection._address} failed at {self.stage}: {future.exception()}')
+            self.stage = self.FAILED
+            self._connection.disconnect(configuration.CDisconnect('Configuration timed out'))
+            return False
+        return True
 
 class PyncraftConfig:
     def __init__(self, config_name='server.ini'):
@@ -67,6 +199,39 @@ class PyncraftConfig:
             'motd': 'Pyncraft Server',
             'server_port': 25565,
             'server_ip': '',
+            'network_engine': 'select',
+            'online_mode': 'true',
+            'write_high_water_mark': 4 * 1024 * 1024,
+            'slow_consumer_policy': 'pause',
+            'write_backlog_factor': 4,
+            'session_server': 'https://sessionserver.mojang.com',
+            'auth_workers': 8,
+            'auth_timeout': 10,
+            'tps': 20,
+            'max_tick_backlog': 20,
+            'configuration_timeout': 10,
+            'compression_threshold': 256,
+            'compression_level': 6,
+            'compression_offload_size': 64 * 1024,
+            'compression_workers': 2,
+            'adaptive_compression': 'true',
+            'compression_threshold_max': 1048576,
+            'compression_level_min': 1,
+            'compression_level_max': 9,
+            'keep_alive_interval': 15,
+            'keep_alive_timeout': 30,
+            'log_level': 'INFO',
+            'log_file_level': 'DEBUG',
+            'metrics_enabled': 'false',
+            'metrics_port': 0,
+            'capture_path': '',
+            'trace_enabled': 'false',
+            'trace_sample_every': 100,
+            'trace_budget_ms': 50,
+            'trace_path': 'resources/trace.json',
+            'trace_max_events': 200000,
+            'region_compression': 'zlib',
+            'autosave_interval': 300,
         }
 
     def load_config(self):
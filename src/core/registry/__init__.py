@@ -8,6 +8,9 @@ from core.logger import logger
 
 block_state_ids = {}
 
+# Directory of the bundled registry data, resolved from this package so it does not depend on the working directory
+REGISTRY_DATA_PATH = os.path.join(os.path.dirname(__file__), 'data')
+
 def register_block_states():
     '''
 	Registers block states from a JSON file to the block_state_ids dictionary.
@@ -59,7 +62,7 @@ class DataPackRegistry:
                     else:
                         raise ValueError(f'Unsupported type: {type(value)}')
                 self.registry_data[registry_id] = {self._registry_name + ':' + k: _parse_json(v) for k, v in data.items()}
-                logger.debug(f'self.registry_data[{registry_id}] = {self.registry_data[registry_id]}')
+                logger.debug('self.registry_data[%s] = %s', registry_id, self.registry_data[registry_id])
                 logger.info(f'Registered {len(self.registry_data[registry_id])} entries in {registry_id}')
 
 
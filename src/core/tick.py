@@ -0,0 +1,146 @@
+from collections import deque
+import bisect
+import threading
+import time
+from typing import Callable
+
+from core.logger import logger
+from core.tracing import tracer
+
+class TickHistogram:
+    '''
+    直近のティックの所要時間(ms)を保持するローリングウィンドウ。
+    記録はティックスレッドから、集計は任意のスレッドから行える。
+    '''
+    # histogram()のデフォルトのバケット境界 (ms)
+    BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+    def __init__(self, window: int = 1200):
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, milliseconds: float):
+        with self._lock:
+            self._samples.append(milliseconds)
+
+    def samples(self) -> list[float]:
+        with self._lock:
+            return list(self._samples)
+
+    def histogram(self, buckets: tuple = BUCKETS) -> dict:
+        # 各バケットの上限(ms) -> 件数 (上限を超えたものは'inf'へ)
+        counts = [0] * (len(buckets) + 1)
+        for sample in self.samples():
+            counts[bisect.bisect_left(buckets, sample)] += 1
+        return dict(zip((*buckets, float('inf')), counts))
+
+    def summary(self) -> dict:
+        # 平均、パーセンタイル、最大値 (ms)
+        samples = sorted(self.samples())
+        if not samples:
+            return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+        return {
+            'count': len(samples),
+            'mean': sum(samples) / len(samples),
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99),
+            'max': samples[-1],
+        }
+
+class TickScheduler:
+    '''
+    固定レート(デフォルト20TPS)でティックを実行するスケジューラ。
+    次のティックの時刻はmonotonicな時計から決め、処理時間に関わらずレートがずれないようにする。
+    遅れたティックは続けて実行して取り戻すが、max_backlogを超えて遅れた分は切り捨てる。
+    各ティックはPHASESの順にフェーズへ分かれ、ティックとフェーズごとの所要時間を記録する (トレースが有効なら区間も記録する)。
+    '''
+    PHASES = ('network_in', 'world', 'entities', 'network_out')
+
+    def __init__(self, tps: float = 20, max_backlog: int = 20, window: int = 1200):
+        self.tps = tps
+        self.tick_interval = 1 / tps
+        self.max_backlog = max_backlog
+        self.tick_count = 0
+        self.skipped_ticks = 0
+        self._handlers: dict[str, list[Callable]] = {phase: [] for phase in self.PHASES}
+        self._stop_event = threading.Event()
+
+        # 所要時間の記録 (ms)
+        self.mspt = TickHistogram(window)
+        self.phase_times = {phase: TickHistogram(window) for phase in self.PHASES}
+        # 実際のTPSを計算するためのティック開始時刻
+        self._tick_starts: deque[float] = deque(maxlen=int(tps) + 1)
+
+    def add_handler(self, phase: str, handler: Callable):
+        # フェーズで呼び出す処理を登録する (登録順に呼ばれる)
+        if phase not in self._handlers:
+            raise ValueError(f'Unknown tick phase: {phase}')
+        self._handlers[phase].append(handler)
+
+    def phase(self, phase: str):
+        # add_handlerのデコレータ版
+        def wrapper(handler):
+            self.add_handler(phase, handler)
+            return handler
+        return wrapper
+
+    def tick(self):
+        # 1ティック分の処理を実行する
+        clock = time.perf_counter
+        tick_start = clock()
+        self._tick_starts.append(time.monotonic())
+        tracer.begin_tick(self.tick_count)
+        for phase in self.PHASES:
+            phase_start = clock()
+            with tracer.span(phase, 'tick'):
+                for handler in self._handlers[phase]:
+                    try:
+                        handler()
+                    except Exception as e:
+                        logger.exception(f'Error in tick phase {phase}: {e}')
+            self.phase_times[phase].record((clock() - phase_start) * 1000)
+        tracer.end_tick()
+        self.mspt.record((clock() - tick_start) * 1000)
+        self.tick_count += 1
+
+    def run(self):
+        # stopが呼ばれるまでティックを実行する (呼び出し元のスレッドをブロック)
+        self._stop_event.clear()
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now < next_tick:
+                self._stop_event.wait(next_tick - now)
+                continue
+            behind = int((now - next_tick) / self.tick_interval)
+            if behind > self.max_backlog:
+                # 取り戻せないほど遅れている場合は遅れを切り捨てる
+                skipped = behind - self.max_backlog
+                logger.warning(f"Can't keep up! Is the server overloaded? Running {(now - next_tick) * 1000:.0f}ms or {behind} ticks behind, skipping {skipped} ticks")
+                self.skipped_ticks += skipped
+                next_tick += skipped * self.tick_interval
+            self.tick()
+            next_tick += self.tick_interval
+
+    def stop(self):
+        self._stop_event.set()
+
+    def current_tps(self) -> float:
+        # 直近のティック間隔から計算した実際のTPS
+        starts = list(self._tick_starts)
+        if len(starts) < 2 or starts[-1] == starts[0]:
+            return 0.0
+        return (len(starts) - 1) / (starts[-1] - starts[0])
+
+    def stats(self) -> dict:
+        return {
+            'tps': self.current_tps(),
+            'target_tps': self.tps,
+            'tick_count': self.tick_count,
+            'skipped_ticks': self.skipped_ticks,
+            'mspt': self.mspt.summary(),
+            'phases': {phase: histogram.summary() for phase, histogram in self.phase_times.items()},
+        }
@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+from time import perf_counter_ns
+
+class _NullSpan:
+    # 記録しないときのspan (何もしない)
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ('_tracer', '_name', '_category', '_args', '_start')
+
+    def __init__(self, tracer: 'Tracer', name: str, category: str, args: dict):
+        self._tracer = tracer
+        self._name = name
+        self._category = category
+        self._args = args
+
+    def __enter__(self):
+        self._start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self._tracer._record(self._name, self._category, self._start, perf_counter_ns(), self._args)
+        return False
+
+class Tracer:
+    '''
+    ティック、パケット処理、送信、ワールドの読み込みの区間(span)を記録し、Chromeのtrace event形式 (Perfettoで表示できる) で書き出す。
+    記録するティックは sample_every ティックに1回、または budget_ms を超えたティック。
+    区間は一旦バッファに溜め、ティックの終わりに残すかどうかを決める。
+    ネットワークスレッドの区間は次のティックが始まるまで、直前のティックの区間として扱う。
+    無効な場合はspanが共有の何もしないオブジェクトを返すだけなので、計測箇所のコストはほぼ属性の参照1回。
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.recording = False # 現在のティックの区間を記録しているかどうか
+        self.sample_every = 0 # 0の場合はサンプリングしない
+        self.budget_ms = 0.0 # 0の場合は所要時間で選ばない
+        self.max_events = 200000
+        self.dropped = 0 # max_eventsを超えて捨てた区間の数
+        self._lock = threading.Lock()
+        self._events: list[dict] = []
+        self._pending: list[dict] = [] # 現在のティックの区間
+        self._threads: dict[int, str] = {} # スレッドID -> スレッド名
+        self._pid = os.getpid()
+        self._origin = perf_counter_ns()
+        self._tick = 0
+        self._tick_start = 0
+        self._keep = False # 現在のティックの区間を残すかどうか
+
+    def configure(self, enabled: bool, sample_every: int = 0, budget_ms: float = 0.0, max_events: int = 200000):
+        self.enabled = enabled and (sample_every > 0 or budget_ms > 0)
+        self.sample_every = sample_every
+        self.budget_ms = budget_ms
+        self.max_events = max_events
+        self.recording = False
+        self._keep = False
+
+    def span(self, name: str, category: str = 'pyncraft', **args):
+        # with文で区間を記録する (記録していない場合は何もしない)
+        if not self.recording:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def _record(self, name: str, category: str, start: int, end: int, args: dict):
+        thread_id = threading.get_ident()
+        if thread_id not in self._threads:
+            self._threads[thread_id] = threading.current_thread().name
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self._origin) / 1000, # マイクロ秒
+            'dur': (end - start) / 1000,
+            'pid': self._pid,
+            'tid': thread_id,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._pending.append(event)
+
+    def begin_tick(self, tick: int):
+        # ティックの開始 (TickSchedulerから呼ばれる) 前のティックから今までの区間は前のティックのものとして扱う
+        if not self.enabled:
+            return
+        self._commit()
+        self._tick = tick
+        self._tick_start = perf_counter_ns()
+        self._keep = False
+        # 所要時間で選ぶ場合は全てのティックを記録しておく
+        self.recording = self.budget_ms > 0 or tick % self.sample_every == 0
+
+    def end_tick(self):
+        # ティックの終了 記録したティックを残すかどうかを決める
+        # 次のティックの開始まではネットワークスレッドの区間を記録し続ける
+        if not self.recording:
+            return
+        end = perf_counter_ns()
+        duration_ms = (end - self._tick_start) / 1e6
+        sampled = self.sample_every > 0 and self._tick % self.sample_every == 0
+        over_budget = self.budget_ms > 0 and duration_ms > self.budget_ms
+        self._record('tick', 'tick', self._tick_start, end, {'tick': self._tick, 'over_budget': over_budget})
+        self._keep = sampled or over_budget
+        self._commit()
+
+    def _commit(self):
+        # 溜めた区間を残すティックであれば記録に移し、そうでなければ捨てる
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not (self._keep and pending):
+                return
+            room = max(self.max_events - len(self._events), 0)
+            if room < len(pending):
+                self.dropped += len(pending) - room
+                pending = pending[:room]
+            self._events.extend(pending)
+
+    def events(self) -> list[dict]:
+        # スレッド名のメタデータと記録した区間
+        with self._lock:
+            events = list(self._events)
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': thread_id, 'args': {'name': name}}
+            for thread_id, name in list(self._threads.items())
+        ]
+        return metadata + events
+
+    def clear(self):
+        with self._lock:
+            self._events = []
+            self._pending = []
+            self.dropped = 0
+
+    def dump(self, path: str) -> int:
+        # 記録した区間をChromeのtrace event形式のJSONで書き出し、区間の数を返す
+        self.recording = False
+        self._commit()
+        events = self.events()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+        return len(events) - len(self._threads)
+
+# プロセス全体で共有するトレーサー
+tracer = Tracer()
@@ -0,0 +1,6 @@
+import core # パケットクラスの登録
+
+from loadgen.client import BotClient, ServerDisconnect
+from loadgen.report import LoadReport
+from loadgen.scenarios import SCENARIOS, run, scenario
+from loadgen.session import StubSessionServer
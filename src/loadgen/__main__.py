@@ -0,0 +1,47 @@
+'''
+Headless load generator for a running pyncraft server.
+
+$ python -m loadgen status -n 1000 -c 100
+$ python -m loadgen login -n 200 --rate 50          # server.ini: online_mode = false
+$ python -m loadgen login -n 200 --stub-session 8765 # server.ini: session_server = http://127.0.0.1:8765
+$ python -m loadgen idle -n 500 --idle 60
+'''
+import argparse
+import json
+import sys
+
+from loadgen import SCENARIOS, StubSessionServer, run
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='pyncraft-loadgen', description='Open N concurrent bot connections against a pyncraft server and report connection rate and per-phase latency.')
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=25565)
+    parser.add_argument('-n', '--connections', type=int, default=100, help='number of bots to run')
+    parser.add_argument('-c', '--concurrency', type=int, default=0, help='bots running at the same time (default: all)')
+    parser.add_argument('--rate', type=float, default=0, help='new connections per second (default: as fast as possible)')
+    parser.add_argument('--idle', type=float, default=30, help='seconds to stay in PLAY for the idle scenario')
+    parser.add_argument('--timeout', type=float, default=10, help='socket timeout in seconds')
+    parser.add_argument('--name-prefix', default='bot')
+    parser.add_argument('--stub-session', type=int, metavar='PORT', help='serve a session server stub that accepts every player on this port')
+    parser.add_argument('--stub-delay', type=float, default=0, help='seconds the session server stub waits before answering')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args(argv)
+
+    session = None
+    if args.stub_session is not None:
+        session = StubSessionServer('127.0.0.1', args.stub_session, args.stub_delay)
+        session.start()
+    try:
+        report = run(
+            args.host, args.port, args.scenario, args.connections, args.concurrency or None, args.rate,
+            idle=args.idle, timeout=args.timeout, name_prefix=args.name_prefix,
+        )
+    finally:
+        if session is not None:
+            session.stop()
+    print(json.dumps(report.summary(), indent=2) if args.json else report.format())
+    return 1 if report.failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import os
+import socket
+import zlib
+
+from cryptography.hazmat.primitives.serialization import load_der_public_key
+
+from networking.mcpacket import codec
+from networking.mcpacket.io import FrameBuffer, JEPacketBuffer
+from networking.mcrypto import encrypt_rsa, gen_ciphers
+import networking.mcpacket.serverbound.login as login
+
+class ServerDisconnect(Exception):
+    # サーバーからDisconnectパケットで切断された
+    def __init__(self, phase: str, reason: str):
+        super().__init__(f'{phase}: {reason}')
+        self.phase = phase
+        self.reason = reason
+
+class BotClient:
+    '''
+    負荷試験用のクライアント接続 (1接続を1スレッドでブロッキングに扱う)。
+    サーバーと同じJEPacketBuffer、FrameBuffer、パケットクラスを使ってフレームの組み立てと解析を行い、
+    暗号化と圧縮プロトコルにも対応する。
+    '''
+    def __init__(self, host: str, port: int, timeout: float = 10):
+        self.host = host
+        self.port = port
+        self._socket = socket.create_connection((host, port), timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._frames = FrameBuffer()
+        self._encryptor = None
+        self._decryptor = None
+        self.compression_threshold = -1
+        self.phase = 'connect' # 実行中のフェーズ (失敗の集計用)
+
+    def settimeout(self, timeout: float):
+        self._socket.settimeout(timeout)
+
+    def send(self, packet):
+        # サーバー行きのパケットを送信する
+        body = JEPacketBuffer()
+        body.write_varint(packet._packet_id)
+        body.write(packet.to_bytes(None).get_value())
+        data = body.get_value()
+        if self.compression_threshold >= 0:
+            if len(data) >= self.compression_threshold:
+                data = codec.encode_varint(len(data)) + zlib.compress(data)
+            else:
+                data = b'\x00' + data
+        frame = codec.encode_varint(len(data)) + data
+        self._socket.sendall(self._encryptor.update(frame) if self._encryptor else frame)
+
+    def receive(self) -> tuple[int, JEPacketBuffer]:
+        # 次のパケットを受信し、(パケットID, 本体のバッファ) を返す
+        while (frame := self._frames.next_frame()) is None:
+            if not self._frames.recv_into(self._socket, self._decryptor):
+                raise ConnectionResetError('Connection closed by server')
+        data = bytes(frame)
+        if self.compression_threshold >= 0:
+            data_length, position = codec.decode_varint(data, 0)
+            data = zlib.decompress(data[position:]) if data_length else data[position:]
+        packet_buffer = JEPacketBuffer(data, read_only=True)
+        return packet_buffer.read_varint(), packet_buffer
+
+    def encrypt(self, encryption_request):
+        # EncryptionRequestの公開鍵で共通鍵を暗号化して送り、以降の通信を暗号化する
+        public_key = load_der_public_key(encryption_request._public_der)
+        shared_secret = os.urandom(16)
+        self.send(login.SEncryptionResponse(encrypt_rsa(shared_secret, public_key), encrypt_rsa(encryption_request._verify_token, public_key)))
+        self._encryptor, self._decryptor = gen_ciphers(shared_secret)
+
+    def close(self):
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def read_reason(packet_buffer: JEPacketBuffer) -> str:
+    # Disconnectパケットの理由 (NBTの文字列タグ、またはJSONのテキストコンポーネント) を取り出す
+    data = packet_buffer.remaining_bytes()
+    if data[:1] == b'\x08' and len(data) >= 3:
+        data = data[3:3 + int.from_bytes(data[1:3], 'big')]
+    return ''.join(char for char in data.decode('utf-8', 'replace') if char.isprintable()).strip()
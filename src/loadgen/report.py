@@ -0,0 +1,74 @@
+from collections import Counter
+import threading
+import time
+
+class LoadReport:
+    '''
+    負荷試験の結果の集計 (全ボットのスレッドから記録される)。
+    フェーズごとの所要時間、成功した接続数と接続レート、失敗の内訳 (サーバーからの切断理由や例外) を保持する。
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases: dict[str, list[float]] = {} # フェーズ -> 所要時間 (秒)
+        self.errors = Counter() # 失敗の内訳 -> 件数
+        self.succeeded = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, phase: str, seconds: float):
+        with self._lock:
+            self._phases.setdefault(phase, []).append(seconds)
+
+    def success(self):
+        with self._lock:
+            self.succeeded += 1
+
+    def failure(self, error: str):
+        with self._lock:
+            self.failed += 1
+            self.errors[error] += 1
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def summary(self) -> dict:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        with self._lock:
+            phases = {phase: _percentiles(samples) for phase, samples in self._phases.items()}
+            return {
+                'elapsed': elapsed,
+                'succeeded': self.succeeded,
+                'failed': self.failed,
+                # 1秒あたりに完了した接続数
+                'connection_rate': self.succeeded / elapsed if elapsed > 0 else 0.0,
+                'phases': phases,
+                'errors': dict(self.errors.most_common()),
+            }
+
+    def format(self) -> str:
+        summary = self.summary()
+        lines = [
+            f'{summary["succeeded"]} succeeded, {summary["failed"]} failed in {summary["elapsed"]:.2f}s ({summary["connection_rate"]:.1f} connections/s)',
+            f'{"phase":<16}{"count":>8}{"mean":>10}{"p50":>10}{"p95":>10}{"p99":>10}{"max":>10}  (ms)',
+        ]
+        for phase, stats in summary['phases'].items():
+            lines.append(f'{phase:<16}{stats["count"]:>8}' + ''.join(f'{stats[name]:>10.2f}' for name in ('mean', 'p50', 'p95', 'p99', 'max')))
+        if summary['errors']:
+            lines.append('errors:')
+            lines.extend(f'{count:>8}  {error}' for error, count in summary['errors'].items())
+        return '\n'.join(lines)
+
+def _percentiles(samples: list[float]) -> dict:
+    # 平均、パーセンタイル、最大値 (ms)
+    samples = sorted(sample * 1000 for sample in samples)
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+    return {
+        'count': len(samples),
+        'mean': sum(samples) / len(samples),
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'max': samples[-1],
+    }
@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+import socket
+import time
+
+from networking.enum import JEProtocolVersion
+import networking.mcpacket.clientbound.login as clientbound_login
+import networking.mcpacket.clientbound.play as clientbound_play
+import networking.mcpacket.clientbound.status as clientbound_status
+import networking.mcpacket.serverbound.configuration as configuration
+import networking.mcpacket.serverbound.handshake as handshake
+import networking.mcpacket.serverbound.login as login
+import networking.mcpacket.serverbound.play as play
+import networking.mcpacket.serverbound.status as status
+from loadgen.client import BotClient, ServerDisconnect, read_reason
+from loadgen.report import LoadReport
+
+# シナリオ名 -> シナリオ関数 (BotClient, LoadReport, 名前, オプション)
+SCENARIOS = {}
+
+def scenario(name: str):
+    def wrapper(function):
+        SCENARIOS[name] = function
+        return function
+    return wrapper
+
+def _handshake(bot: BotClient, intent: int):
+    bot.send(handshake.SHandshakePacket(JEProtocolVersion.v1_21_8.value, bot.host, bot.port, intent))
+
+@scenario('status')
+def status_ping(bot: BotClient, report: LoadReport, name: str, options: dict):
+    # サーバーリストのStatusリクエストとPing
+    bot.phase = 'status'
+    start = time.perf_counter()
+    _handshake(bot, 1)
+    bot.send(status.SStatusRequest())
+    packet_id, packet_buffer = bot.receive()
+    if packet_id != 0x00:
+        raise ValueError(f'Unexpected status packet 0x{packet_id:02X}')
+    report.record('status', time.perf_counter() - start)
+    bot.phase = 'ping'
+    start = time.perf_counter()
+    timestamp = time.time_ns() // 1000000
+    bot.send(status.SPingRequest(timestamp))
+    packet_id, packet_buffer = bot.receive()
+    if packet_id != 0x01 or clientbound_status.CPongResponse.from_bytes(packet_buffer).timestamp != timestamp:
+        raise ValueError('Invalid pong response')
+    report.record('ping', time.perf_counter() - start)
+
+@scenario('login')
+def join(bot: BotClient, report: LoadReport, name: str, options: dict):
+    # ログイン (オンラインモードでは暗号化と認証も) からコンフィグ設定を終えてPLAY状態になるまで
+    join_start = start = time.perf_counter()
+    bot.phase = 'login'
+    _handshake(bot, 2)
+    bot.send(login.SLoginStart(name, login.offline_uuid(name)))
+    while True:
+        packet_id, packet_buffer = bot.receive()
+        if packet_id == 0x00:
+            raise ServerDisconnect(bot.phase, read_reason(packet_buffer))
+        elif packet_id == 0x01:
+            # オンラインモード (認証はサーバーがセッションサーバーへ問い合わせる)
+            bot.encrypt(clientbound_login.CEncryptionRequest.from_bytes(packet_buffer))
+        elif packet_id == 0x03:
+            bot.compression_threshold = clientbound_login.CSetCompression.from_bytes(packet_buffer).threshold
+        elif packet_id == 0x02:
+            break
+    report.record('login', time.perf_counter() - start)
+
+    bot.phase = 'configuration'
+    start = time.perf_counter()
+    bot.send(login.SLoginAcknowledged())
+    bot.send(configuration.SClientInformation('en_us', 8, 0, True, 0x7F, 1))
+    bot.send(configuration.SPluginMessage('minecraft:brand', b'\x08pyncraft'))
+    while True:
+        packet_id, packet_buffer = bot.receive()
+        if packet_id == 0x02:
+            raise ServerDisconnect(bot.phase, read_reason(packet_buffer))
+        elif packet_id == 0x0E:
+            # サーバーのデータパックを全て持っていると返す
+            packs = []
+            for _ in range(packet_buffer.read_varint()):
+                pack_name, pack_id, pack_version = (packet_buffer.read_utf8_string() for _ in range(3))
+                packs.append({'pack_name': pack_name, 'pack_id': pack_id, 'pack_version': pack_version})
+            bot.send(configuration.SKnownPacks(packs))
+        elif packet_id == 0x03:
+            bot.send(configuration.SFinishConfigurationAcknowledged())
+            break
+    report.record('configuration', time.perf_counter() - start)
+    report.record('join', time.perf_counter() - join_start)
+
+@scenario('idle')
+def idle(bot: BotClient, report: LoadReport, name: str, options: dict):
+    # PLAY状態になった後、keep-aliveにだけ応答して接続を保つ
+    join(bot, report, name, options)
+    bot.phase = 'play'
+    deadline = time.monotonic() + options.get('idle', 30)
+    while (remaining := deadline - time.monotonic()) > 0:
+        bot.settimeout(remaining)
+        try:
+            packet_id, packet_buffer = bot.receive()
+        except socket.timeout:
+            break
+        if packet_id == 0x1C:
+            raise ServerDisconnect(bot.phase, read_reason(packet_buffer))
+        elif packet_id == 0x26:
+            bot.send(play.SKeepAlive(clientbound_play.CKeepAlive.from_bytes(packet_buffer).keep_alive_id))
+
+def _run_bot(host: str, port: int, scenario_function, report: LoadReport, name: str, options: dict):
+    bot = None
+    try:
+        start = time.perf_counter()
+        bot = BotClient(host, port, options.get('timeout', 10))
+        report.record('connect', time.perf_counter() - start)
+        scenario_function(bot, report, name, options)
+        report.success()
+    except ServerDisconnect as e:
+        report.failure(f'disconnected during {e.phase}: {e.reason}')
+    except Exception as e:
+        phase = getattr(bot, 'phase', 'connect')
+        report.failure(f'{type(e).__name__} during {phase}: {e}')
+    finally:
+        if bot is not None:
+            bot.close()
+
+def run(host: str, port: int, scenario_name: str, connections: int, concurrency: int = None, rate: float = 0, **options) -> LoadReport:
+    '''
+    connections個のボットで scenario_name のシナリオを実行し、結果を返す。
+    同時に動くボットはconcurrency個まで (省略した場合は全て同時)、rateを指定した場合は1秒あたりrate個ずつ接続を開始する。
+    '''
+    scenario_function = SCENARIOS[scenario_name]
+    report = LoadReport()
+    prefix = options.pop('name_prefix', 'bot')
+    with ThreadPoolExecutor(max_workers=concurrency or connections, thread_name_prefix='LoadBot') as executor:
+        for index in range(connections):
+            if rate > 0:
+                time.sleep(max(0.0, report.started + index / rate - time.monotonic()))
+            executor.submit(_run_bot, host, port, scenario_function, report, f'{prefix}{index}'[:16], options)
+    report.finish()
+    return report
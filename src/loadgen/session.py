@@ -0,0 +1,63 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import json
+import threading
+import time
+
+from networking.mcpacket.serverbound.login import offline_uuid
+
+class StubSessionServer:
+    '''
+    負荷試験用のセッションサーバー (hasJoinedに常に成功するだけ)。
+    オンラインモードのサーバーの session_server をこのサーバーへ向けると、Mojangに問い合わせずに暗号化と認証の処理を計測できる。
+    delayを指定すると応答をその秒数だけ遅らせる (本物のセッションサーバーの応答時間の代わり)。
+    status、bodyを指定するとプロフィールの代わりにそのステータスコードと本文を返す (認証失敗の試験用)。
+    '''
+    def __init__(self, address: str = '127.0.0.1', port: int = 0, delay: float = 0, status: int = 200, body: bytes = None):
+        self._delay = delay
+        self._status = status
+        self._body = body
+        self._server = ThreadingHTTPServer((address, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        address, port = self._server.server_address[:2]
+        return f'http://{address}:{port}'
+
+    def _handler(self):
+        delay, status, fixed_body = self._delay, self._status, self._body
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                username = parse_qs(url.query).get('username', [''])[0]
+                if url.path != '/session/minecraft/hasJoined' or not username:
+                    self.send_error(404)
+                    return
+                if delay > 0:
+                    time.sleep(delay)
+                body = fixed_body if fixed_body is not None or status != 200 else json.dumps({
+                    'id': offline_uuid(username).hex,
+                    'name': username,
+                    'properties': [{'name': 'textures', 'value': '', 'signature': None}],
+                }).encode()
+                body = body or b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # アクセスログは出力しない
+                pass
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='StubSessionServer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
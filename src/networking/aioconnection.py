@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+
+from core.logger import logger
+from networking.connection import ConnectionProcessor, Connection
+from networking.enum import JEPacketConnectionState
+
+class AsyncConnectionProcessor(ConnectionProcessor):
+    '''
+    asyncioのイベントループで接続を処理するConnectionProcessor。
+    select.selectのビジーループの代わりに接続ごとの読み込み/書き込みコルーチンを使用するため、
+    アイドル時のCPU使用率がほぼゼロになり、ファイルディスクリプタ数の上限(1024)にも縛られない。
+    パケットの処理自体(ServerboundPacket.handle / ClientboundPacket.to_bytes)は既存のものをそのまま使う。
+    '''
+    # 返信待ちのタイムアウトを確認する間隔 (秒)
+    REPLY_EXPIRY_INTERVAL = 0.1
+
+    def __init__(self):
+        super().__init__()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._loop_ready = threading.Event()
+        self._stop_future: asyncio.Future = None
+        self._tasks: dict[Connection, asyncio.Task] = {}
+
+    def _process_connections(self):
+        # プロセッサースレッド上でイベントループを実行する
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._run())
+        finally:
+            self._loop.close()
+
+    async def _run(self):
+        self._stop_future = self._loop.create_future()
+        self._loop_ready.set()
+        expiry = self._loop.create_task(self._expire_replies())
+        await self._stop_future
+        expiry.cancel()
+        # 停止要求が来たら全ての接続タスクを止めて接続を閉じる
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for connection in self.registry.connections_in():
+            connection.close()
+
+    async def _expire_replies(self):
+        # 返信待ちのタイムアウトを定期的に処理する
+        while True:
+            await asyncio.sleep(self.REPLY_EXPIRY_INTERVAL)
+            now = time.monotonic()
+            for connection in list(self._tasks):
+                connection.replies.expire(now)
+
+    def add_connection(self, connection: Connection):
+        super().add_connection(connection)
+        # リスナースレッドから呼ばれるのでイベントループへ委託する
+        self._loop.call_soon_threadsafe(self._spawn, connection)
+
+    def _spawn(self, connection: Connection):
+        wakeup = asyncio.Event()
+        # 他スレッドからqueue_packetされた時に書き込みコルーチンを起こす
+        connection._wakeup = lambda: self._loop.call_soon_threadsafe(wakeup.set)
+        # 起動前に送信キューへ積まれたパケットも送信する
+        if connection._outgoing_packets:
+            wakeup.set()
+        self._tasks[connection] = self._loop.create_task(self._serve(connection, wakeup))
+
+    async def _serve(self, connection: Connection, wakeup: asyncio.Event):
+        drained = asyncio.Event()
+        reader = self._loop.create_task(self._reader(connection, wakeup, drained))
+        writer = self._loop.create_task(self._writer(connection, wakeup, drained))
+        try:
+            # どちらかのコルーチンが終了したら接続を閉じる
+            _, pending = await asyncio.wait((reader, writer), return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(reader, writer, return_exceptions=True)
+        except asyncio.CancelledError:
+            reader.cancel()
+            writer.cancel()
+            # ソケットを閉じる前にコルーチンの後始末(remove_reader/remove_writer)を済ませる
+            await asyncio.gather(reader, writer, return_exceptions=True)
+            raise
+        finally:
+            connection._wakeup = None
+            self._tasks.pop(connection, None)
+            self._remove_connection(connection)
+
+    async def _reader(self, connection: Connection, wakeup: asyncio.Event, drained: asyncio.Event):
+        sock = connection.packet_wrapper._client_socket
+        while not self._is_closed(connection):
+            # 送信が詰まっている間は受信を止めてクライアント側へ背圧をかける
+            while connection.packet_wrapper.congested():
+                drained.clear()
+                await drained.wait()
+            await self._wait_ready(self._loop.add_reader, self._loop.remove_reader, sock)
+            try:
+                self._receive(connection)
+            except OSError as e:
+                logger.debug('Connection %s reset: %s', connection._address, e)
+                return
+            if not self._step(connection):
+                return
+            # 返信パケットがあれば書き込みコルーチンへ
+            wakeup.set()
+
+    async def _writer(self, connection: Connection, wakeup: asyncio.Event, drained: asyncio.Event):
+        sock = connection.packet_wrapper._client_socket
+        while True:
+            await wakeup.wait()
+            wakeup.clear()
+            if not self._step(connection):
+                return
+            encryptor = connection.con_state.cipher_pair[0] if connection.con_state.cipher_pair else None
+            # 送信しきれなかった場合は圧縮の完了、またはソケットが書き込み可能になるまで待機
+            woken = False
+            while not connection.packet_wrapper.flush(encryptor):
+                waiting = connection.packet_wrapper.waiting()
+                if waiting is not None:
+                    await asyncio.wait((asyncio.wrap_future(waiting),))
+                else:
+                    # 受信しないクライアントが送信キューの上限を超えて切断された場合もwakeupで起こされる
+                    woken |= await self._wait_writable(sock, wakeup)
+                if self._is_closed(connection):
+                    return
+                if connection._closing:
+                    # 送信を待たずに_stepで閉じる
+                    break
+            if woken:
+                # 送信を待っている間に受け取った通知は送信が捌けてから処理する
+                wakeup.set()
+            if not connection.packet_wrapper.congested():
+                drained.set()
+                # 一時停止中に溜まった送信キューを処理する
+                if connection._outgoing_packets:
+                    wakeup.set()
+            if self._is_closed(connection):
+                return
+
+    def _step(self, connection: Connection) -> bool:
+        # パケットを処理して接続を継続するかどうかを返す
+        try:
+            self._dispatch_packets(connection)
+        except EOFError:
+            pass
+        except Exception as e:
+            logger.exception(f'Error processing connection {connection.fileno()}: {e}')
+            connection.con_state._switch_state(JEPacketConnectionState.CLOSED)
+        return not self._is_closed(connection)
+
+    def _is_closed(self, connection: Connection) -> bool:
+        return connection.con_state.get_state() == JEPacketConnectionState.CLOSED
+
+    async def _wait_ready(self, add, remove, sock):
+        # ソケットが読み込み/書き込み可能になるまで待機
+        future = self._loop.create_future()
+        add(sock.fileno(), lambda: future.done() or future.set_result(None))
+        try:
+            await future
+        finally:
+            remove(sock.fileno())
+
+    async def _wait_writable(self, sock, wakeup: asyncio.Event) -> bool:
+        # ソケットが書き込み可能になるか、wakeupが設定されるまで待機し、wakeupが設定されたかどうかを返す
+        woken = self._loop.create_task(wakeup.wait())
+        writable = self._loop.create_task(self._wait_ready(self._loop.add_writer, self._loop.remove_writer, sock))
+        try:
+            await asyncio.wait((woken, writable), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            woken.cancel()
+            writable.cancel()
+            # ソケットが閉じられる前にremove_writerを済ませる
+            await asyncio.gather(woken, writable, return_exceptions=True)
+        woken = wakeup.is_set()
+        wakeup.clear()
+        return woken
+
+    def start_processor(self):
+        super().start_processor()
+        # add_connectionが呼ばれる前にイベントループが起動していることを保証する
+        self._loop_ready.wait()
+
+    def stop_processor(self):
+        if not self._processor_thread:
+            logger.warning(f'Connection processor not started.')
+            return
+        self._processor_stop_event.set()
+        self._loop.call_soon_threadsafe(lambda: self._stop_future.done() or self._stop_future.set_result(None))
+        self._processor_thread.join()
+        logger.info('Connection processor stopped!')
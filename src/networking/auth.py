@@ -0,0 +1,41 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.logger import logger
+
+class SessionAuthenticator:
+    '''
+    セッションサーバー(hasJoined)へのプレイヤー認証をワーカースレッドで行う。
+    ネットワークスレッドは認証結果を待たずに処理を続け、結果はFutureで受け取る。
+    同時リクエスト数はワーカー数で制限し、HTTP接続はkeep-aliveで使い回す。
+    '''
+    def __init__(self, session_server: str, max_workers: int = 8, timeout: float = 10.0):
+        self._has_joined_url = session_server.rstrip('/') + '/session/minecraft/hasJoined'
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='SessionAuthenticator')
+        # ワーカー数と同じだけの接続をプールする
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+    def authenticate(self, username: str, server_hash: str) -> Future:
+        # 認証をワーカーへ委託する (結果はプロフィールのdict、認証されなかった場合はNone)
+        return self._executor.submit(self._has_joined, username, server_hash)
+
+    def _has_joined(self, username: str, server_hash: str) -> dict | None:
+        params = {
+            'username': username,
+            'serverId': server_hash,
+        }
+        response = self._session.get(self._has_joined_url, params=params, timeout=self._timeout)
+        if response.status_code != 200:
+            logger.warning(f'Session server rejected {username}: HTTP {response.status_code}')
+            return None
+        return response.json()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._session.close()
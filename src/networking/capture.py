@@ -0,0 +1,86 @@
+import itertools
+import threading
+import time
+
+from networking.enum import JEPacketConnectionState
+from networking.mcpacket import codec
+from networking.mcpacket.codec import encode_varint
+
+# キャプチャファイルの先頭 (マジック + フォーマットのバージョン)
+MAGIC = b'PYNCAP\x01'
+
+INBOUND = 0 # クライアント -> サーバー
+OUTBOUND = 1 # サーバー -> クライアント
+
+class CaptureRecord:
+    __slots__ = ('timestamp', 'connection_id', 'direction', 'state', 'data')
+
+    def __init__(self, timestamp: float, connection_id: int, direction: int, state: JEPacketConnectionState, data: bytes):
+        self.timestamp = timestamp # キャプチャ開始からの経過時間 (秒)
+        self.connection_id = connection_id
+        self.direction = direction
+        self.state = state
+        self.data = data # 復号化、解凍済みのパケットID + データ
+
+    def __repr__(self):
+        direction = 'in' if self.direction == INBOUND else 'out'
+        return f'CaptureRecord({self.timestamp:.6f}, #{self.connection_id}, {direction}, {self.state.name}, {len(self.data)} bytes)'
+
+class CaptureWriter:
+    '''
+    送受信したパケットをキャプチャファイルへ書き出す (全接続で共有)。
+    フレームは暗号化と圧縮を解いたパケットID + データで記録し、暗号化と圧縮の設定に依存せずに再生できるようにする。
+    レコードは [前のレコードからの経過時間(μs) varint][方向 | 接続状態 << 1 (1バイト)][接続ID varint][長さ varint][データ]。
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb', buffering=1 << 16)
+        self._file.write(MAGIC)
+        self._file.write(time.time_ns().to_bytes(8, 'big')) # キャプチャ開始時刻 (UNIX時間, ナノ秒)
+        self._last = time.monotonic_ns()
+        self._connection_ids = itertools.count(1)
+        self.records = 0
+
+    def new_connection(self) -> int:
+        # 接続ごとのIDを払い出す
+        return next(self._connection_ids)
+
+    def record(self, connection_id: int, direction: int, state: JEPacketConnectionState, data):
+        with self._lock:
+            if self._file is None:
+                return
+            now = time.monotonic_ns()
+            delta, self._last = (now - self._last) // 1000, now
+            self._file.write(encode_varint(delta) + bytes((direction | state.value << 1,)) + encode_varint(connection_id) + encode_varint(len(data)))
+            self._file.write(data)
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def read_capture(path: str):
+    # キャプチャファイルのレコードを記録順に返すジェネレーター
+    with open(path, 'rb') as file:
+        data = file.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f'Not a pyncraft capture file: {path}')
+    position = len(MAGIC) + 8
+    elapsed = 0
+    while position < len(data):
+        try:
+            delta, position = codec.decode_varint(data, position)
+            flags = data[position]
+            connection_id, position = codec.decode_varint(data, position + 1)
+            length, position = codec.decode_varint(data, position)
+        except (EOFError, IndexError):
+            return
+        if position + length > len(data):
+            # 書き込み途中で終了したファイルの最後のレコードは読み飛ばす
+            return
+        elapsed += delta
+        yield CaptureRecord(elapsed / 1e6, connection_id, flags & 1, JEPacketConnectionState(flags >> 1), data[position:position + length])
+        position += length
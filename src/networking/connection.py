@@ -1,13 +1,25 @@
 
+from collections import deque
+from concurrent.futures import CancelledError, Future
 import socket
 import threading
-from typing import List
 import select
+import time
+from time import perf_counter_ns
 
 from core.logger import logger
-from networking.mcpacket.io import JEPacketWrapper
+from core.tracing import tracer
+from networking.mcpacket.io import JEPacketWrapper, PreEncodedPacket
 from networking.enum import JEPacketConnectionState
 from networking.mcrypto import gen_rsa_key_pair, encode_public_key_der
+from networking.status import ServerStatus
+from networking.auth import SessionAuthenticator
+from networking.reply import ReplyCorrelator
+from networking.capture import CaptureWriter
+from networking.compression import PacketCompressor
+from networking.link import AdaptiveCompression, LinkStats
+from networking.metrics import MetricsServer, metrics
+import networking.mcpacket.clientbound.play as play
 
 class ConnectionListener:
     def __init__(self, server_config):
@@ -17,6 +29,59 @@ class ConnectionListener:
         self._server = None
         self._server_config = server_config
 
+        # 送信待ちバイト数の上限と、上限を超えた遅いクライアントへの対応 ('pause' または 'disconnect')
+        self.write_high_water_mark = int(server_config.get('pyncraft', 'write_high_water_mark'))
+        self.slow_consumer_policy = server_config.get('pyncraft', 'slow_consumer_policy')
+        # 送信キューと未送信データの合計がハイウォーターマークのこの倍数を超えたら切断する (送信キューの上限)
+        self.write_backlog_factor = int(server_config.get('pyncraft', 'write_backlog_factor'))
+
+        # 送受信したパケットのキャプチャ (パスが空の場合は記録しない)
+        capture_path = server_config.get('pyncraft', 'capture_path')
+        self.capture = CaptureWriter(capture_path) if capture_path else None
+        if self.capture is not None:
+            logger.info(f'Capturing packets to {capture_path}')
+
+        # オフラインモード (falseの場合は暗号化とセッションサーバーでの認証を行わない)
+        self.online_mode = server_config.get('pyncraft', 'online_mode').lower() == 'true'
+
+        # プレイヤー認証 (全接続で共有)
+        self.authenticator = SessionAuthenticator(
+            server_config.get('pyncraft', 'session_server'),
+            int(server_config.get('pyncraft', 'auth_workers')),
+            float(server_config.get('pyncraft', 'auth_timeout')),
+        )
+
+        # パケットの圧縮 (全接続で共有、しきい値が負の場合は圧縮なし)
+        self.compression_threshold = int(server_config.get('pyncraft', 'compression_threshold'))
+        self.compressor = PacketCompressor(
+            int(server_config.get('pyncraft', 'compression_level')),
+            int(server_config.get('pyncraft', 'compression_offload_size')),
+            int(server_config.get('pyncraft', 'compression_workers')),
+        )
+
+        # 回線の状態に応じた接続ごとの圧縮設定の調整 (無効の場合はNone)
+        self.adaptive_compression = None
+        if server_config.get('pyncraft', 'adaptive_compression').lower() == 'true':
+            self.adaptive_compression = AdaptiveCompression(
+                int(server_config.get('pyncraft', 'compression_threshold_max')),
+                int(server_config.get('pyncraft', 'compression_level_min')),
+                int(server_config.get('pyncraft', 'compression_level_max')),
+            )
+
+        # keep-aliveの送信間隔と返信を待つ時間 (秒)
+        self.keep_alive_interval = float(server_config.get('pyncraft', 'keep_alive_interval'))
+        self.keep_alive_timeout = float(server_config.get('pyncraft', 'keep_alive_timeout'))
+
+        # メトリクスを公開するポート (0の場合は公開しない) と、メトリクスに追加する情報 (名前 -> dictを返す関数)
+        # パケット単位の計測は有効な場合のみ行う (無効な場合はパケットごとの判定1回のみ)
+        metrics.enabled = server_config.get('pyncraft', 'metrics_enabled').lower() == 'true'
+        self.metrics_port = int(server_config.get('pyncraft', 'metrics_port'))
+        self.metrics_sources = {'compression': self.compressor.stats.snapshot}
+        self._metrics_server = None
+
+        # サーバーリスト用のステータス (全接続で共有)
+        self.server_status = ServerStatus(server_config.get('pyncraft', 'motd'), int(server_config.get('pyncraft', 'max_players')))
+
         # ConnectionProcessorのインスタンスを保持
         self._connection_processor = None
 
@@ -27,6 +92,12 @@ class ConnectionListener:
         self.public_der = encode_public_key_der(self.public)
         self.server_id = ''
 
+    def metrics_snapshot(self) -> dict:
+        snapshot = self._connection_processor.metrics_snapshot()
+        for name, source in self.metrics_sources.items():
+            snapshot[name] = source()
+        return snapshot
+
     def _listen_connection(self):
         logger.info('Listening for connections...')
         while not self._server_stop_event.is_set():
@@ -51,17 +122,23 @@ class ConnectionListener:
         address = self._server_config.get('pyncraft', 'server_ip')
         port = int(self._server_config.get('pyncraft', 'server_port'))
 
-        # ConnectionProcessorのインスタンスを作成
-        self._connection_processor = ConnectionProcessor()
+        # ConnectionProcessorのインスタンスを作成 (network_engineで実装を選択)
+        self._connection_processor = create_processor(self._server_config.get('pyncraft', 'network_engine'))
         self._connection_processor.start_processor()
 
         # ソケットの作成とバインド
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server.bind((address, port))
-        self.server.listen(1)
+        self.server.listen(socket.SOMAXCONN)
         self.server.settimeout(1.0)  # タイムアウトで停止フラグをチェックできるようにする
 
+        # メトリクスの公開 (ローカルのみ)
+        if self.metrics_port > 0:
+            self._metrics_server = MetricsServer(self.metrics_snapshot, '127.0.0.1', self.metrics_port)
+            self._metrics_server.start()
+            logger.info(f'Serving metrics on http://127.0.0.1:{self._metrics_server.port}/metrics')
+
         # リスナースレッドを開始
         self.server_thread = threading.Thread(target=self._listen_connection, name='ConnectionListener')
         self.server_thread.start()
@@ -76,13 +153,116 @@ class ConnectionListener:
         self.server_thread.join()
         # 接続中のクライアントをシャットダウン
         self._connection_processor.stop_processor()
+        self.authenticator.shutdown()
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+        self.compressor.shutdown()
+        if self.capture is not None:
+            self.capture.close()
         logger.info('Server stopped!')
 
+class ConnectionRegistry:
+    '''
+    接続を接続状態ごとのsetで管理する。
+    JEConnectionState._switch_stateから状態遷移が通知されるため、状態ごとの接続を全接続の走査なしで取得できる。
+    状態ごとの世代カウンタは接続の出入りがあった時だけ進み、取得した一覧は次に世代が進むまで使い回す。
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_state: dict[JEPacketConnectionState, set] = {state: set() for state in JEPacketConnectionState}
+        self._generations: dict[JEPacketConnectionState, int] = {state: 0 for state in JEPacketConnectionState}
+        self._generation = 0 # 全体の世代
+        # (世代, 接続一覧) のキャッシュ (キーNoneは全接続)
+        self._snapshots: dict = {}
+
+    def add(self, connection: 'Connection'):
+        with self._lock:
+            # 状態遷移の通知はロックの中で登録するので、登録前後の遷移を取りこぼさない
+            connection.con_state._on_switch = self.transition
+            self._enter(connection, connection.con_state._state)
+
+    def remove(self, connection: 'Connection'):
+        with self._lock:
+            connection.con_state._on_switch = None
+            for state, connections in self._by_state.items():
+                if connection in connections:
+                    connections.discard(connection)
+                    self._bump(state)
+
+    def transition(self, connection: 'Connection', old_state: JEPacketConnectionState, new_state: JEPacketConnectionState):
+        # 接続状態が変わった時に呼ばれる
+        if old_state == new_state:
+            return
+        with self._lock:
+            connections = self._by_state[old_state]
+            if connection not in connections:
+                return
+            connections.discard(connection)
+            self._bump(old_state)
+            self._enter(connection, new_state)
+
+    def _enter(self, connection: 'Connection', state: JEPacketConnectionState):
+        self._by_state[state].add(connection)
+        self._bump(state)
+
+    def _bump(self, state: JEPacketConnectionState):
+        self._generations[state] += 1
+        self._generation += 1
+
+    def generation(self, state: JEPacketConnectionState = None) -> int:
+        # 状態(Noneは全体)の世代 (前回から変わっていなければ接続の出入りはない)
+        return self._generation if state is None else self._generations[state]
+
+    def connections_in(self, state: JEPacketConnectionState = None) -> tuple:
+        # 状態(Noneは全状態)の接続一覧を返す (世代が変わっていなければ前回と同じtuple)
+        generation = self.generation(state)
+        snapshot = self._snapshots.get(state)
+        if snapshot is not None and snapshot[0] == generation:
+            return snapshot[1]
+        with self._lock:
+            generation = self.generation(state)
+            if state is None:
+                connections = tuple(connection for connections in self._by_state.values() for connection in connections)
+            else:
+                connections = tuple(self._by_state[state])
+            self._snapshots[state] = (generation, connections)
+        return connections
+
+    def __len__(self):
+        return sum(len(connections) for connections in self._by_state.values())
+
+class InboundPacketQueue:
+    '''
+    ネットワークスレッドで受信したPLAY状態のパケットをティックスレッドへ渡すキュー (全接続で1つ)。
+    dequeのappend/popleftはスレッドセーフなのでロックは使わない。
+    '''
+    def __init__(self):
+        self._queue: deque[tuple] = deque()
+
+    def put(self, packet, connection: 'Connection'):
+        self._queue.append((packet, connection.con_state))
+
+    def drain(self) -> dict[type, list]:
+        # 現時点でキューにあるパケットをパケットの種類ごとにまとめて取り出す (到着順)
+        batches = {}
+        queue = self._queue
+        for _ in range(len(queue)):
+            packet, con_state = queue.popleft()
+            batch = batches.get(packet.__class__)
+            if batch is None:
+                batch = batches[packet.__class__] = []
+            batch.append((packet, con_state))
+        return batches
+
+    def __len__(self):
+        return len(self._queue)
+
 class ConnectionProcessor:
     def __init__(self):
-        # 接続リストとロックの初期化
-        self._connections: List[Connection] = []
-        self._connection_list_lock = threading.Lock()
+        # 接続状態ごとの接続一覧
+        self.registry = ConnectionRegistry()
+        # ティックスレッドで処理するPLAY状態のパケット
+        self.inbound_packets = InboundPacketQueue()
 
         # 接続処理の停止フラグとプロセススレッド
         self._processor_stop_event = threading.Event()
@@ -91,9 +271,13 @@ class ConnectionProcessor:
     def _process_connections(self):
         # ここで接続に対する処理を行う
         while not self._processor_stop_event.is_set():
-            # リスナークラスのレイテンシーを考慮してロックはなるべく短くする
-            with self._connection_list_lock:
-                current_connections = list(self._connections)
+            # 接続の出入りがなければ前回と同じ一覧が返る
+            current_connections = self.registry.connections_in()
+
+            # 返信待ちのタイムアウトを処理
+            now = time.monotonic()
+            for connection in current_connections:
+                connection.replies.expire(now)
 
             # クライアントソケットの状態を確認
             read_ready, write_ready, exceptional = select.select(current_connections, current_connections, current_connections, 0)
@@ -104,49 +288,11 @@ class ConnectionProcessor:
                     logger.error(f'Connection {connection.fileno()} is in exceptional state, closing it.')
                     connection.con_state._switch_state(JEPacketConnectionState.CLOSED)
                     continue
-                # クライアントソケットにデータがある場合は受信してバッファに追加
-                if connection in read_ready:
-                    decryptor = connection.con_state.cipher_pair[1] if connection.con_state.cipher_pair else None
-                    if connection.packet_wrapper.recv_to_buffer(decryptor) == -1:
-                        connection.con_state._switch_state(JEPacketConnectionState.CLOSED)
+                # クライアントソケットにデータがある場合は受信してバッファに追加 (送信が詰まっている間は受信しない)
+                if connection in read_ready and not connection.packet_wrapper.congested():
+                    self._receive(connection)
                 try:
-                    # ここでクライアントからのパケットがあれば処理する (C -> S)
-                    outgoing_packets = []
-                    with connection._awaiting_replies_lock:
-                        awaiting_replies = connection._awaiting_replies
-                    while (incoming_packet := connection.packet_wrapper.read_packet(connection.con_state)) is not None:
-                        # サーバーが送ったパケットの返信であるか確認
-                        logger.debug(f'Incoming packet: {incoming_packet}')
-                        for reply in awaiting_replies:
-                            if incoming_packet.__class__ in reply._repliable_packets:
-                                # 返信可能なパケットがあれば待機フラグを立てる
-                                if reply._timeout_flag.is_set():
-                                    logger.warning(f'Timeout waiting for reply for packet {reply._packet_id}')
-                                    with connection._awaiting_replies_lock:
-                                        connection._awaiting_replies.remove(reply)
-                                else:
-                                    logger.debug(f'Packet reply arrived for {reply}')
-                                    reply._reply = incoming_packet
-                                    reply._reply_arrived_flag.set()
-                                    with connection._awaiting_replies_lock:
-                                        connection._awaiting_replies.remove(reply)
-                        logger.debug(f'Handling incoming packet: {incoming_packet}')
-                        outgoing_packet = incoming_packet.handle(connection.con_state)
-                        if outgoing_packet is not None:
-                            outgoing_packets.append(outgoing_packet)
-
-                    # クライアント行きのパケットのキューを確認
-                    with connection._outgoing_packets_lock:
-                        con_packets = connection._outgoing_packets
-                        connection._outgoing_packets = []
-                    for outgoing_packet in con_packets:
-                        outgoing_packets.append(outgoing_packet)
-
-                    # ここでクライアントへ送信するパケットがあれば処理する (S -> C)
-                    for outgoing_packet in outgoing_packets:
-                        connection.packet_wrapper.write_packet(outgoing_packet, connection.con_state)
-                        logger.debug(f'Outgoing packet: {outgoing_packet}')
-                    
+                    self._dispatch_packets(connection)
                     # クライアントソケットが書き込み可能な場合はパケットを送信
                     if connection in write_ready:
                         encryptor = connection.con_state.cipher_pair[0] if connection.con_state.cipher_pair else None
@@ -160,29 +306,135 @@ class ConnectionProcessor:
                 finally:
                     # 接続ステートがCLOSEDになった場合は接続を閉じる
                     if connection.con_state.get_state() == JEPacketConnectionState.CLOSED:
-                        connection.close()
-                        with self._connection_list_lock:
-                            # 接続リストから削除
-                            self._connections.remove(connection)
+                        self._remove_connection(connection)
                 
         # _server_stop_eventフラグが立てられたらループを抜ける
         # 接続中のクライアントをシャットダウン
-        with self._connection_list_lock:
-            active_connections = list(self._connections)
-        for connection in active_connections:
+        for connection in self.registry.connections_in():
             connection.close()
         
-    def add_connection(self, connection: 'Connection'):
-        # スレッドセーフなリスト改変
-        with self._connection_list_lock:
-            self._connections.append(connection)
+    def _receive(self, connection: 'Connection'):
+        # ソケットから受信してバッファに追加 (ソケットが閉じられた場合はCLOSEDへ)
+        decryptor = connection.con_state.cipher_pair[1] if connection.con_state.cipher_pair else None
+        if connection.packet_wrapper.recv_to_buffer(decryptor) == -1:
+            connection.con_state._switch_state(JEPacketConnectionState.CLOSED)
+
+    def _apply_backpressure(self, connection: 'Connection') -> bool:
+        # 送信待ちがハイウォーターマークを超えている場合はTrueを返す
+        if not connection.packet_wrapper.congested():
+            return False
+        if connection.slow_consumer_policy == 'disconnect':
+            logger.warning(f'Disconnecting slow client {connection._address}: {connection.packet_wrapper.pending_bytes()} bytes pending')
+            connection.con_state._switch_state(JEPacketConnectionState.CLOSED)
+        return True
+
+    def _dispatch_packets(self, connection: 'Connection'):
+        # 切断を要求された接続は送信キューを送れるだけ送って閉じる
+        if connection._closing:
+            self._close_gracefully(connection)
+            return
+        # 送信が捌けるまでは受信したパケットも送信キューも処理しない
+        if self._apply_backpressure(connection):
+            return
+        # ここでクライアントからのパケットがあれば処理する (C -> S)
+        outgoing_packets = []
+        while (incoming_packet := connection.packet_wrapper.read_packet(connection.con_state)) is not None:
+            # サーバーが送ったパケットの返信であれば待機中のFutureを完了させる
+            logger.debug('Incoming packet: %s', incoming_packet)
+            connection.replies.resolve(incoming_packet)
+            # PLAY状態のパケットはゲームの状態を変更するのでティックスレッドで処理する
+            if incoming_packet._state is JEPacketConnectionState.PLAY:
+                self.inbound_packets.put(incoming_packet, connection)
+                continue
+            logger.debug('Handling incoming packet: %s', incoming_packet)
+            start = perf_counter_ns() if metrics.enabled else 0
+            with tracer.span(incoming_packet.__class__.__name__, 'handle'):
+                outgoing_packet = incoming_packet.handle(connection.con_state)
+            if start:
+                metrics.observe('handle', incoming_packet._state, incoming_packet._packet_id, perf_counter_ns() - start)
+            if outgoing_packet is not None:
+                outgoing_packets.append(outgoing_packet)
+
+        # クライアント行きのパケットのキューを確認
+        with connection._outgoing_packets_lock:
+            con_packets = connection._outgoing_packets
+            connection._outgoing_packets = []
+            connection._queued_bytes = 0
+        for outgoing_packet in con_packets:
+            outgoing_packets.append(outgoing_packet)
+
+        # ここでクライアントへ送信するパケットがあれば処理する (S -> C)
+        for outgoing_packet in outgoing_packets:
+            connection.packet_wrapper.write_packet(outgoing_packet, connection.con_state)
+            logger.debug('Outgoing packet: %s', outgoing_packet)
+
+    def _close_gracefully(self, connection: 'Connection'):
+        # 切断理由などのパケットを1回だけ送信を試みてから接続をCLOSEDにする (相手が受信しない場合は送信を待たない)
+        with connection._outgoing_packets_lock:
+            con_packets = connection._outgoing_packets
+            connection._outgoing_packets = []
+            connection._queued_bytes = 0
+        try:
+            for outgoing_packet in con_packets:
+                connection.packet_wrapper.write_packet(outgoing_packet, connection.con_state)
+            encryptor = connection.con_state.cipher_pair[0] if connection.con_state.cipher_pair else None
+            connection.packet_wrapper.flush(encryptor)
+        except OSError as e:
+            logger.debug('Could not flush %s before closing: %s', connection._address, e)
+        finally:
+            connection.con_state._switch_state(JEPacketConnectionState.CLOSED)
+
+    def _remove_connection(self, connection: 'Connection'):
+        # 接続を閉じて接続リストから削除
+        connection.close()
+        self.registry.remove(connection)
 
-    def all_connections(self):
-        # 現在の接続リストを返す
+    def add_connection(self, connection: 'Connection'):
+        # ソケットはノンブロッキングで扱い、送信しきれなかった分は次回のflushで送信する
+        connection.packet_wrapper._client_socket.setblocking(False)
+        self.registry.add(connection)
+
+    def broadcast(self, packet, targets=None) -> int:
+        # 同じパケットを複数の接続へ送信し、送信先の数を返す (targetsを省略した場合はPLAY状態の全接続)
+        # エンコードと圧縮は呼び出し元のスレッドで圧縮の設定ごとに一度だけ行い、
+        # 全ての送信先で同じバイト列を共有する (接続ごとに行うのは暗号化のみ)
+        if targets is None:
+            targets = self.registry.connections_in(JEPacketConnectionState.PLAY)
+        if not isinstance(packet, PreEncodedPacket):
+            packet = PreEncodedPacket(packet)
+        count = 0
+        for connection in targets:
+            packet.frame(connection.con_state)
+            connection.queue_packet(packet)
+            count += 1
+        return count
+
+    def metrics_snapshot(self) -> dict:
+        # パケットごとのメトリクスと、接続ごとの送受信バイト数、送信キューの深さ、回線の状態
+        snapshot = metrics.snapshot()
+        snapshot['connections'] = {state.name: len(self.registry.connections_in(state)) for state in JEPacketConnectionState}
+        per_connection = []
+        for connection in self.registry.connections_in():
+            wrapper = connection.packet_wrapper
+            per_connection.append({
+                'address': '%s:%s' % connection._address[:2],
+                'state': connection.con_state.get_state().name,
+                'bytes_in': wrapper.bytes_in,
+                'bytes_out': wrapper.bytes_out,
+                'queue_depth': wrapper.pending_bytes(),
+                **connection.con_state.link_metrics(),
+            })
+        snapshot['per_connection'] = per_connection
+        return snapshot
+
+    def all_connections(self) -> tuple:
+        # 現在の接続一覧を返す
         # 論理サーバー側でパケット送受信をするために使用
-        with self._connection_list_lock:
-            connections = list(self._connections)
-        return connections
+        return self.registry.connections_in()
+
+    def connections_in(self, state: JEPacketConnectionState) -> tuple:
+        # 指定した接続状態の接続一覧を返す
+        return self.registry.connections_in(state)
 
     def start_processor(self):
         # 接続処理を開始するための関数
@@ -200,59 +452,176 @@ class ConnectionProcessor:
         logger.info('Connection processor stopped!')
         pass
 
+# エンコード前のパケットの推定サイズ (パケットオブジェクト1つ分のメモリ)
+QUEUED_PACKET_SIZE = 64
+
+def queued_size(packet) -> int:
+    # 送信キュー内のパケットが占めるバイト数 (エンコード済みのパケットはフレームの長さ)
+    if isinstance(packet, PreEncodedPacket) and packet._payload is not None:
+        return max(packet.uncompressed_length, QUEUED_PACKET_SIZE)
+    return QUEUED_PACKET_SIZE
+
+def create_processor(engine: str = None) -> ConnectionProcessor:
+    # 'select' (デフォルト) または 'asyncio' の接続処理エンジンを生成
+    if engine in (None, '', 'select'):
+        return ConnectionProcessor()
+    if engine == 'asyncio':
+        from networking.aioconnection import AsyncConnectionProcessor
+        return AsyncConnectionProcessor()
+    raise ValueError(f'Unknown network engine: {engine}')
+
 class Connection:
     def __init__(self, client: socket.socket, address, listener: ConnectionListener):
         self.packet_wrapper = JEPacketWrapper(client)
+        self.packet_wrapper.high_water_mark = listener.write_high_water_mark
+        if listener.capture is not None:
+            self.packet_wrapper.capture = listener.capture
+            self.packet_wrapper.capture_id = listener.capture.new_connection()
+        self.slow_consumer_policy = listener.slow_consumer_policy
         self._address = address
 
+        # 送信キューに積まれた時に処理エンジンへ通知するコールバック (asyncioエンジンが設定)
+        self._wakeup = None
+
         # クライアント行きパケットのキュー
         self._outgoing_packets = []
         self._outgoing_packets_lock = threading.Lock()
+        self._queued_bytes = 0 # キュー内のパケットの推定バイト数
+        self._closing = False # disconnectが呼ばれた (送信キューを送ったら閉じる)
+        self._backlog_limit = listener.write_high_water_mark * listener.write_backlog_factor
+        self.dropped_packets = 0 # 送信が詰まっていたために捨てたパケット数
+
+        # 返信を待つパケットと返信の対応付け
+        self.replies = ReplyCorrelator()
 
-        # 返信を待つパケットのキュー
-        self._awaiting_replies = []
-        self._awaiting_replies_lock = threading.Lock()
+        # 回線の状態の監視
+        self._adaptive_compression = listener.adaptive_compression
+        self._keep_alive_interval = listener.keep_alive_interval
+        self._keep_alive_timeout = listener.keep_alive_timeout
+        self._last_keep_alive = time.monotonic()
 
         # 各クライアントの接続状態を管理するためのオブジェクト
-        self.con_state = JEConnectionState(listener)
+        self.con_state = JEConnectionState(listener, self)
 
     def fileno(self):
         return self.packet_wrapper.fileno()
     
-    def queue_packet(self, packet, timeout=0):
-        # パケットがrepliableか確認
-        # 返信待ちをするのパケットであれば
-        if hasattr(packet, '_repliable_packets'):
-            with self._awaiting_replies_lock:
-                logger.debug(f'Adding packet {packet} to awaiting replies')
-                self._awaiting_replies.append(packet)
+    def _enqueue(self, packet):
+        # クライアントが受信しない間もキューが際限なく伸びないように、未送信データがハイウォーターマークを超えている間は
+        # 捨ててよいパケットを捨て、送信キューを含めて上限を超えたら接続を閉じる
+        size = queued_size(packet)
         with self._outgoing_packets_lock:
-            self._outgoing_packets.append(packet)
-        # タイムアウトが設定されていない場合は返信を待たない
-        if hasattr(packet, '_repliable_packets') and timeout > 0:
-            reply = packet.wait_for_reply(timeout=timeout)
-            return reply
-        
+            if self.con_state._state is JEPacketConnectionState.CLOSED:
+                return
+            backlog = self.packet_wrapper.pending_bytes() + self._queued_bytes
+            if backlog > self.packet_wrapper.high_water_mark:
+                if packet.droppable:
+                    self.dropped_packets += 1
+                    return
+                if backlog + size > self._backlog_limit:
+                    logger.warning(f'Disconnecting slow client {self._address}: {backlog} bytes backlogged')
+                    self._outgoing_packets = []
+                    self._queued_bytes = 0
+                    self.con_state._switch_state(JEPacketConnectionState.CLOSED)
+                    packet = None
+            if packet is not None:
+                self._outgoing_packets.append(packet)
+                self._queued_bytes += size
+        # 切断した場合も処理エンジンへ通知して接続を閉じさせる
+        if self._wakeup is not None:
+            self._wakeup()
+
+    def disconnect(self, packet):
+        # 切断理由のパケットを送ってから接続を閉じる (他スレッドからも呼び出し可)
+        # 閉じるのはネットワークスレッドで、送信はできる範囲のみ行う
+        self._closing = True
+        self._enqueue(packet)
+
+    def request(self, packet, timeout=0) -> Future:
+        # repliableなパケットを送信して返信を受け取るFutureを返す (ブロックしない)
+        # timeoutが設定されている場合は期限を過ぎるとTimeoutErrorで失効する
+        future = self.replies.expect(packet, timeout)
+        self._enqueue(packet)
+        return future
+
+    def queue_packet(self, packet, timeout=0):
+        if not hasattr(packet, '_repliable_packets'):
+            self._enqueue(packet)
+            return None
+        # repliableなパケットの場合は返信を受け取るFutureを返す
+        # timeoutが設定されている場合は呼び出し元スレッドも返信を待ってから返す (タイムアウト時はNone)
+        future = self.request(packet, timeout)
+        if timeout > 0:
+            try:
+                return future.result(timeout)
+            except (TimeoutError, CancelledError):
+                logger.warning(f'Timeout waiting for reply for packet {packet}')
+                return None
+        return future
+
+    def update_link(self, now: float = None):
+        # 回線の状態を記録して圧縮の設定を調整し、必要であればkeep-aliveを送信する (ティックスレッドから呼ぶ)
+        now = time.monotonic() if now is None else now
+        con_state = self.con_state
+        output_queue = self.packet_wrapper._output_queue
+        con_state.link.sample(output_queue.sent, len(output_queue), now)
+        if self._adaptive_compression is not None:
+            self._adaptive_compression.tune(con_state)
+        if now - self._last_keep_alive >= self._keep_alive_interval:
+            self._last_keep_alive = now
+            self.keep_alive(now)
+
+    def keep_alive(self, now: float):
+        # keep-aliveを送信し、返信までの時間をRTTとして記録する
+        keep_alive_id = int(now * 1000)
+        future = self.request(play.CKeepAlive(keep_alive_id), self._keep_alive_timeout)
+        def on_reply(future):
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                logger.warning(f'Keep-alive timed out for {self._address}')
+                # 応答しない相手は受信もしないので、送れるだけ送って接続を閉じる
+                self.disconnect(play.CDisconnect('Timed out'))
+                return
+            if future.result().keep_alive_id != keep_alive_id:
+                logger.warning(f'Keep-alive ID mismatch from {self._address}')
+                return
+            self.con_state.link.record_rtt(time.monotonic() - now)
+        future.add_done_callback(on_reply)
+
     def close(self):
+        # 返信待ちのFutureをキャンセル
+        self.replies.cancel_all()
+        # プレイヤーとして参加していた場合はオンラインのプレイヤーから外す
+        if self.con_state.uuid is not None:
+            self.con_state.server_status.player_left(self.con_state.uuid)
         # クライアントソケットを閉じる
         self.packet_wrapper.close()
-        logger.debug(f'Connection closed: {self._address}')
+        logger.debug('Connection closed: %s', self._address)
 
 class JEConnectionState:
-    def __init__(self, listener: ConnectionListener):
+    def __init__(self, listener: ConnectionListener, connection: Connection = None):
+        self._connection = connection
         self._state_lock = threading.Lock()
         self._state = JEPacketConnectionState.HANDSHAKING # 接続状態を管理するための変数
+        self._on_switch = None # 接続状態が変わった時のコールバック (ConnectionRegistryが設定)
         self.compression_threshold = -1 # 圧縮プロトコルのしきい値 (-1は圧縮なし)
+        self.network_compression_threshold = listener.compression_threshold # ログイン時に設定するしきい値
+        self.compressor = listener.compressor
+        self.send_threshold = -1 # 送信時のしきい値 (回線の状態に応じて調整、compression_thresholdより下げない)
+        self.compression_level = None # 送信時の圧縮レベル (Noneはcompressorの圧縮レベル)
 
-        # サーバーコンフィグ
-        self.motd = listener._server_config.get('pyncraft', 'motd')
-        self.max_players = int(listener._server_config.get('pyncraft', 'max_players'))
-        self.online_players = 0
+        # 回線の状態
+        self.link = LinkStats()
+
+        # サーバーの状態 (全接続で共有)
+        self.server_status = listener.server_status
 
         # クライアント情報パケット
         self.config_lock = threading.Lock()
         self.client_info = None
         self.plugin_message = None
+        self.configuration = None # コンフィグ設定の進行状況 (PyncraftServerが設定)
 
         # 暗号化
         self.rsa_pair = (listener.private, listener.public)
@@ -260,6 +629,8 @@ class JEConnectionState:
         self.server_id = listener.server_id
         self.verify_token = None
         self.cipher_pair = None
+        self.online_mode = listener.online_mode
+        self.authenticator = listener.authenticator
 
         # ユーザー情報
         self.username = None
@@ -267,14 +638,37 @@ class JEConnectionState:
 
     def _switch_state(self, new_state: JEPacketConnectionState):
         with self._state_lock:
+            old_state = self._state
             self._state = new_state
+            # 接続状態ごとの接続一覧へ通知 (遷移の順序を保つためロックの中で行う)
+            if self._on_switch is not None:
+                self._on_switch(self._connection, old_state, new_state)
     
     def get_state(self):
         with self._state_lock:
             return self._state
+
+    def send(self, packet):
+        # handleの戻り値以外でクライアントへパケットを送る (他スレッドからも呼び出し可)
+        self._connection.queue_packet(packet)
+
+    def disconnect(self, packet):
+        # 切断理由のパケットを送って接続を閉じる (他スレッドからも呼び出し可)
+        self._connection.disconnect(packet)
     
+    def link_metrics(self) -> dict:
+        # 回線の状態と、それに応じて選ばれた圧縮の設定
+        metrics = self.link.snapshot()
+        metrics.update(
+            compression_threshold=self.compression_threshold,
+            send_threshold=max(self.compression_threshold, self.send_threshold),
+            compression_level=self.compressor.level if self.compression_level is None else self.compression_level,
+        )
+        return metrics
+
     def configs(self):
+        # クライアント情報とプラグインメッセージが揃っていれば返す (揃っていなければNone)
         with self.config_lock:
             if self.client_info is None or self.plugin_message is None:
-                return self.client_info, self.plugin_message
-            return None
\ No newline at end of file
+                return None
+            return self.client_info, self.plugin_message
\ No newline at end of file
@@ -0,0 +1,83 @@
+import time
+
+from networking.mcpacket.io import MAX_PACKET_LENGTH
+
+class LinkStats:
+    '''
+    接続ごとの回線の状態 (keep-aliveから測ったRTT、送信のスループット、送信キューの深さ)。
+    スループットは送信キューにデータが残っていた間 (回線が律速していた間) だけを計測する。
+    '''
+    # 指数移動平均の重み
+    SMOOTHING = 0.3
+
+    def __init__(self):
+        self.rtt: float = None # 秒
+        self.throughput: float = None # バイト/秒
+        self.queue_depth = 0 # バイト
+        self._last_sample: tuple[float, int] = None # (時刻, 送信済みバイト数の累計)
+
+    def _smooth(self, current: float | None, sample: float) -> float:
+        return sample if current is None else current + self.SMOOTHING * (sample - current)
+
+    def record_rtt(self, rtt: float):
+        self.rtt = self._smooth(self.rtt, rtt)
+
+    def sample(self, bytes_sent: int, queue_depth: int, now: float = None):
+        # 送信済みバイト数の累計と送信キューの深さを記録する
+        now = time.monotonic() if now is None else now
+        if self._last_sample is not None and self.queue_depth > 0:
+            # 前回から送信キューが空にならなかった場合は回線の速度で送信されている
+            elapsed = now - self._last_sample[0]
+            if elapsed > 0:
+                self.throughput = self._smooth(self.throughput, (bytes_sent - self._last_sample[1]) / elapsed)
+        self._last_sample = (now, bytes_sent)
+        self.queue_depth = queue_depth
+
+    def snapshot(self) -> dict:
+        return {
+            'rtt_ms': None if self.rtt is None else self.rtt * 1000,
+            'throughput': self.throughput,
+            'queue_depth': self.queue_depth,
+        }
+
+class AdaptiveCompression:
+    '''
+    回線の状態から接続ごとの圧縮のしきい値とレベルを決める (全接続で共有)。
+    LANのような速い回線ではサーバーのCPUを使わないようにしきい値を上げてレベルを下げ、
+    RTTが大きい、スループットが低い、または送信キューが溜まっている遅い回線ではしきい値を下げてレベルを上げる。
+    しきい値はログイン時に設定したしきい値より下げることはできない (それ未満のパケットは圧縮できないため)。
+    上限はパケットの最大長までとし、圧縮せずに送るフレームがプロトコルの上限を超えないようにする。
+    '''
+    # この値以下のRTTは速い回線、上の値以上は遅い回線とみなす (秒)
+    FAST_RTT = 0.005
+    SLOW_RTT = 0.150
+    # このスループット (バイト/秒) を下回る回線は遅い回線とみなす
+    SLOW_THROUGHPUT = 1024 * 1024
+    # 送信キューがこの深さ (バイト) まで溜まった回線は遅い回線とみなす
+    QUEUE_TARGET = 256 * 1024
+
+    def __init__(self, max_threshold: int = 1048576, min_level: int = 1, max_level: int = 9):
+        # しきい値未満のパケットは データ長(0) + パケットID + データ をそのまま送るので、パケット長はしきい値以下になる
+        self.max_threshold = min(max_threshold, MAX_PACKET_LENGTH)
+        self.min_level = min_level
+        self.max_level = max_level
+
+    def congestion(self, link: LinkStats) -> float:
+        # 回線が律速している度合い (0: 速い回線 - 1: 遅い回線)
+        scores = [min(1.0, link.queue_depth / self.QUEUE_TARGET)]
+        if link.rtt is not None:
+            scores.append((link.rtt - self.FAST_RTT) / (self.SLOW_RTT - self.FAST_RTT))
+        if link.throughput:
+            scores.append(self.SLOW_THROUGHPUT / link.throughput)
+        return max(0.0, min(1.0, max(scores)))
+
+    def tune(self, con_state):
+        # con_stateの送信時のしきい値と圧縮レベルを更新する
+        if con_state.compression_threshold < 0:
+            return
+        congestion = self.congestion(con_state.link)
+        # しきい値は対数スケールで補間する
+        min_threshold = max(con_state.compression_threshold, 1)
+        max_threshold = max(min_threshold, self.max_threshold)
+        con_state.send_threshold = int(min_threshold * (max_threshold / min_threshold) ** (1 - congestion))
+        con_state.compression_level = round(self.min_level + congestion * (self.max_level - self.min_level))
@@ -1,6 +1,5 @@
 
 from abc import ABC, abstractmethod
-import threading
 
 from networking.enum import JEPacketConnectionState
 
@@ -28,6 +27,15 @@ class ServerboundPacket(Packet):
     def handle(self, con_state) -> 'ClientboundPacket':
         # パケットの処理を実装
         pass
+
+    @classmethod
+    def handle_batch(cls, batch: list[tuple['ServerboundPacket', object]]):
+        # PLAY状態のパケットはティックスレッドで種類ごとにまとめて処理される
+        # (パケット, con_state)のリストを受け取り、まとめて処理できる場合はオーバーライドする
+        for packet, con_state in batch:
+            outgoing_packet = packet.handle(con_state)
+            if outgoing_packet is not None:
+                con_state.send(outgoing_packet)
     
     @classmethod
     @abstractmethod
@@ -36,24 +44,22 @@ class ServerboundPacket(Packet):
         pass
     
 class ClientboundPacket(Packet):
+    # 送信が詰まっている接続へは送らずに捨ててよいパケット (次の更新で置き換わる位置の更新など)
+    droppable = False
+
     # クライアント行きパケットを返信可能にするデコレータ
-    @classmethod
+    # 返信の待機はConnection.queue_packetが返すFutureで行う (networking.reply.ReplyCorrelator)
+    @staticmethod
     def repliable(*repliable_packet_types):
         def wrapper(cls):
             cls._repliable_packets = repliable_packet_types # 返信待ちをするパケットのクラス
-            cls._reply_arrived_flag = threading.Event() # 返信が来たかどうかのフラグ
-            cls._timeout_flag = threading.Event() # タイムアウトしたかどうかのフラグ
-            cls._reply = None # 返信内容を格納する変数
-            # 返信を待つための関数
-            def wait_for_reply(self, timeout=5):
-                if not self._reply_arrived_flag.wait(timeout):
-                    self._timeout_flag.set()
-                    None
-                return self._reply
-            cls.wait_for_reply = wait_for_reply
             return cls
         return wrapper
     # サーバーからクライアントへ送信されるパケットの基底クラス
     def to_bytes(self, con_state): # -> PacketBuffer:
         # パケットをバイト列に変換
+        pass
+
+    def on_written(self, con_state):
+        # パケットが送信キューへ積まれた直後に呼ばれる (以降のパケットのフレーム化に影響する設定の変更など)
         pass
\ No newline at end of file
@@ -4,7 +4,6 @@ import json
 
 import nbtlib
 
-from core.logger import logger
 
 from networking.mcpacket import ClientboundPacket
 from networking.mcpacket.io import JEPacketBuffer
@@ -69,11 +68,9 @@ class CRegistryData(ClientboundPacket):
             # data
             packet_buffer.write_boolean(value is not None)
             if value is not None:
-                data = io.BytesIO()
-                value.write(data)
-                logger.debug(f'Sending: {data.getvalue().hex()}')
                 packet_buffer.write_uint8(0x0a)
-                packet_buffer.write(data.getvalue())
+                # NBTはパケットバッファへ直接書き込む
+                value.write(packet_buffer)
         return packet_buffer
 
 @ClientboundPacket.repliable(config.SKnownPacks)
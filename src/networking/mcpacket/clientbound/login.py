@@ -4,7 +4,7 @@ import io
 
 import nbtlib
 
-from networking.mcpacket import ClientboundPacket
+from networking.mcpacket import ClientboundPacket, schema
 from networking.mcpacket.io import JEPacketBuffer
 
 class CDisconnect(ClientboundPacket):
@@ -23,6 +23,12 @@ class CDisconnect(ClientboundPacket):
         packet_buffer.write(buffer.getvalue())
         return packet_buffer
     
+@schema.packet_fields(
+    ('server_id', schema.String(20)), # Server ID (バニラは未使用)
+    ('_public_der', schema.PrefixedBytes()), # 公開鍵
+    ('_verify_token', schema.PrefixedBytes()), # 認証トークン
+    ('should_authenticate', schema.Boolean), # クライアントがアカウント認証するかどうか
+)
 class CEncryptionRequest(ClientboundPacket):
     def __init__(self, public_der: bytes, verify_token: bytes, should_authenticate: bool = True, server_id: str = None):
         self._public_der = public_der
@@ -34,22 +40,9 @@ class CEncryptionRequest(ClientboundPacket):
     def packet_id(self):
         return 0x01
 
-    def to_bytes(self, con_state):
-        packet_buffer = JEPacketBuffer()
-        # Server ID (バニラは未使用)
-        packet_buffer.write_utf8_string(self.server_id, 20)
-        # 公開鍵
-        packet_buffer.write_varint(len(self._public_der))
-        packet_buffer.write(self._public_der)
-        # 認証トークン
-        packet_buffer.write_varint(len(self._verify_token))
-        packet_buffer.write(self._verify_token)
-        # クライアントがアカウント認証するかどうか (con_stateの値に依存)
-        packet_buffer.write_boolean(self.should_authenticate)
-        return packet_buffer
-
 class CLoginSuccess(ClientboundPacket):
-    def __init__(self, profile_id: uuid.UUID, player_name: str, property_name: str, value: str, signature: str):
+    def __init__(self, profile_id: uuid.UUID, player_name: str, property_name: str = None, value: str = None, signature: str = None):
+        # property_nameがNoneの場合はプロパティなし (オフラインモード)
         self.uuid = profile_id
         self.username = player_name
         self.property_name = property_name
@@ -65,6 +58,9 @@ class CLoginSuccess(ClientboundPacket):
         packet_buffer.write_uuid(self.uuid)
         packet_buffer.write_utf8_string(self.username, 16)
         # プロパティ
+        if self.property_name is None:
+            packet_buffer.write_varint(0)
+            return packet_buffer
         packet_buffer.write_varint(1)
         packet_buffer.write_utf8_string(self.property_name, 64)
         packet_buffer.write_utf8_string(self.value, 32767)
@@ -72,4 +68,18 @@ class CLoginSuccess(ClientboundPacket):
         if self.signature:
             # 署名がある場合は書き込む
             packet_buffer.write_utf8_string(self.signature, 1024)
-        return packet_buffer
\ No newline at end of file
+        return packet_buffer
+
+@schema.packet_fields(('threshold', schema.VarInt))
+class CSetCompression(ClientboundPacket):
+    def __init__(self, threshold: int):
+        # しきい値以上のサイズのパケットを圧縮する (負の値は圧縮なし)
+        self.threshold = threshold
+
+    @property
+    def packet_id(self):
+        return 0x03
+
+    def on_written(self, con_state):
+        # このパケット自体は圧縮なしで送り、以降のパケットから圧縮プロトコルでフレーム化する
+        con_state.compression_threshold = self.threshold
@@ -3,9 +3,10 @@ import io
 
 import nbtlib
 
-from networking.mcpacket import ClientboundPacket
+from networking.mcpacket import ClientboundPacket, schema
 from networking.mcpacket.io import JEPacketBuffer
 from networking.enum import JEPacketConnectionState
+import networking.mcpacket.serverbound.play as play
 
 class CDisconnect(ClientboundPacket):
     def __init__(self, reason: str):
@@ -24,4 +25,14 @@ class CDisconnect(ClientboundPacket):
         # insert 0x08 (string type)
         packet_buffer.write_int8(0x08)
         packet_buffer.write(nbt_bytes.getvalue())
-        return packet_buffer
\ No newline at end of file
+        return packet_buffer
+
+@ClientboundPacket.repliable(play.SKeepAlive)
+@schema.packet_fields(('keep_alive_id', schema.Int64))
+class CKeepAlive(ClientboundPacket):
+    def __init__(self, keep_alive_id: int):
+        self.keep_alive_id = keep_alive_id
+
+    @property
+    def packet_id(self):
+        return 0x26
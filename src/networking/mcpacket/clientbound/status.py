@@ -1,7 +1,7 @@
 
 import json
 
-from networking.mcpacket import ClientboundPacket
+from networking.mcpacket import ClientboundPacket, schema
 from networking.mcpacket.io import JEPacketBuffer
 
 class CStatusResponse(ClientboundPacket):
@@ -29,18 +29,14 @@ class CStatusResponse(ClientboundPacket):
     def to_bytes(self, con_state):
         packet_buffer = JEPacketBuffer()
         # JSONデータをUTF-8文字列として書き込む
-        packet_buffer.write_utf8_string(json.dumps(self.json_data), 32767)
+        packet_buffer.write_utf8_string(json.dumps(self.json_data, separators=(',', ':')), 32767)
         return packet_buffer
 
+@schema.packet_fields(('timestamp', schema.Int64))
 class CPongResponse(ClientboundPacket):
     def __init__(self, timestamp: int):
         self.timestamp = timestamp
 
     @property
     def packet_id(self):
-        return 0x01
-    
-    def to_bytes(self, con_state):
-        packet_buffer = JEPacketBuffer()
-        packet_buffer.write_int64(self.timestamp)
-        return packet_buffer
\ No newline at end of file
+        return 0x01
\ No newline at end of file
@@ -0,0 +1,115 @@
+import struct
+
+# プロトコルのプリミティブ型に対応するコンパイル済みstruct.Struct
+# フォーマット文字列の組み立てと解析を呼び出しごとに行わないためにモジュール読み込み時に生成する
+INT8 = struct.Struct('>b')
+UINT8 = struct.Struct('>B')
+INT16_BE, INT16_LE = struct.Struct('>h'), struct.Struct('<h')
+UINT16_BE, UINT16_LE = struct.Struct('>H'), struct.Struct('<H')
+INT32_BE, INT32_LE = struct.Struct('>i'), struct.Struct('<i')
+INT64_BE, INT64_LE = struct.Struct('>q'), struct.Struct('<q')
+FLOAT_BE, FLOAT_LE = struct.Struct('>f'), struct.Struct('<f')
+DOUBLE_BE, DOUBLE_LE = struct.Struct('>d'), struct.Struct('<d')
+
+# 1バイトで表現できるvarintは事前に生成しておく
+_SMALL_VARINTS = [bytes([i]) for i in range(0x80)]
+
+def encode_varint(value: int) -> bytes:
+    # 可変長整数をバイト列に変換する (負の値は32bitの2の補数として扱う)
+    if 0 <= value < 0x80:
+        return _SMALL_VARINTS[value]
+    value &= 0xFFFFFFFF
+    if value < 0x4000:
+        return bytes(((value & 0x7F) | 0x80, value >> 7))
+    out = bytearray()
+    while value & ~0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def decode_varint(buffer, offset: int) -> tuple[int, int]:
+    # offsetの位置から可変長整数を読み取り、(値, 次の位置)を返す
+    try:
+        current_byte = buffer[offset]
+        if current_byte < 0x80:
+            return current_byte, offset + 1
+        value = current_byte & 0x7F
+        for shift in (7, 14, 21, 28):
+            offset += 1
+            current_byte = buffer[offset]
+            value |= (current_byte & 0x7F) << shift
+            if current_byte < 0x80:
+                break
+        else:
+            raise ValueError('Varint is too long')
+    except IndexError:
+        raise EOFError('Buffer underflow')
+    # 32bitの符号付き整数として解釈する
+    value &= 0xFFFFFFFF
+    if value & 0x80000000:
+        value -= 0x100000000
+    return value, offset + 1
+
+def encode_varlong(value: int) -> bytes:
+    # 可変長long整数をバイト列に変換する (負の値は64bitの2の補数として扱う)
+    if 0 <= value < 0x80:
+        return _SMALL_VARINTS[value]
+    value &= 0xFFFFFFFFFFFFFFFF
+    out = bytearray()
+    while value & ~0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def decode_varlong(buffer, offset: int) -> tuple[int, int]:
+    # offsetの位置から可変長long整数を読み取り、(値, 次の位置)を返す
+    value = 0
+    try:
+        for shift in range(0, 70, 7):
+            current_byte = buffer[offset]
+            offset += 1
+            value |= (current_byte & 0x7F) << shift
+            if current_byte < 0x80:
+                break
+        else:
+            raise ValueError('Varlong is too long')
+    except IndexError:
+        raise EOFError('Buffer underflow')
+    # 64bitの符号付き整数として解釈する
+    if value & 0x8000000000000000:
+        value -= 0x10000000000000000
+    return value, offset
+
+def utf16_length(string: str) -> int:
+    # UTF-16のコードユニット数 (BMP外の文字はサロゲートペアで2)
+    if string.isascii():
+        return len(string)
+    return len(string.encode('utf-16-le')) // 2
+
+def decode_string(buffer, offset: int, n: int = 32767) -> tuple[str, int]:
+    # offsetの位置からUTF-8文字列を読み取り、(文字列, 次の位置)を返す
+    if n > 32767:
+        raise ValueError('Maximum n value is 32767.')
+    byte_length, offset = decode_varint(buffer, offset)
+    if byte_length < 0 or byte_length > (n * 3) + 3:
+        raise ValueError(f'Invalid encoded string size: {byte_length}. Must be between 0 and {(n * 3) + 3} bytes.')
+    end = offset + byte_length
+    if end > len(buffer):
+        raise EOFError('Buffer underflow')
+    string = str(buffer[offset:end], 'utf-8')
+    if len(string) > n // 2 and utf16_length(string) > n:
+        raise ValueError(f'Decoded string exceeds maximum of {n} UTF-16 code units.')
+    return string, end
+
+def encode_string(string: str, n: int = 32767) -> bytes:
+    # UTF-8文字列を長さ(varint)付きのバイト列に変換する
+    if n > 32767:
+        raise ValueError('Maximum length is 32767')
+    if len(string) > n // 2 and utf16_length(string) > n:
+        raise ValueError(f"String exceeds maximum of {n} UTF-16 code units.")
+    utf8_bytes = string.encode('utf-8')
+    if len(utf8_bytes) > n * 3:
+        raise ValueError(f"Encoded UTF-8 string exceeds {n * 3} bytes.")
+    return encode_varint(len(utf8_bytes)) + utf8_bytes
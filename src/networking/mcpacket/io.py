@@ -1,16 +1,32 @@
 
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future
+from time import perf_counter_ns
 import zlib
-import struct
 import uuid 
 
-from networking.mcpacket import jepacket_class_registry
+from networking.mcpacket import jepacket_class_registry, ClientboundPacket
+from networking.mcpacket import codec
+from networking.mcpacket.codec import encode_varint
+from networking.compression import PacketCompressor
+from networking.capture import INBOUND, OUTBOUND
+from core.tracing import tracer
+from networking.metrics import metrics
+
+# 解凍後のパケットの最大サイズ (バニラと同じ)
+MAX_UNCOMPRESSED_LENGTH = 8388608
+# フレームの最大長 (パケット長は3バイトのvarintまで)
+MAX_PACKET_LENGTH = 2097151
+# con_stateが圧縮器を持たない場合に使う (スレッドプールなし)
+_default_compressor = PacketCompressor(workers=0)
 
 class Buffer:
-    def __init__(self, buffer: bytes | bytearray = None, read_only: bool = False):
+    def __init__(self, buffer: bytes | bytearray | memoryview = None, read_only: bool = False):
         # バッファの初期化
         if read_only:
-            self._buffer = bytes(buffer) if buffer is not None else bytes()
+            # 読み取り専用の場合はコピーせずにmemoryviewとして参照する
+            self._buffer = memoryview(buffer).cast('B') if buffer is not None else memoryview(b'')
         else:
             self._buffer = bytearray(buffer) if buffer is not None else bytearray()
         self._read_only = read_only
@@ -29,7 +45,13 @@ class Buffer:
         # バッファにデータを書き込む
         if self._read_only:
             raise TypeError('Buffer is read only')
-        self._buffer[self._position:self._position] = data if byte_order == 'big' else data[::-1]
+        if byte_order != 'big':
+            data = data[::-1]
+        if self._position == len(self._buffer):
+            # 終端への書き込みは追記のみ
+            self._buffer += data
+        else:
+            self._buffer[self._position:self._position] = data
         self._position += len(data)
 
     def mark(self):
@@ -67,175 +89,147 @@ class Buffer:
     def get_value(self):
         # バッファの内容を取得
         return bytes(self._buffer)
+
+    def getbuffer(self) -> memoryview:
+        # バッファの内容をコピーせずに参照する
+        return memoryview(self._buffer)
     
     def size(self):
         # バッファのサイズを取得
         return len(self._buffer)
 
 class JEPacketBuffer(Buffer):
-    def __init__(self, buffer: bytes | bytearray = None, read_only: bool = False):
+    def __init__(self, buffer: bytes | bytearray | memoryview = None, read_only: bool = False):
         super().__init__(buffer, read_only=read_only)
 
+    def _unpack(self, struct_codec, size: int):
+        # 現在位置から固定長の値を読み取る (中間のbytesを生成しない)
+        if self._position + size > len(self._buffer):
+            raise EOFError('Buffer underflow')
+        value = struct_codec.unpack_from(self._buffer, self._position)[0]
+        self._position += size
+        return value
+
     def read_boolean(self):
         # boolean値を読み取る
-        return self.read(1)[0] == 1
+        return self._unpack(codec.UINT8, 1) == 1
     
     def write_boolean(self, value: bool):
         # boolean値を書き込む
-        self.write(bytes([1 if value else 0]))
+        self.write(b'\x01' if value else b'\x00')
 
     def read_int8(self):
         # 符号付きbyteを読み取る (two's complement)
-        value = self.read(1)[0]
-        return value - 256 if value > 127 else value
+        return self._unpack(codec.INT8, 1)
 
     def write_int8(self, value: int):
         # 符号付きbyteを書き込む (two's complement)
         if not -128 <= value < 128:
             raise ValueError('Value must be between -128 and 127.')
-        self.write(bytes([value & 0xFF]))
+        self.write(codec.INT8.pack(value))
     
     def read_uint8(self):
         # 符号なしbyteを読み取る
-        return self.read(1)[0]
+        return self._unpack(codec.UINT8, 1)
     
     def write_uint8(self, value: int):
         # 符号なしbyteを書き込む
         if not 0 <= value < 256:
             raise ValueError('Value must be between 0 and 255.')
-        self.write(bytes([value]))
+        self.write(codec.UINT8.pack(value))
 
     def read_int16(self, byte_order='big'):
         # 符号付きshortを読み取る (two's complement)
-        value = struct.unpack(f'{">" if byte_order == "big" else "<"}h', self.read(2))[0]
-        return value
+        return self._unpack(codec.INT16_BE if byte_order == 'big' else codec.INT16_LE, 2)
     
     def write_int16(self, value: int, byte_order='big'):
         # 符号付きshortを書き込む (two's complement)
         if not -32768 <= value < 32768:
             raise ValueError('Value must be between -32768 and 32767.')
-        self.write(struct.pack(f'{">" if byte_order == "big" else "<"}h', value))
+        self.write((codec.INT16_BE if byte_order == 'big' else codec.INT16_LE).pack(value))
 
     def read_uint16(self, byte_order='big'):
         # 符号なしshortを読み取る
         if len(self._buffer) < 2:
             return None
-        value = struct.unpack(f'{">" if byte_order == "big" else "<"}H', self.read(2))[0]
-        return value
+        return self._unpack(codec.UINT16_BE if byte_order == 'big' else codec.UINT16_LE, 2)
 
     def write_uint16(self, value: int, byte_order='big'):
         # 符号なしshortを書き込む
         if not 0 <= value < 65536:
             raise ValueError('Value must be between 0 and 65535.')
-        self.write(struct.pack(f'{">" if byte_order == "big" else "<"}H', value))
+        self.write((codec.UINT16_BE if byte_order == 'big' else codec.UINT16_LE).pack(value))
 
     def read_int32(self, byte_order='big'):
         # 符号付きintを読み取る (two's complement)
         if len(self._buffer) < 4:
             return None
-        value = struct.unpack(f'{">" if byte_order == "big" else "<"}i', self.read(4))[0]
-        return value
+        return self._unpack(codec.INT32_BE if byte_order == 'big' else codec.INT32_LE, 4)
 
     def write_int32(self, value: int, byte_order='big'):
         # 符号付きintを書き込む (two's complement)
         if not -2147483648 <= value < 2147483648:
             raise ValueError('Value must be between -2147483648 and 2147483647.')
-        self.write(struct.pack(f'{">" if byte_order == "big" else "<"}i', value))
+        self.write((codec.INT32_BE if byte_order == 'big' else codec.INT32_LE).pack(value))
 
     def read_int64(self, byte_order='big'):
         # 符号付きlongを読み取る (two's complement)
         if len(self._buffer) < 8:
             return None
-        value = struct.unpack(f'{">" if byte_order == "big" else "<"}q', self.read(8))[0]
-        return value
+        return self._unpack(codec.INT64_BE if byte_order == 'big' else codec.INT64_LE, 8)
 
     def write_int64(self, value: int, byte_order='big'):
         # 符号付きlongを書き込む (two's complement)
         if not -9223372036854775808 <= value < 9223372036854775808:
             raise ValueError("Value must be between -9223372036854775808 and 9223372036854775807.")
-        self.write(struct.pack(f'{">" if byte_order == "big" else "<"}q', value))
+        self.write((codec.INT64_BE if byte_order == 'big' else codec.INT64_LE).pack(value))
 
     def read_float(self, byte_order='big'):
         # floatを読み取る (IEEE 754)
         if len(self._buffer) < 4:
             return None
-        value = struct.unpack(f'{">" if byte_order == "big" else "<"}f', self.read(4))[0]
-        return value
+        return self._unpack(codec.FLOAT_BE if byte_order == 'big' else codec.FLOAT_LE, 4)
 
     def write_float(self, value: float, byte_order='big'):
         # floatを書き込む (IEEE 754)
-        self.write(struct.pack(f'{">" if byte_order == "big" else "<"}f', value))
+        self.write((codec.FLOAT_BE if byte_order == 'big' else codec.FLOAT_LE).pack(value))
 
     def read_double(self, byte_order='big'):
         # doubleを読み取る (IEEE 754)
         if len(self._buffer) < 8:
             return None
-        value = struct.unpack(f'{">" if byte_order == "big" else "<"}d', self.read(8))[0]
-        return value
+        return self._unpack(codec.DOUBLE_BE if byte_order == 'big' else codec.DOUBLE_LE, 8)
 
     def write_double(self, value: float, byte_order='big'):
         # doubleを書き込む (IEEE 754)
-        self.write(struct.pack(f'{">" if byte_order == "big" else "<"}d', value))
+        self.write((codec.DOUBLE_BE if byte_order == 'big' else codec.DOUBLE_LE).pack(value))
 
     def read_utf8_string(self, n: int=32767) -> str:
         # UTF-8文字列を読み取る
-        if n > 32767:
-            raise ValueError('Maximum n value is 32767.')
-
-        byte_length = self.read_varint()
-        if byte_length < 1 or byte_length > (n * 3) + 3:
-            raise ValueError(f'Invalid encoded string size: {byte_length}. Must be between 1 and {(n * 3) + 3} bytes.')
-
-        utf8_bytes = self.read(byte_length)
-        string = utf8_bytes.decode('utf-8')
-
-        # Validate the number of UTF-16 code units in the decoded string
-        utf16_code_units = sum(1 + (ord(ch) > 0xFFFF) for ch in string)
-        if utf16_code_units > n:
-            raise ValueError(f'Decoded string exceeds maximum of {n} UTF-16 code units.')
-
+        string, self._position = codec.decode_string(self._buffer, self._position, n)
         return string
     
     def write_utf8_string(self, string: str, n: int=32767):
-        if n > 32767:
-            raise ValueError('Maximum length is 32767')
-        
-        utf16_code_units = sum(1 + (ord(ch) > 0xFFFF) for ch in string)
-        if utf16_code_units > n:
-            raise ValueError(f"String exceeds maximum of {n} UTF-16 code units.")
-
-        utf8_bytes = string.encode('utf-8')
-        byte_length = len(utf8_bytes)
-
-        if byte_length > n * 3:
-            raise ValueError(f"Encoded UTF-8 string exceeds {n * 3} bytes.")
-
-        self.write_varint(byte_length)
-        self.write(utf8_bytes)
-
+        # UTF-8文字列を書き込む
+        self.write(codec.encode_string(string, n))
 
     def read_varint(self):
         # 可変長整数を読み取る
-        value = 0
-        position = 0
-
-        while True:
-            current_byte = self.read_uint8()
-            value |= (current_byte & 0x7F) << position
-            if (current_byte & 0x80) == 0:
-                break
-            position += 7
-            if position >= 32:
-                raise ValueError('Varint is too long')
+        value, self._position = codec.decode_varint(self._buffer, self._position)
         return value
     
     def write_varint(self, value: int):
-        while True:
-            if value & ~0x7F == 0:
-                self.write_uint8(value)
-                return
-            self.write_uint8((value & 0x7F) | 0x80) 
-            value >>= 7
+        # 可変長整数を書き込む
+        self.write(codec.encode_varint(value))
+
+    def read_varlong(self):
+        # 可変長long整数を読み取る
+        value, self._position = codec.decode_varlong(self._buffer, self._position)
+        return value
+
+    def write_varlong(self, value: int):
+        # 可変長long整数を書き込む
+        self.write(codec.encode_varlong(value))
 
     def read_uuid(self, byte_order='big') -> uuid.UUID:
         # UUIDを読み取る
@@ -248,12 +242,192 @@ class JEPacketBuffer(Buffer):
             raise TypeError('Value must be a UUID instance.')
         self.write(uuid_value.bytes if byte_order == 'big' else uuid_value.bytes_le)
 
+class FrameBuffer:
+    '''
+    受信データを事前に確保したバッファへrecv_intoで読み込み、パケットのフレームをその場で切り出すバッファ。
+    切り出したフレームはmemoryviewで返すため、受信データのコピーや先頭の削除によるシフトが発生しない。
+    返したmemoryviewは次にrecv_into/extendを呼ぶまでの間のみ有効。
+    '''
+    def __init__(self, capacity: int = 0x2000):
+        self._storage = bytearray(capacity)
+        self._view = memoryview(self._storage)
+        self._start = 0 # 未処理データの先頭
+        self._end = 0 # 未処理データの終端
+
+    def __len__(self):
+        return self._end - self._start
+
+    def _reserve(self, n: int):
+        # 終端にnバイト以上の空きを確保する
+        if len(self._storage) - self._end >= n:
+            return
+        pending = self._end - self._start
+        if len(self._storage) - pending >= n:
+            # 未処理データを先頭へ詰める (未処理分のみのコピー)
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # 容量が足りない場合は新しい領域を確保する
+            storage = bytearray(max(len(self._storage) * 2, pending + n))
+            storage[:pending] = self._view[self._start:self._end]
+            self._storage = storage
+            self._view = memoryview(storage)
+        self._start, self._end = 0, pending
+
+    def recv_into(self, client_socket, decryptor=None, min_size: int = 4096) -> int:
+        # ソケットから空き領域へ直接受信する
+        self._reserve(min_size)
+        received = client_socket.recv_into(self._view[self._end:])
+        if received and decryptor:
+            # 受信した範囲だけを復号化して書き戻す
+            chunk = self._view[self._end:self._end + received]
+            chunk[:] = decryptor.update(chunk)
+        self._end += received
+        return received
+
+    def extend(self, data):
+        # ソケットを介さずにデータを追加する
+        self._reserve(len(data))
+        self._view[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def next_frame(self) -> memoryview | None:
+        # 先頭のパケット長(varint)を読み、フレームが揃っていればその範囲を返す
+        try:
+            value, position = codec.decode_varint(self._view[:self._end], self._start)
+        except EOFError:
+            return None
+        if value < 0 or value > MAX_PACKET_LENGTH:
+            # 本体を待たずに拒否する (巨大な長さを宣言されてもバッファを確保しない)
+            raise ValueError(f'Invalid packet length: {value}')
+        if position + value > self._end:
+            return None
+        frame = self._view[position:position + value]
+        self._start = position + value
+        if self._start == self._end:
+            # 全て処理済みなら先頭から再利用する
+            self._start = self._end = 0
+        return frame
+
+    def clear(self):
+        self._start = self._end = 0
+
+class OutputQueue:
+    '''
+    送信待ちのセグメントを保持し、sendmsgでまとめて(scatter-gather)送信するキュー。
+    ソケットが一部しか送信できなかった場合は送信済みのオフセットを保持し、次のflushで続きから送信する。
+    '''
+    # 1回のsendmsgに渡すセグメント数の上限 (IOV_MAX未満)
+    MAX_SEGMENTS = 512
+
+    def __init__(self):
+        self._pending = [] # 暗号化前のセグメント
+        self._wire = deque() # 送信可能なセグメント
+        self._offset = 0 # 先頭セグメントの送信済みバイト数
+        self._size = 0 # 未送信の合計バイト数
+        self.sent = 0 # 送信済みの合計バイト数
+
+    def __len__(self):
+        return self._size
+
+    def append(self, segment):
+        # segmentはバイト列、またはバイト列を返すFuture (スレッドプールで圧縮中のフレーム)
+        if isinstance(segment, Future):
+            self._pending.append(segment)
+            return
+        if len(segment) == 0:
+            return
+        self._pending.append(segment)
+        self._size += len(segment)
+
+    def waiting(self) -> Future | None:
+        # 圧縮が終わっていないために送信できないFutureを返す
+        if self._pending and isinstance(self._pending[0], Future) and not self._pending[0].done():
+            return self._pending[0]
+        return None
+
+    def flush(self, client_socket, encryptor=None) -> bool:
+        # 送信できるだけ送信し、全て送信し終えたかどうかを返す
+        if self._pending:
+            # 暗号化はキューに積まれた順に行う (AES-CFB8はストリーム暗号のため)
+            # 圧縮が終わっていないフレームがあればそれ以降は次のflushまで待つ
+            start = perf_counter_ns() if metrics.enabled else 0
+            pending = self._pending
+            ready = 0
+            for segment in pending:
+                if isinstance(segment, Future):
+                    if not segment.done():
+                        break
+                    segment = segment.result()
+                    self._size += len(segment)
+                self._wire.append(encryptor.update(segment) if encryptor else segment)
+                ready += 1
+            self._pending = pending[ready:] if ready < len(pending) else []
+            if start and encryptor and ready:
+                metrics.observe('encrypt', None, None, perf_counter_ns() - start)
+        if not self._wire:
+            return not self._pending
+        if not metrics.enabled:
+            return self._send(client_socket) and not self._pending
+        start = perf_counter_ns()
+        sent_all = self._send(client_socket)
+        metrics.observe('flush', None, None, perf_counter_ns() - start)
+        return sent_all and not self._pending
+
+    def _send(self, client_socket) -> bool:
+        # 暗号化済みのセグメントを送信できるだけ送信し、全て送信し終えたかどうかを返す
+        while self._wire:
+            buffers = []
+            for segment in self._wire:
+                buffers.append(memoryview(segment)[self._offset:] if not buffers else segment)
+                if len(buffers) >= self.MAX_SEGMENTS:
+                    break
+            requested = sum(len(buffer) for buffer in buffers)
+            try:
+                if hasattr(client_socket, 'sendmsg'):
+                    sent = client_socket.sendmsg(buffers)
+                else:
+                    sent = client_socket.send(buffers[0])
+                    requested = len(buffers[0])
+            except (BlockingIOError, InterruptedError):
+                return False
+            self._consume(sent)
+            if sent < requested:
+                # ソケットの送信バッファが一杯
+                return False
+        return True
+
+    def _consume(self, sent: int):
+        self._size -= sent
+        self.sent += sent
+        while sent > 0:
+            remaining = len(self._wire[0]) - self._offset
+            if sent < remaining:
+                self._offset += sent
+                return
+            sent -= remaining
+            self._wire.popleft()
+            self._offset = 0
+
+    def clear(self):
+        self._pending = []
+        self._wire.clear()
+        self._offset = 0
+        self._size = 0
+
 class PacketWrapper(ABC):
     def __init__(self, client_socket, byte_order='big'):
         self._client_socket = client_socket
         self._byte_order = byte_order
-        self._input_buffer = bytearray()
-        self._output_buffer = None
+        self._input_buffer = FrameBuffer()
+        self._output_queue = OutputQueue()
+        # パケットのキャプチャ (networking.capture.CaptureWriter、Noneは記録しない)
+        self.capture = None
+        self.capture_id = 0
+        # 送信待ちバイト数のハイウォーターマーク (Noneは無制限)
+        self.high_water_mark = None
+        self._congested = False
+        # 受信した合計バイト数
+        self.bytes_in = 0
 
     @abstractmethod
     def read_packet(self):
@@ -265,30 +439,44 @@ class PacketWrapper(ABC):
     
     def recv_to_buffer(self, decryptor):
         # この時点でクライアントソケットにデータが存在していることを前提とする
-        data = self._client_socket.recv(4096)
-        if data == b'':
+        received = self._input_buffer.recv_into(self._client_socket, decryptor)
+        if received == 0:
             return -1  # ソケットが閉じられた場合は-1を返す
-        if decryptor:
-            # データを復号化する
-            data = decryptor.update(data)
-        self._input_buffer.extend(data)
+        self.bytes_in += received
         return 0
+
+    @property
+    def bytes_out(self) -> int:
+        # 送信済みの合計バイト数
+        return self._output_queue.sent
     
     def clear_input_buffer(self):
         # 入力バッファをクリアする
-        del self._input_buffer[:]
+        self._input_buffer.clear()
     
-    def flush(self, encryptor):
-        if self._output_buffer is None:
-            raise ValueError("Output buffer is not initialized.")
-        packet_content = self._output_buffer.get_value()
-        if packet_content == b'':
-            return
-        if encryptor:
-            # データを暗号化する
-            packet_content = encryptor.update(packet_content)
-        self._output_buffer.clear()
-        self._client_socket.send(packet_content)
+    def flush(self, encryptor) -> bool:
+        # 送信待ちのデータを送信し、全て送信できたかどうかを返す
+        if tracer.recording and len(self._output_queue):
+            # 送信するデータがあるときだけ記録する (selectのループは毎回flushを呼ぶため)
+            with tracer.span('flush', 'network', bytes=len(self._output_queue)):
+                return self._output_queue.flush(self._client_socket, encryptor)
+        return self._output_queue.flush(self._client_socket, encryptor)
+
+    def waiting(self) -> Future | None:
+        # 送信キューの先頭で圧縮を待っているFuture
+        return self._output_queue.waiting()
+
+    def pending_bytes(self) -> int:
+        # 未送信のバイト数
+        return len(self._output_queue)
+
+    def congested(self) -> bool:
+        # 未送信データがハイウォーターマークを超えたら混雑状態とし、半分まで捌けたら解除する
+        if self.high_water_mark is None:
+            return False
+        limit = self.high_water_mark // 2 if self._congested else self.high_water_mark
+        self._congested = len(self._output_queue) > limit
+        return self._congested
 
     def fileno(self):
         return self._client_socket.fileno()
@@ -300,72 +488,175 @@ class PacketWrapper(ABC):
 class JEPacketWrapper(PacketWrapper):
     def __init__(self, client_socket, byte_order='big'):
         super().__init__(client_socket, byte_order)
-        self._output_buffer = JEPacketBuffer()
 
     def read_packet(self, con_state):
-        # 最低パケットサイズに満たない場合はNoneを返す
-        if len(self._input_buffer) < 1:
-            return None
-        packet_buffer = JEPacketBuffer(self._input_buffer, read_only=True)
-        length = packet_buffer.read_varint() # パケット長を取得
-        expected_length = packet_buffer._position + length
-        # バッファの長さを確認
-        if expected_length > len(self._input_buffer):
+        # フレームが揃っていない場合はNoneを返す
+        frame = self._input_buffer.next_frame()
+        if frame is None:
             return None
-        # input_bufferからパケット長に応じたデータを削除 (データ同期)
-        del self._input_buffer[:expected_length]
-        if con_state.compression_threshold < 0:
-            ### 圧縮プロトコル無効 ###
-            packet_payload = packet_buffer.read(length) # パケットのペイロードを取得 (パケットID + データ)
-            # パケットクラスに渡すバッファを再構築
-            packet_buffer = JEPacketBuffer(packet_payload, read_only=True)
-        else:
+        # フレーム(パケットID + データ)をコピーせずにそのまま参照する
+        packet_buffer = JEPacketBuffer(frame, read_only=True)
+        if con_state.compression_threshold >= 0:
             ### 圧縮プロトコル有効 ###
-            packet_buffer.mark() # マーク位置を設定 (packet_length=パケット全体の長さ=サイズ+パケットID+データの為)
             data_length = packet_buffer.read_varint() # パケットの長さを取得 (非圧縮の場合は0)
-            packet_buffer.rewind() # マーク位置に戻る
-            payload_buffer = packet_buffer.read(length) # パケット全体を取得 (サイズ+パケットID+データ)
-            # バッファを再構築 + ポインタ調整
-            packet_buffer = JEPacketBuffer(payload_buffer, read_only=True)
-            packet_buffer.read_varint() # サイズ(data_length)を読み飛ばす
             if data_length > 0: # 非圧縮(data_length == 0)の場合は解凍しない
-                # 圧縮されたデータを読み取る
-                compressed_data = packet_buffer.remaining_bytes()
+                # しきい値未満のパケットが圧縮されている、または解凍後のサイズが上限を超える場合はプロトコルエラー
+                if data_length < con_state.compression_threshold or data_length > MAX_UNCOMPRESSED_LENGTH:
+                    raise ValueError(f'Badly compressed packet: data length {data_length}')
                 # 圧縮されたデータを解凍してパケットデータを取得
-                uncompressed_data = zlib.decompress(compressed_data)
+                # 解凍後のサイズはdata_lengthまでに制限する (申告より大きく膨らむデータを全て解凍しない)
+                inflater = zlib.decompressobj()
+                uncompressed_data = inflater.decompress(frame[packet_buffer._position:], data_length)
+                if inflater.unconsumed_tail or not inflater.eof or len(uncompressed_data) != data_length:
+                    raise ValueError(f'Badly compressed packet: expected {data_length} bytes')
                 # 解凍されたデータをパケットバッファとして再構築
                 packet_buffer = JEPacketBuffer(uncompressed_data, read_only=True)
+        state = con_state.get_state()
+        if self.capture is not None:
+            self.capture.record(self.capture_id, INBOUND, state, packet_buffer._buffer[packet_buffer._position:])
         packet_id = packet_buffer.read_varint() # パケットIDを取得
-        ServerboundPacket = jepacket_class_registry.get((con_state.get_state(), packet_id)) # 接続ステート+パケットIDを参照にパケットクラスを取得
+        ServerboundPacket = jepacket_class_registry.get((state, packet_id)) # 接続ステート+パケットIDを参照にパケットクラスを取得
         if not ServerboundPacket:
             # サーバーが無効なパケットを受信した場合はプロトコルエラー
-            raise ValueError(f'Invalid packet: {(con_state.get_state(), packet_id)}')
-        return ServerboundPacket.from_bytes(packet_buffer) # パケットクラスのインスタンスを生成して返却
+            raise ValueError(f'Invalid packet: {(state, packet_id)}')
+        if not metrics.enabled:
+            return ServerboundPacket.from_bytes(packet_buffer) # パケットクラスのインスタンスを生成して返却
+        start = perf_counter_ns()
+        packet = ServerboundPacket.from_bytes(packet_buffer)
+        metrics.observe('decode', state, packet_id, perf_counter_ns() - start)
+        metrics.count_packet('in', state, packet_id, len(packet_buffer._buffer))
+        return packet
 
     def write_packet(self, client_bound_packet, con_state):
-        # パケットクラスからバッファを取得 (パケットID + データ)
-        packet_buffer = client_bound_packet.to_bytes(con_state) 
-        packet_buffer.flip()
-        packet_buffer.write_varint(client_bound_packet.packet_id) # パケットIDを書き込む
-        # 圧縮プロトコルのしきい値を取得
-        compression_threshold = con_state.compression_threshold
-        if compression_threshold >= 0: # 圧縮プロトコルが有効な場合
-            if packet_buffer.size() >= compression_threshold: # パケットがしきい値を超える場合は圧縮する
-                # 非圧縮のパケット長を取得
-                uncompressed_length = packet_buffer.size() 
-                # zlibで圧縮する
-                compressed = zlib.compress(packet_buffer.get_value())
-                # 圧縮されたデータでバッファを再構築
-                packet_buffer = JEPacketBuffer(compressed) 
-                # 圧縮前のパケット長を先頭に書き込む
-                packet_buffer.flip()
-                packet_buffer.write_varint(uncompressed_length) 
-            else: 
-                # 圧縮しない場合はパケット長を0に設定 
-                packet_buffer.flip()
-                packet_buffer.write_varint(0) 
-        # パケット全体の長さを取得
-        length = packet_buffer.size() 
-        # パケットデータを書き込む
-        self._output_buffer.write_varint(length)
-        self._output_buffer.write(packet_buffer.get_value()) 
+        if isinstance(client_bound_packet, PreEncodedPacket):
+            # エンコード済みのパケットはバイト列をそのまま送信キューへ追加する
+            self._output_queue.append(client_bound_packet.frame(con_state))
+            if metrics.enabled:
+                metrics.count_packet('out', con_state.get_state(), client_bound_packet.packet_id, client_bound_packet.uncompressed_length)
+            if self.capture is not None:
+                self.capture.record(self.capture_id, OUTBOUND, con_state.get_state(), b''.join(client_bound_packet._payload))
+        else:
+            capture = None
+            if self.capture is not None:
+                state = con_state.get_state()
+                capture = lambda packet_id, payload: self.capture.record(self.capture_id, OUTBOUND, state, bytes(packet_id) + bytes(payload))
+            for segment in frame_packet(client_bound_packet, con_state, capture=capture):
+                self._output_queue.append(segment)
+        client_bound_packet.on_written(con_state)
+
+def frame_packet(client_bound_packet, con_state, offload: bool = True, capture=None) -> list:
+    # パケットをフレーム(パケット長 + [データ長] + パケットID + データ)のセグメントのリストに変換する
+    # captureを指定した場合はエンコードしたパケットID + データをcapture(packet_id, payload)へ渡す
+    # パケットIDや長さを先頭へ挿入するとペイロード全体がシフトされるため、
+    # ヘッダーは別のセグメントとして組み立てる (ペイロードはコピーしない)
+    if metrics.enabled:
+        state = con_state.get_state()
+        start = perf_counter_ns()
+        payload = client_bound_packet.to_bytes(con_state).getbuffer()
+        metrics.observe('encode', state, client_bound_packet.packet_id, perf_counter_ns() - start)
+        packet_id = encode_varint(client_bound_packet.packet_id)
+        metrics.count_packet('out', state, client_bound_packet.packet_id, len(packet_id) + len(payload))
+    else:
+        payload = client_bound_packet.to_bytes(con_state).getbuffer()
+        packet_id = encode_varint(client_bound_packet.packet_id)
+    if capture is not None:
+        capture(packet_id, payload)
+    return frame_payload(packet_id, payload, con_state, offload)
+
+def frame_payload(packet_id: bytes, payload, con_state, offload: bool = True) -> list:
+    # エンコード済みのパケットID + データをフレーム化する
+    segments = [packet_id, payload]
+    uncompressed_length = len(packet_id) + len(payload)
+    if con_state.compression_threshold >= 0: # 圧縮プロトコルが有効な場合
+        compressor = getattr(con_state, 'compressor', None) or _default_compressor
+        level = compression_level(con_state, compressor, uncompressed_length)
+        if level is not None: # パケットがしきい値を超える場合は圧縮する
+            metric_key = (con_state.get_state(), codec.decode_varint(packet_id, 0)[0]) if metrics.enabled else None
+            if offload and compressor.should_offload(uncompressed_length):
+                # 大きなパケットはスレッドプールで圧縮し、フレーム全体を返すFutureを送信キューへ積む
+                return [compressor.submit(_frame_compressed, compressor, segments, uncompressed_length, level, metric_key)]
+            return _frame_compressed(compressor, segments, uncompressed_length, level, metric_key, False)
+        # 圧縮しない場合はパケット長を0に設定
+        segments.insert(0, b'\x00')
+    # パケット全体の長さを先頭に置く
+    segments.insert(0, encode_varint(sum(len(segment) for segment in segments)))
+    return segments
+
+def compression_level(con_state, compressor, uncompressed_length: int) -> int | None:
+    # 圧縮プロトコルが有効な接続で、パケットを圧縮する場合は圧縮レベルを、圧縮しない場合はNoneを返す
+    # 接続ごとの送信時のしきい値(send_threshold)はログイン時に設定したしきい値より下げない
+    threshold = max(con_state.compression_threshold, getattr(con_state, 'send_threshold', -1))
+    if uncompressed_length < threshold:
+        return None
+    level = getattr(con_state, 'compression_level', None)
+    return compressor.level if level is None else level
+
+def _frame_compressed(compressor, segments: list, uncompressed_length: int, level: int, metric_key: tuple, offloaded: bool = True):
+    # パケットIDとペイロードを連結せずにストリームとして圧縮し、圧縮前のパケット長とパケット全体の長さを先頭に置く
+    data_length = encode_varint(uncompressed_length)
+    if metric_key is None:
+        compressed = compressor.compress(segments, offloaded, level)
+    else:
+        start = perf_counter_ns()
+        compressed = compressor.compress(segments, offloaded, level)
+        metrics.observe('compress', *metric_key, perf_counter_ns() - start)
+    frame = [encode_varint(len(data_length) + len(compressed)), data_length, compressed]
+    # スレッドプールで圧縮した場合は1つのバイト列として返す
+    return b''.join(frame) if offloaded else frame
+
+class PreEncodedPacket(ClientboundPacket):
+    '''
+    全てのクライアントに対して同じバイト列になるパケットを、フレーム化(+圧縮)済みのバイト列としてキャッシュするラッパー。
+    キャッシュは圧縮の有無と圧縮レベルごとに保持するため、同じパケットのエンコードと圧縮は接続数に関わらず一度だけ行われる。
+    ラップするパケットのto_bytesはcon_stateに依存してはならない。
+    '''
+    def __init__(self, packet: ClientboundPacket):
+        self.packet = packet
+        self._payload = None # (パケットID, データ)
+        self._frames: dict[tuple, bytes] = {}
+        # ラップしたパケットがrepliableであれば返信の対応付けも引き継ぐ
+        if hasattr(packet, '_repliable_packets'):
+            self._repliable_packets = packet._repliable_packets
+
+    @property
+    def packet_id(self):
+        return self.packet.packet_id
+
+    @property
+    def droppable(self):
+        return self.packet.droppable
+
+    def to_bytes(self, con_state):
+        return self.packet.to_bytes(con_state)
+
+    def on_written(self, con_state):
+        # 送信キューへ積んだ後の処理は接続ごとにラップしたパケットへ任せる
+        self.packet.on_written(con_state)
+
+    @property
+    def uncompressed_length(self) -> int:
+        # パケットID + データの長さ (frameを呼んだ後のみ)
+        packet_id, payload = self._payload
+        return len(packet_id) + len(payload)
+
+    def frame(self, con_state) -> bytes:
+        # 接続の圧縮設定に応じたフレームを返す (エンコードは初回のみ)
+        if self._payload is None:
+            start = perf_counter_ns() if metrics.enabled else 0
+            self._payload = (encode_varint(self.packet.packet_id), self.packet.to_bytes(con_state).get_value())
+            if start:
+                metrics.observe('encode', con_state.get_state(), self.packet.packet_id, perf_counter_ns() - start)
+        packet_id, payload = self._payload
+        if con_state.compression_threshold < 0:
+            key = (False, None)
+        else:
+            compressor = getattr(con_state, 'compressor', None) or _default_compressor
+            key = (True, compression_level(con_state, compressor, len(packet_id) + len(payload)))
+        framed = self._frames.get(key)
+        if framed is None:
+            framed = b''.join(frame_payload(packet_id, payload, con_state, offload=False))
+            self._frames[key] = framed
+        return framed
+
+    def __repr__(self):
+        return f'PreEncodedPacket({self.packet!r})'
@@ -0,0 +1,299 @@
+'''
+パケットのフィールドを宣言的に定義し、from_bytes/to_bytesをインポート時に生成する。
+連続する固定長フィールドは1つのstruct.Structにまとめて1回のunpack_from/packで処理する。
+
+    @ServerboundPacket.register_packet(JEPacketConnectionState.STATUS, 0x01)
+    @schema.packet_fields(('timestamp', schema.Int64))
+    class SPingRequest(ServerboundPacket):
+        ...
+
+フィールド名はそのままパケットのインスタンス属性名として使われる。
+from_bytesは__init__を経由せずに属性を設定したインスタンスを返す。
+'''
+import abc
+import struct
+import uuid
+
+from networking.mcpacket import codec
+from networking.mcpacket.io import JEPacketBuffer
+
+class FieldType(abc.ABC):
+    # 固定長の型はstructのフォーマット文字を持つ
+    format = None
+    # 生成コード内で固定長の値に適用する変換式 ({}に値が入る)
+    from_wire = None
+    to_wire = None
+
+    @abc.abstractmethod
+    def decode(self, buffer, offset: int):
+        # offsetの位置から値を読み取り、(値, 次の位置)を返す
+        pass
+
+    @abc.abstractmethod
+    def encode(self, value, out: bytearray):
+        # 値をoutへ追記する
+        pass
+
+    def decode_source(self, var: str, ref: str) -> str:
+        # 生成コード内でのデコード処理 (refは生成コードから見たこの型の名前)
+        return f'{var}, offset = {ref}.decode(buffer, offset)'
+
+    def encode_source(self, value: str, ref: str) -> str:
+        # 生成コード内でのエンコード処理
+        return f'{ref}.encode({value}, out)'
+
+class _Fixed(FieldType):
+    def __init__(self, format: str):
+        self.format = format
+        self._struct = struct.Struct('>' + format)
+
+    def decode(self, buffer, offset: int):
+        if offset + self._struct.size > len(buffer):
+            raise EOFError('Buffer underflow')
+        return self._struct.unpack_from(buffer, offset)[0], offset + self._struct.size
+
+    def encode(self, value, out: bytearray):
+        out += self._struct.pack(value)
+
+class _UUID(_Fixed):
+    # 16バイトの固定長として他の固定長フィールドとまとめて読み書きする
+    from_wire = '_UUID(bytes={})'
+    to_wire = '{}.bytes'
+
+    def __init__(self):
+        super().__init__('16s')
+
+    def decode(self, buffer, offset: int):
+        value, offset = super().decode(buffer, offset)
+        return uuid.UUID(bytes=value), offset
+
+    def encode(self, value, out: bytearray):
+        super().encode(value.bytes, out)
+
+class _VarInt(FieldType):
+    def decode(self, buffer, offset: int):
+        return codec.decode_varint(buffer, offset)
+
+    def encode(self, value, out: bytearray):
+        out += codec.encode_varint(value)
+
+    def decode_source(self, var: str, ref: str) -> str:
+        return f'{var}, offset = decode_varint(buffer, offset)'
+
+    def encode_source(self, value: str, ref: str) -> str:
+        return f'out += encode_varint({value})'
+
+class _VarLong(FieldType):
+    def decode(self, buffer, offset: int):
+        return codec.decode_varlong(buffer, offset)
+
+    def encode(self, value, out: bytearray):
+        out += codec.encode_varlong(value)
+
+    def decode_source(self, var: str, ref: str) -> str:
+        return f'{var}, offset = decode_varlong(buffer, offset)'
+
+    def encode_source(self, value: str, ref: str) -> str:
+        return f'out += encode_varlong({value})'
+
+class String(FieldType):
+    def __init__(self, n: int = 32767):
+        self.n = n
+
+    def decode(self, buffer, offset: int):
+        return codec.decode_string(buffer, offset, self.n)
+
+    def encode(self, value, out: bytearray):
+        out += codec.encode_string(value, self.n)
+
+    def decode_source(self, var: str, ref: str) -> str:
+        return f'{var}, offset = decode_string(buffer, offset, {self.n})'
+
+    def encode_source(self, value: str, ref: str) -> str:
+        return f'out += encode_string({value}, {self.n})'
+
+class PrefixedBytes(FieldType):
+    # 長さ(varint)付きのバイト列
+    def __init__(self, max_length: int = None):
+        self.max_length = max_length
+
+    def decode(self, buffer, offset: int):
+        length, offset = codec.decode_varint(buffer, offset)
+        if length < 0 or (self.max_length is not None and length > self.max_length):
+            raise ValueError(f'Invalid byte array length: {length}')
+        if offset + length > len(buffer):
+            raise EOFError('Buffer underflow')
+        return bytes(buffer[offset:offset + length]), offset + length
+
+    def encode(self, value, out: bytearray):
+        if self.max_length is not None and len(value) > self.max_length:
+            raise ValueError(f'Byte array exceeds maximum of {self.max_length} bytes.')
+        out += codec.encode_varint(len(value))
+        out += value
+
+class _RemainingBytes(FieldType):
+    # パケットの残り全て (最後のフィールドのみ)
+    def decode(self, buffer, offset: int):
+        return bytes(buffer[offset:]), len(buffer)
+
+    def encode(self, value, out: bytearray):
+        out += value
+
+class Optional(FieldType):
+    # 存在フラグ(boolean)付きのフィールド (存在しない場合はNone)
+    def __init__(self, field_type: FieldType):
+        self.field_type = field_type
+
+    def decode(self, buffer, offset: int):
+        present, offset = Boolean.decode(buffer, offset)
+        if not present:
+            return None, offset
+        return self.field_type.decode(buffer, offset)
+
+    def encode(self, value, out: bytearray):
+        out.append(value is not None)
+        if value is not None:
+            self.field_type.encode(value, out)
+
+class Array(FieldType):
+    # 要素数(varint)付きの配列
+    def __init__(self, field_type: FieldType):
+        self.field_type = field_type
+
+    def decode(self, buffer, offset: int):
+        count, offset = codec.decode_varint(buffer, offset)
+        if count < 0:
+            raise ValueError(f'Invalid array length: {count}')
+        field_type = self.field_type
+        if field_type.format and not field_type.from_wire:
+            # 固定長の要素は1回のunpack_fromでまとめて読み取る
+            array_struct = struct.Struct(f'>{count}{field_type.format}')
+            if offset + array_struct.size > len(buffer):
+                raise EOFError('Buffer underflow')
+            return list(array_struct.unpack_from(buffer, offset)), offset + array_struct.size
+        values = []
+        for _ in range(count):
+            value, offset = field_type.decode(buffer, offset)
+            values.append(value)
+        return values, offset
+
+    def encode(self, value, out: bytearray):
+        out += codec.encode_varint(len(value))
+        field_type = self.field_type
+        if field_type.format and not field_type.to_wire:
+            out += struct.pack(f'>{len(value)}{field_type.format}', *value)
+            return
+        for item in value:
+            field_type.encode(item, out)
+
+class Compound(FieldType):
+    # 複数フィールドの組 (dictとして読み書きする)
+    def __init__(self, *fields: tuple[str, FieldType]):
+        self.fields = fields
+
+    def decode(self, buffer, offset: int):
+        value = {}
+        for name, field_type in self.fields:
+            value[name], offset = field_type.decode(buffer, offset)
+        return value, offset
+
+    def encode(self, value, out: bytearray):
+        for name, field_type in self.fields:
+            field_type.encode(value[name], out)
+
+Boolean = _Fixed('?')
+Int8 = _Fixed('b')
+UInt8 = _Fixed('B')
+Int16 = _Fixed('h')
+UInt16 = _Fixed('H')
+Int32 = _Fixed('i')
+Int64 = _Fixed('q')
+Float = _Fixed('f')
+Double = _Fixed('d')
+UUID = _UUID()
+VarInt = _VarInt()
+VarLong = _VarLong()
+Identifier = String(32767)
+RemainingBytes = _RemainingBytes()
+
+# 生成コードから参照する名前
+_ENV = {
+    '_UUID': uuid.UUID,
+    'decode_varint': codec.decode_varint,
+    'encode_varint': codec.encode_varint,
+    'decode_varlong': codec.decode_varlong,
+    'encode_varlong': codec.encode_varlong,
+    'decode_string': codec.decode_string,
+    'encode_string': codec.encode_string,
+    'JEPacketBuffer': JEPacketBuffer,
+}
+
+def _group_fields(fields):
+    # 連続する固定長フィールドを1つのグループにまとめる
+    groups = []
+    for index, (name, field_type) in enumerate(fields):
+        if field_type.format and groups and groups[-1][0] == 'fixed':
+            groups[-1][1].append((index, name, field_type))
+        else:
+            groups.append(('fixed' if field_type.format else 'single', [(index, name, field_type)]))
+    return groups
+
+def compile_fields(fields) -> tuple:
+    # フィールド定義から(from_bytes, to_bytes)の関数を生成する
+    env = dict(_ENV)
+    decode = ['def from_bytes(cls, packet_buffer):',
+              '    buffer = packet_buffer._buffer',
+              '    offset = packet_buffer._position']
+    encode = ['def to_bytes(self, con_state):']
+    groups = _group_fields(fields)
+    if len(groups) == 1 and groups[0][0] == 'fixed':
+        # 全て固定長の場合はサイズが確定しているので確保済みの領域へpack_intoする
+        encode.append(f'    out = bytearray({struct.calcsize(">" + "".join(t.format for _, _, t in groups[0][1]))})')
+    else:
+        encode.append('    out = bytearray()')
+    for group_index, (kind, members) in enumerate(groups):
+        if kind == 'fixed':
+            fused = struct.Struct('>' + ''.join(field_type.format for _, _, field_type in members))
+            ref = f'_s{group_index}'
+            env[ref] = fused
+            variables = [f'f{index}' for index, _, _ in members]
+            decode += [f'    if offset + {fused.size} > len(buffer):',
+                       "        raise EOFError('Buffer underflow')",
+                       f'    {", ".join(variables)}, = {ref}.unpack_from(buffer, offset)',
+                       f'    offset += {fused.size}']
+            values = []
+            for (index, name, field_type), variable in zip(members, variables):
+                if field_type.from_wire:
+                    decode.append(f'    {variable} = {field_type.from_wire.format(variable)}')
+                values.append(field_type.to_wire.format(f'self.{name}') if field_type.to_wire else f'self.{name}')
+            if len(groups) == 1:
+                encode.append(f'    {ref}.pack_into(out, 0, {", ".join(values)})')
+            else:
+                encode.append(f'    out += {ref}.pack({", ".join(values)})')
+        else:
+            index, name, field_type = members[0]
+            ref = f'_t{index}'
+            env[ref] = field_type
+            decode.append('    ' + field_type.decode_source(f'f{index}', ref))
+            encode.append('    ' + field_type.encode_source(f'self.{name}', ref))
+    decode += ['    packet_buffer._position = offset',
+               '    packet = cls.__new__(cls)']
+    decode += [f'    packet.{name} = f{index}' for index, (name, _) in enumerate(fields)]
+    decode.append('    return packet')
+    encode += ['    packet_buffer = JEPacketBuffer()',
+               '    packet_buffer._buffer = out',
+               '    packet_buffer._position = len(out)',
+               '    return packet_buffer']
+    exec('\n'.join(decode) + '\n\n' + '\n'.join(encode), env)
+    return env['from_bytes'], env['to_bytes']
+
+def packet_fields(*fields: tuple[str, FieldType]):
+    # パケットクラスにfrom_bytes/to_bytesを生成して設定するデコレータ
+    def wrapper(cls):
+        from_bytes, to_bytes = compile_fields(fields)
+        cls._fields = fields
+        cls.from_bytes = classmethod(from_bytes)
+        cls.to_bytes = to_bytes
+        abc.update_abstractmethods(cls)
+        return cls
+    return wrapper
@@ -1,3 +1,5 @@
 from . import handshake
 from . import status
-from . import login
\ No newline at end of file
+from . import login
+from . import configuration
+from . import play
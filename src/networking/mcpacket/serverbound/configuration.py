@@ -1,17 +1,31 @@
 
-from core.logger import logger
-from networking.mcpacket import ServerboundPacket
+from networking.mcpacket import ServerboundPacket, schema
 from networking.enum import JEPacketConnectionState
 
 @ServerboundPacket.register_packet(JEPacketConnectionState.CONFIGURATION, 0x00)
+@schema.packet_fields(
+    ('locale', schema.String(16)),
+    ('view_distance', schema.Int8),
+    ('chat_mode', schema.VarInt),
+    ('chat_colors', schema.Boolean),
+    ('displayed_skin_parts', schema.UInt8),
+    ('main_hand', schema.VarInt),
+    ('enable_text_filtering', schema.Boolean),
+    ('allow_server_listings', schema.Boolean),
+    ('particle_status', schema.VarInt),
+)
 class SClientInformation(ServerboundPacket):
-    def __init__(self, locale: str, view_distance: int, chat_mode: int, chat_colors: bool, displayed_skin_parts: int, main_hand: int):
+    def __init__(self, locale: str, view_distance: int, chat_mode: int, chat_colors: bool, displayed_skin_parts: int, main_hand: int,
+                 enable_text_filtering: bool = False, allow_server_listings: bool = True, particle_status: int = 0):
         self.locale = locale
         self.view_distance = view_distance
         self.chat_mode = chat_mode
         self.chat_colors = chat_colors
         self.displayed_skin_parts = displayed_skin_parts
         self.main_hand = main_hand
+        self.enable_text_filtering = enable_text_filtering
+        self.allow_server_listings = allow_server_listings
+        self.particle_status = particle_status
     
     @property
     def packet_id(self):
@@ -23,18 +37,9 @@ class SClientInformation(ServerboundPacket):
             con_state.client_info = self
         return None
     
-    @classmethod
-    def from_bytes(cls, packet_buffer):
-        protocol_version = packet_buffer.read_varint()
-        username = packet_buffer.read_utf8_string()
-        entity_id = packet_buffer.read_varint()
-        entity_uuid = packet_buffer.read_uuid()
-        is_hardcore = packet_buffer.read_boolean()
-        is_demo = packet_buffer.read_boolean()
-        return cls(protocol_version, username, entity_id, entity_uuid, is_hardcore, is_demo)
-    
 
 @ServerboundPacket.register_packet(JEPacketConnectionState.CONFIGURATION, 0x02)
+@schema.packet_fields(('channel', schema.Identifier), ('data', schema.RemainingBytes))
 class SPluginMessage(ServerboundPacket):
     def __init__(self, channel: str, data: bytes):
         self.channel = channel
@@ -49,14 +54,9 @@ class SPluginMessage(ServerboundPacket):
         with con_state.config_lock:
             con_state.plugin_message = self
         pass
-
-    @classmethod
-    def from_bytes(cls, packet_buffer):
-        channel = packet_buffer.read_utf8_string()
-        data = packet_buffer.remaining_bytes()
-        return cls(channel, data)
     
 @ServerboundPacket.register_packet(JEPacketConnectionState.CONFIGURATION, 0x03)
+@schema.packet_fields()
 class SFinishConfigurationAcknowledged(ServerboundPacket):
     def __init__(self):
         pass
@@ -68,13 +68,18 @@ class SFinishConfigurationAcknowledged(ServerboundPacket):
     def handle(self, con_state):
         # 設定完了の確認応答を処理する
         con_state._switch_state(JEPacketConnectionState.PLAY)
+        # オンラインのプレイヤーとしてサーバーリストに表示する
+        con_state.server_status.player_joined(con_state.uuid, con_state.username)
         return None
 
-    @classmethod
-    def from_bytes(cls, packet_buffer):
-        return cls()
-
 @ServerboundPacket.register_packet(JEPacketConnectionState.CONFIGURATION, 0x07)
+@schema.packet_fields(
+    ('packs', schema.Array(schema.Compound(
+        ('pack_name', schema.String()),
+        ('pack_id', schema.String()),
+        ('pack_version', schema.String()),
+    ))),
+)
 class SKnownPacks(ServerboundPacket):
     def __init__(self, packs: list[dict]):
         self.packs = packs
@@ -85,17 +90,3 @@ class SKnownPacks(ServerboundPacket):
 
     def handle(self, con_state):
         return None
-
-    @classmethod
-    def from_bytes(cls, packet_buffer):
-        pack_count = packet_buffer.read_varint()
-        packs = []
-        logger.debug(f'Received {pack_count} known packs from client')
-        for _ in range(pack_count):
-            pack = {}
-            pack['pack_name'] = packet_buffer.read_utf8_string()
-            pack['pack_id'] = packet_buffer.read_utf8_string()
-            pack['pack_version'] = packet_buffer.read_utf8_string()
-            packs.append(pack)
-        return cls(packs)
-    
\ No newline at end of file
@@ -1,8 +1,14 @@
 
-from networking.mcpacket import ServerboundPacket
+from networking.mcpacket import ServerboundPacket, schema
 from networking.enum import JEPacketConnectionState
 
 @ServerboundPacket.register_packet(JEPacketConnectionState.HANDSHAKING, 0x00)
+@schema.packet_fields(
+    ('protocol_version', schema.VarInt), # varintでプロトコルバージョン
+    ('server_address', schema.String(255)), # stringでサーバーアドレス
+    ('server_port', schema.UInt16), # unsigned shortでサーバーポート
+    ('intent', schema.VarInt), # varintで次のステート
+)
 class SHandshakePacket(ServerboundPacket):
 
     def __init__(self, protocol_version: int, server_address: str, server_port: int, intent: int):
@@ -25,12 +31,3 @@ class SHandshakePacket(ServerboundPacket):
         elif self.intent == 3:  # 接続ステートをTRANSFERに切り変える
             con_state._switch_state(JEPacketConnectionState.TRANSFER)
         return None
-
-    @classmethod
-    def from_bytes(cls, packet_buffer):
-        # バイト列からHandshakeパケットを生成
-        protocol_version = packet_buffer.read_varint() # varintでプロトコルバージョンを読み取る
-        server_address = packet_buffer.read_utf8_string(255) # stringでサーバーアドレスを読み取る
-        server_port = packet_buffer.read_uint16() # unsigned shortでサーバーポートを読み取る
-        intent = packet_buffer.read_varint() # varintで次のステートを読み取る
-        return cls(protocol_version, server_address, server_port, intent)
@@ -1,16 +1,16 @@
 
+import hashlib
 import os
 import uuid
 
-import requests
-
 from core.logger import logger
-from networking.mcpacket import ServerboundPacket
+from networking.mcpacket import ServerboundPacket, schema
 from networking.enum import JEPacketConnectionState
 from networking.mcrypto import decrypt_rsa, gen_ciphers, auth_hash
 import networking.mcpacket.clientbound.login as login
 
 @ServerboundPacket.register_packet(JEPacketConnectionState.LOGIN, 0x00)
+@schema.packet_fields(('username', schema.String(16)), ('uuid', schema.UUID))
 class SLoginStart(ServerboundPacket):
     def __init__(self, username: str, uuid: uuid.UUID):
         self.username = username
@@ -20,24 +20,24 @@ class SLoginStart(ServerboundPacket):
     def packet_id(self):
         return self._packet_id
     
-    def handle(self, con_state) -> login.CEncryptionRequest:
+    def handle(self, con_state) -> login.CEncryptionRequest | None:
         # C -> S: LoginStart (ログイン開始)
-        # S -> C: LoginSuccess (ログイン成功)
-        # ここではログイン成功のレスポンスを返す
-        public_der = con_state.public_der
+        # S -> C: EncryptionRequest (暗号化要求)、オフラインモードではLoginSuccess (ログイン成功)
         con_state.username = self.username
         con_state.uuid = self.uuid
+        if not con_state.online_mode:
+            # オフラインモードでは暗号化とセッションサーバーでの認証を行わず、名前から決まるUUIDでログインさせる
+            con_state.uuid = offline_uuid(self.username)
+            logger.info('Player %s with UUID %s has logged in (offline mode)', self.username, con_state.uuid, log_thread=False)
+            _login_success(con_state, login.CLoginSuccess(con_state.uuid, self.username))
+            return None
+        public_der = con_state.public_der
         verify_token = os.urandom(16)
         con_state.verify_token = verify_token
         return login.CEncryptionRequest(public_der, verify_token)
 
-    @classmethod
-    def from_bytes(cls, packet_buffer):
-        username = packet_buffer.read_utf8_string(16)
-        uuid = packet_buffer.read_uuid()
-        return cls(username, uuid)
-
 @ServerboundPacket.register_packet(JEPacketConnectionState.LOGIN, 0x01)
+@schema.packet_fields(('_shared_secret', schema.PrefixedBytes()), ('_verify_token', schema.PrefixedBytes()))
 class SEncryptionResponse(ServerboundPacket):
     def __init__(self, shared_secret: bytes, verify_token: bytes):
         self._shared_secret = shared_secret
@@ -47,9 +47,9 @@ class SEncryptionResponse(ServerboundPacket):
     def packet_id(self):
         return self._packet_id
     
-    def handle(self, con_state) -> login.CLoginSuccess | login.CDisconnect:
+    def handle(self, con_state) -> login.CDisconnect | None:
         # C -> S: EncryptionResponse (暗号化応答)
-        # S -> C: LoginSuccess (ログイン成功)
+        # S -> C: LoginSuccess (ログイン成功、認証完了後に送信)
         # 通信の暗号化
         rsa_private, _ = con_state.rsa_pair
         server_id = con_state.server_id
@@ -60,32 +60,51 @@ class SEncryptionResponse(ServerboundPacket):
         shared_key = decrypt_rsa(self._shared_secret, rsa_private)
         con_state.cipher_pair = gen_ciphers(shared_key)
         # クライアントログイン
+        # セッションサーバーへの問い合わせはネットワークスレッドを止めないようにワーカーへ委託し、
+        # 結果が届くまで接続はLOGIN状態のまま待機する
         hash = auth_hash(server_id, shared_key, public_der)
-        params = {
-            'username': con_state.username,
-            'serverId': hash,
-        }
-        response = requests.get('https://sessionserver.mojang.com/session/minecraft/hasJoined', params=params)
-        if response.status_code != 200:
-            return login.CDisconnect("Authentication failed: Mojang API is down")
-        data = response.json()
-        profile_id = uuid.UUID(data.get('id'))
-        player_name = data.get('name')
-        name = data.get('properties')[0].get('name')
-        value = data.get('properties')[0].get('value')
-        signature = data.get('properties')[0].get('signature')
-        logger.info(f'Player {player_name} with UUID {profile_id} has been authorized', False)
-        return login.CLoginSuccess(profile_id, player_name, name, value, signature)
+        future = con_state.authenticator.authenticate(con_state.username, hash)
+        future.add_done_callback(lambda future: SEncryptionResponse._on_authenticated(future, con_state))
+        return None
 
-    @classmethod
-    def from_bytes(cls, packet_buffer):
-        shared_secret_length = packet_buffer.read_varint()
-        shared_secret = packet_buffer.read(shared_secret_length)
-        verify_token_length = packet_buffer.read_varint()
-        verify_token = packet_buffer.read(verify_token_length)
-        return cls(shared_secret, verify_token)
+    @staticmethod
+    def _on_authenticated(future, con_state):
+        # 認証ワーカーから呼ばれる
+        # Futureのコールバック内の例外は握りつぶされるため、失敗した場合は全てここで切断する
+        if con_state.get_state() != JEPacketConnectionState.LOGIN:
+            return
+        try:
+            data = future.result()
+            if data is None:
+                raise ValueError('not authenticated by the session server')
+            profile_id = uuid.UUID(data['id'])
+            player_name = data['name']
+            # プロフィールのプロパティ (スキンなど) は無い場合もある
+            properties = data.get('properties') or [{}]
+            name = properties[0].get('name')
+            value = properties[0].get('value')
+            signature = properties[0].get('signature')
+        except Exception as e:
+            logger.error(f'Authentication of {con_state.username} failed: {e}')
+            con_state.disconnect(login.CDisconnect("Authentication failed"))
+            return
+        con_state.uuid = profile_id
+        con_state.username = player_name
+        logger.info('Player %s with UUID %s has been authorized', player_name, profile_id, log_thread=False)
+        _login_success(con_state, login.CLoginSuccess(profile_id, player_name, name, value, signature))
+
+def offline_uuid(username: str) -> uuid.UUID:
+    # オフラインモードのプレイヤーのUUID (バニラと同じく "OfflinePlayer:<名前>" のMD5から作るバージョン3のUUID)
+    return uuid.UUID(bytes=hashlib.md5(f'OfflinePlayer:{username}'.encode()).digest(), version=3)
+
+def _login_success(con_state, login_success: login.CLoginSuccess):
+    # ログイン成功の前に圧縮プロトコルを有効にする
+    if con_state.network_compression_threshold >= 0:
+        con_state.send(login.CSetCompression(con_state.network_compression_threshold))
+    con_state.send(login_success)
     
 @ServerboundPacket.register_packet(JEPacketConnectionState.LOGIN, 0x03)
+@schema.packet_fields()
 class SLoginAcknowledged(ServerboundPacket):
     def __init__(self):
         pass
@@ -99,8 +118,4 @@ class SLoginAcknowledged(ServerboundPacket):
         # C -> S: LoginAcknowledged (ログイン完了)
         # 接続をCONFIGに変更
         con_state._switch_state(JEPacketConnectionState.CONFIGURATION)
-        return None
-    
-    @classmethod
-    def from_bytes(cls, packet_buffer):
-        return cls()
\ No newline at end of file
+        return None
\ No newline at end of file
@@ -1,10 +1,18 @@
 
-from networking.mcpacket import ServerboundPacket
+import uuid
+
+from networking.mcpacket import ServerboundPacket, schema
 from networking.enum import JEPacketConnectionState
 
 @ServerboundPacket.register_packet(JEPacketConnectionState.PLAY, 0x09)
+@schema.packet_fields(
+    ('session_id', schema.UUID),
+    ('expiration', schema.Int64),
+    ('public_key', schema.PrefixedBytes(512)),
+    ('signature', schema.PrefixedBytes(4096)),
+)
 class SPlayerSession(ServerboundPacket):
-    def __init__(self, session_id: str, expiration: int, public_key: bytes, signature: bytes):
+    def __init__(self, session_id: uuid.UUID, expiration: int, public_key: bytes, signature: bytes):
         self.session_id = session_id
         self.expiration = expiration
         self.public_key = public_key
@@ -22,13 +30,18 @@ class SPlayerSession(ServerboundPacket):
         con_state.public_key = self.public_key
         con_state.signature = self.signature
         return None
-    
-    @classmethod
-    def from_bytes(cls, packet_buffer):
-        session_id = packet_buffer.read_utf8_string(36)
-        expiration = packet_buffer.read_varint()
-        public_key_length = packet_buffer.read_varint()
-        public_key = packet_buffer.read_bytes(public_key_length)
-        signature_length = packet_buffer.read_varint()
-        signature = packet_buffer.read_bytes(signature_length)
-        return cls(session_id, expiration, public_key, signature)
+
+
+@ServerboundPacket.register_packet(JEPacketConnectionState.PLAY, 0x1B)
+@schema.packet_fields(('keep_alive_id', schema.Int64))
+class SKeepAlive(ServerboundPacket):
+    def __init__(self, keep_alive_id: int):
+        self.keep_alive_id = keep_alive_id
+
+    @property
+    def packet_id(self):
+        return self._packet_id
+
+    def handle(self, con_state):
+        # RTTは返信の対応付け(Connection.keep_alive)で計測済み
+        return None
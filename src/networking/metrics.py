@@ -0,0 +1,173 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+class Histogram:
+    '''
+    2のべき乗(ナノ秒)のバケットで数えるレイテンシーのヒストグラム。
+    バケットkには2^(k-1)以上2^k未満のナノ秒の観測値が入る (bit_lengthで求めるので記録が軽い)。
+    '''
+    __slots__ = ('counts', 'count', 'sum')
+    BUCKETS = 64
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.sum = 0 # ナノ秒
+
+    def observe(self, nanoseconds: int, count: int = 1):
+        # countを指定した場合は同じ値をcount回記録する (まとめて処理したパケットなど)
+        self.counts[min(nanoseconds.bit_length(), self.BUCKETS - 1)] += count
+        self.count += count
+        self.sum += nanoseconds * count
+
+    def snapshot(self) -> dict:
+        counts = list(self.counts)
+        return {
+            'count': self.count,
+            'sum_ns': self.sum,
+            # バケットの上限(ナノ秒) -> 件数 (空のバケットは省略)
+            'buckets': {1 << index: count for index, count in enumerate(counts) if count},
+        }
+
+class NetworkMetrics:
+    '''
+    プロトコル処理のメトリクス (プロセスで1つ)。
+    パケット単位の処理時間は (処理, 接続状態, パケットID) ごとのヒストグラムに、
+    パケット数とバイト数は (方向, 接続状態, パケットID) ごとのカウンタに記録する。
+    記録はネットワークスレッド、ティックスレッド、圧縮ワーカーから行われるが、ロックは取らない
+    (GILの下でカウンタの加算が稀に失われることは許容する)。
+    計測する側はenabledを確認してから記録する (既定では無効)。
+    '''
+    # 処理時間を記録する処理
+    STAGES = ('decode', 'handle', 'encode', 'compress', 'encrypt', 'flush')
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._latency: dict[tuple, Histogram] = {}
+        self._packets: dict[tuple, list] = {} # (方向, 接続状態, パケットID) -> [パケット数, バイト数]
+
+    def observe(self, stage: str, state, packet_id: int | None, nanoseconds: int, count: int = 1):
+        key = (stage, state, packet_id)
+        histogram = self._latency.get(key)
+        if histogram is None:
+            histogram = self._latency.setdefault(key, Histogram())
+        histogram.observe(nanoseconds, count)
+
+    def count_packet(self, direction: str, state, packet_id: int, size: int):
+        key = (direction, state, packet_id)
+        counter = self._packets.get(key)
+        if counter is None:
+            counter = self._packets.setdefault(key, [0, 0])
+        counter[0] += 1
+        counter[1] += size
+
+    def reset(self):
+        self._latency = {}
+        self._packets = {}
+
+    def snapshot(self) -> dict:
+        latency = [
+            {'stage': stage, 'state': _state_name(state), 'packet_id': packet_id, **histogram.snapshot()}
+            for (stage, state, packet_id), histogram in list(self._latency.items())
+        ]
+        packets = [
+            {'direction': direction, 'state': _state_name(state), 'packet_id': packet_id, 'packets': counter[0], 'bytes': counter[1]}
+            for (direction, state, packet_id), counter in list(self._packets.items())
+        ]
+        return {'latency': latency, 'packets': packets}
+
+def _state_name(state) -> str:
+    return '' if state is None else state.name
+
+def _packet_label(packet_id: int | None) -> str:
+    return '' if packet_id is None else f'0x{packet_id:02X}'
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+def prometheus_text(snapshot: dict) -> str:
+    # metrics_snapshotの結果をPrometheusのテキスト形式に変換する
+    lines = ['# TYPE pyncraft_packet_stage_seconds histogram']
+    for entry in snapshot['latency']:
+        labels = {'stage': entry['stage'], 'state': entry['state'], 'packet_id': _packet_label(entry['packet_id'])}
+        cumulative = 0
+        for bound, count in sorted(entry['buckets'].items()):
+            cumulative += count
+            lines.append(f'pyncraft_packet_stage_seconds_bucket{_labels(**labels, le=f"{bound / 1e9:.9g}")} {cumulative}')
+        lines.append(f'pyncraft_packet_stage_seconds_bucket{_labels(**labels, le="+Inf")} {entry["count"]}')
+        lines.append(f'pyncraft_packet_stage_seconds_sum{_labels(**labels)} {entry["sum_ns"] / 1e9:.9g}')
+        lines.append(f'pyncraft_packet_stage_seconds_count{_labels(**labels)} {entry["count"]}')
+    # 同じメトリクスのサンプルはTYPE行の下にまとめて出力する必要がある
+    for metric, field in (('pyncraft_packets_total', 'packets'), ('pyncraft_packet_bytes_total', 'bytes')):
+        lines.append(f'# TYPE {metric} counter')
+        for entry in snapshot['packets']:
+            labels = _labels(direction=entry['direction'], state=entry['state'], packet_id=_packet_label(entry['packet_id']))
+            lines.append(f'{metric}{labels} {entry[field]}')
+    lines.append('# TYPE pyncraft_connections gauge')
+    for state, count in snapshot.get('connections', {}).items():
+        lines.append(f'pyncraft_connections{_labels(state=state)} {count}')
+    for name in ('bytes_in', 'bytes_out', 'queue_depth'):
+        kind = 'gauge' if name == 'queue_depth' else 'counter'
+        metric = f'pyncraft_connection_{name}' + ('' if kind == 'gauge' else '_total')
+        lines.append(f'# TYPE {metric} {kind}')
+        for connection in snapshot.get('per_connection', []):
+            lines.append(f'{metric}{_labels(address=connection["address"], state=connection["state"])} {connection[name]}')
+    for name, value in snapshot.get('compression', {}).items():
+        lines.append(f'pyncraft_compression_{name} {value}')
+    tick = snapshot.get('tick')
+    if tick is not None:
+        lines.append(f'pyncraft_tps {tick["tps"]}')
+        for name, value in tick['mspt'].items():
+            lines.append(f'pyncraft_mspt{_labels(stat=name)} {value}')
+    return '\n'.join(lines) + '\n'
+
+class MetricsServer:
+    '''
+    メトリクスをHTTPで公開する (/metrics はPrometheusのテキスト形式、/snapshot はJSON)。
+    snapshotは呼ばれるたびにメトリクスのdictを返す関数。
+    '''
+    def __init__(self, snapshot, address: str, port: int):
+        self._snapshot = snapshot
+        self._server = ThreadingHTTPServer((address, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def _handler(self):
+        snapshot = self._snapshot
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = prometheus_text(snapshot()).encode()
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/snapshot':
+                    body = json.dumps(snapshot(), default=str).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # アクセスログは出力しない
+                pass
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='MetricsServer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+# プロセス全体で共有するメトリクス
+metrics = NetworkMetrics()
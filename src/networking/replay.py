@@ -0,0 +1,164 @@
+from collections import Counter
+from time import perf_counter_ns
+import time
+import zlib
+
+from networking.capture import INBOUND, read_capture
+from networking.compression import PacketCompressor
+from networking.connection import JEConnectionState
+from networking.enum import JEPacketConnectionState
+from networking.mcpacket.codec import encode_varint
+from networking.mcpacket.io import JEPacketWrapper
+from networking.mcrypto import encode_public_key_der, gen_rsa_key_pair
+from networking.reply import ReplyCorrelator
+from networking.status import ServerStatus
+
+class _NullSocket:
+    # 送信したデータを捨てるだけのソケット
+    def sendmsg(self, buffers) -> int:
+        return sum(len(buffer) for buffer in buffers)
+
+    def fileno(self) -> int:
+        return -1
+
+    def close(self):
+        pass
+
+class _ReplayListener:
+    # 再生用のJEConnectionStateが参照するConnectionListenerの代わり
+    # 認証はセッションサーバーに依存するので、再生ではオフラインモードとしてログインさせる
+    def __init__(self, compression_threshold: int, compression_level: int):
+        self.server_status = ServerStatus('Pyncraft Server', 20)
+        self.private, self.public = gen_rsa_key_pair()
+        self.public_der = encode_public_key_der(self.public)
+        self.server_id = ''
+        self.online_mode = False
+        self.authenticator = None
+        self.compression_threshold = compression_threshold
+        # 圧縮はスレッドプールへ委託せず、呼び出したスレッドで行う
+        self.compressor = PacketCompressor(compression_level, workers=0)
+
+class _ReplayConnection:
+    # ソケットを持たない接続 (handleの中から送られたパケットはキューに積むだけ)
+    def __init__(self, listener: _ReplayListener):
+        self.packet_wrapper = JEPacketWrapper(_NullSocket())
+        self.replies = ReplyCorrelator()
+        self.outgoing_packets = []
+        self.con_state = JEConnectionState(listener, self)
+
+    def request(self, packet, timeout=0):
+        future = self.replies.expect(packet, timeout)
+        self.outgoing_packets.append(packet)
+        return future
+
+    def queue_packet(self, packet, timeout=0):
+        if hasattr(packet, '_repliable_packets'):
+            return self.request(packet, timeout)
+        self.outgoing_packets.append(packet)
+        return None
+
+    def disconnect(self, packet):
+        self.outgoing_packets.append(packet)
+
+class CaptureReplayer:
+    '''
+    キャプチャした受信パケットを、ソケットを使わずに read_packet -> handle -> write_packet -> flush の順に処理する。
+    接続状態はキャプチャに記録された状態に合わせるため、handleの結果に関わらず毎回同じパケットの列がデコードされる。
+    speedが0の場合は待たずに最大速度で、それ以外はキャプチャの時刻をspeed倍速で再現して再生する。
+    '''
+    def __init__(self, records, speed: float = 0, compression_threshold: int = 256, compression_level: int = 6):
+        self._records = records
+        self.speed = speed
+        self._listener = _ReplayListener(compression_threshold, compression_level)
+        self._connections: dict[int, _ReplayConnection] = {}
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'CaptureReplayer':
+        return cls(list(read_capture(path)), **kwargs)
+
+    def _connection(self, connection_id: int) -> _ReplayConnection:
+        connection = self._connections.get(connection_id)
+        if connection is None:
+            connection = self._connections[connection_id] = _ReplayConnection(self._listener)
+        return connection
+
+    def _frame(self, data: bytes, con_state) -> bytes:
+        # クライアントと同じ形式でフレーム化する (圧縮プロトコルが有効であればしきい値以上は圧縮する)
+        threshold = con_state.compression_threshold
+        if threshold >= 0:
+            data = encode_varint(len(data)) + zlib.compress(data) if len(data) >= threshold else b'\x00' + data
+        return encode_varint(len(data)) + data
+
+    def run(self) -> dict:
+        # 再生して処理ごとの所要時間と件数を返す
+        times = Counter() # 処理 -> 所要時間の合計 (ナノ秒)
+        packets = Counter() # 方向 -> パケット数
+        errors = Counter()
+        replayed_bytes = 0
+        start = time.monotonic()
+        for record in self._records:
+            if record.direction != INBOUND:
+                packets['recorded_out'] += 1
+                continue
+            if self.speed > 0:
+                delay = start + record.timestamp / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            connection = self._connection(record.connection_id)
+            con_state = connection.con_state
+            wrapper = connection.packet_wrapper
+            # handleが失敗して状態が変わらなかった場合もキャプチャ通りの状態でデコードする
+            con_state._state = record.state
+            wrapper._input_buffer.extend(self._frame(record.data, con_state))
+            replayed_bytes += len(record.data)
+
+            clock = perf_counter_ns()
+            try:
+                packet = wrapper.read_packet(con_state)
+            except Exception as e:
+                wrapper.clear_input_buffer()
+                errors[f'decode {record.state.name}: {type(e).__name__}: {e}'] += 1
+                continue
+            times['decode'] += perf_counter_ns() - clock
+            packets['in'] += 1
+
+            clock = perf_counter_ns()
+            connection.replies.resolve(packet)
+            try:
+                if packet._state is JEPacketConnectionState.PLAY:
+                    packet.handle_batch([(packet, con_state)])
+                else:
+                    outgoing_packet = packet.handle(con_state)
+                    if outgoing_packet is not None:
+                        connection.outgoing_packets.insert(0, outgoing_packet)
+            except Exception as e:
+                errors[f'handle {packet.__class__.__name__}: {type(e).__name__}: {e}'] += 1
+            times['handle'] += perf_counter_ns() - clock
+
+            clock = perf_counter_ns()
+            outgoing_packets, connection.outgoing_packets = connection.outgoing_packets, []
+            for outgoing_packet in outgoing_packets:
+                try:
+                    wrapper.write_packet(outgoing_packet, con_state)
+                    packets['out'] += 1
+                except Exception as e:
+                    errors[f'encode {outgoing_packet.__class__.__name__}: {type(e).__name__}: {e}'] += 1
+            times['encode'] += perf_counter_ns() - clock
+
+            clock = perf_counter_ns()
+            wrapper.flush(None)
+            times['flush'] += perf_counter_ns() - clock
+        elapsed = time.monotonic() - start
+        busy = sum(times.values()) / 1e9
+        return {
+            'connections': len(self._connections),
+            'packets_in': packets['in'],
+            'packets_out': packets['out'],
+            'recorded_out': packets['recorded_out'],
+            'bytes_in': replayed_bytes,
+            'elapsed': elapsed,
+            # 再生の待ち時間とフレーム化を除いた、パケット処理だけのスループット
+            'packets_per_second': packets['in'] / busy if busy else 0.0,
+            'stage_seconds': {stage: nanoseconds / 1e9 for stage, nanoseconds in times.items()},
+            'errors': dict(errors.most_common()),
+        }
@@ -0,0 +1,73 @@
+from collections import deque
+from concurrent.futures import Future
+import heapq
+import itertools
+import threading
+import time
+
+class ReplyCorrelator:
+    '''
+    repliableなパケットの送信ごとにFutureを発行し、届いたパケットと対応付ける (接続ごとに1つ)。
+    待機中のFutureは返信パケットのクラスをキーにしたdictで管理するため、受信パケットごとの照合はO(1)。
+    タイムアウトは期限のヒープで管理し、処理エンジンが定期的にexpireを呼び出して失効させる。
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiting: dict[type, deque[Future]] = {} # 返信パケットのクラス -> 送信順のFuture
+        self._deadlines: list[tuple[float, int, Future]] = [] # (期限, 連番, Future) のヒープ
+        self._sequence = itertools.count()
+
+    def expect(self, packet, timeout: float = 0) -> Future:
+        # 返信を待つFutureを登録する (timeoutが0の場合は切断されるまで待つ)
+        future = Future()
+        future.packet = packet
+        with self._lock:
+            for reply_class in packet._repliable_packets:
+                self._waiting.setdefault(reply_class, deque()).append(future)
+            if timeout > 0:
+                heapq.heappush(self._deadlines, (time.monotonic() + timeout, next(self._sequence), future))
+        return future
+
+    def resolve(self, incoming_packet) -> bool:
+        # 届いたパケットを待っている最も古いFutureを完了させる
+        waiting = self._waiting.get(incoming_packet.__class__)
+        if not waiting:
+            return False
+        with self._lock:
+            future = None
+            while waiting:
+                candidate = waiting.popleft()
+                # 他の返信クラスで完了済み、またはタイムアウト済みのものは読み飛ばす
+                if not candidate.done():
+                    future = candidate
+                    break
+        if future is None:
+            return False
+        # コールバックはロックの外で実行する
+        future.set_result(incoming_packet)
+        return True
+
+    def expire(self, now: float = None) -> int:
+        # 期限を過ぎたFutureをTimeoutErrorで失効させ、その数を返す
+        if not self._deadlines:
+            return 0
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                expired.append(heapq.heappop(self._deadlines)[2])
+        count = 0
+        for future in expired:
+            if not future.done():
+                future.set_exception(TimeoutError(f'No reply for {future.packet}'))
+                count += 1
+        return count
+
+    def cancel_all(self):
+        # 切断時に待機中のFutureを全てキャンセルする
+        with self._lock:
+            futures = {future for waiting in self._waiting.values() for future in waiting}
+            self._waiting.clear()
+            self._deadlines.clear()
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,62 @@
+import threading
+import uuid
+
+from networking.enum import JEProtocolVersion
+from networking.mcpacket.io import PreEncodedPacket
+import networking.mcpacket.clientbound.status as status
+
+class ServerStatus:
+    '''
+    サーバーリストに表示するステータス (MOTD、最大人数、オンライン人数、プレイヤーのサンプル) を保持する。
+    ステータスレスポンスはフレーム化済みのバイト列としてキャッシュし、入力が変わった時だけ作り直す。
+    '''
+    # protocol versionがマッチしない場合に表示
+    VERSION_NAME = 'Pythonでマイクラサーバー書き直してみるよ'
+    # オンライン人数にホバーした時に表示するプレイヤーの最大数 (バニラと同じ)
+    SAMPLE_SIZE = 12
+
+    def __init__(self, motd: str, max_players: int):
+        self._lock = threading.Lock()
+        self._motd = motd
+        self._max_players = max_players
+        self._players: dict[uuid.UUID, str] = {} # オンラインのプレイヤー (参加順)
+        self._response: PreEncodedPacket = None
+
+    def _invalidate(self):
+        self._response = None
+
+    def set_motd(self, motd: str):
+        with self._lock:
+            if motd != self._motd:
+                self._motd = motd
+                self._invalidate()
+
+    def set_max_players(self, max_players: int):
+        with self._lock:
+            if max_players != self._max_players:
+                self._max_players = max_players
+                self._invalidate()
+
+    def player_joined(self, player_uuid: uuid.UUID, username: str):
+        with self._lock:
+            self._players[player_uuid] = username
+            self._invalidate()
+
+    def player_left(self, player_uuid: uuid.UUID):
+        with self._lock:
+            if self._players.pop(player_uuid, None) is not None:
+                self._invalidate()
+
+    @property
+    def online_players(self) -> int:
+        return len(self._players)
+
+    def response(self) -> PreEncodedPacket:
+        # キャッシュされたステータスレスポンスを返す (無効化されていれば作り直す)
+        with self._lock:
+            if self._response is None:
+                sample_players = [{'name': username, 'id': str(player_uuid)} for player_uuid, username in list(self._players.items())[:self.SAMPLE_SIZE]]
+                self._response = PreEncodedPacket(status.CStatusResponse(
+                    self.VERSION_NAME, JEProtocolVersion.v1_21_8.value, self._max_players, len(self._players), sample_players, self._motd
+                ))
+            return self._response
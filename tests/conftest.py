@@ -0,0 +1,8 @@
+import pytest
+
+from core.logger import logger
+
+@pytest.fixture(autouse=True, scope='session')
+def _log_dir(tmp_path_factory):
+    # テスト中のログはソースツリーではなく一時ディレクトリへ書き込む
+    logger.set_log_dir(str(tmp_path_factory.mktemp('logs')))
@@ -0,0 +1,126 @@
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import socket
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import core
+from loadgen import BotClient
+from networking.aioconnection import AsyncConnectionProcessor
+from networking.compression import PacketCompressor
+from networking.connection import Connection
+from networking.enum import JEPacketConnectionState, JEProtocolVersion
+from networking.mcpacket import ClientboundPacket
+from networking.mcpacket.io import JEPacketBuffer, PreEncodedPacket
+from networking.status import ServerStatus
+import networking.mcpacket.clientbound.play as clientbound_play
+import networking.mcpacket.serverbound.handshake as handshake
+import networking.mcpacket.serverbound.status as status
+
+def _listener(**overrides):
+    listener = SimpleNamespace(
+        server_status=ServerStatus('Pyncraft Server', 20), private=None, public=None, public_der=None, server_id='',
+        online_mode=False, authenticator=None, compression_threshold=-1, compressor=PacketCompressor(workers=0),
+        write_high_water_mark=4 * 1024 * 1024, write_backlog_factor=4, slow_consumer_policy='pause', capture=None, adaptive_compression=None,
+        keep_alive_interval=15, keep_alive_timeout=30,
+    )
+    listener.__dict__.update(overrides)
+    return listener
+
+@pytest.fixture
+def engine():
+    # ループバックのサーバーソケットで受け付けた接続をasyncioエンジンに渡す
+    processor = AsyncConnectionProcessor()
+    processor.start_processor()
+    server = socket.create_server(('127.0.0.1', 0))
+    port = server.getsockname()[1]
+    bots = []
+    def connect(**overrides):
+        bot = BotClient('127.0.0.1', port, 5)
+        client, address = server.accept()
+        connection = Connection(client, address, _listener(**overrides))
+        processor.add_connection(connection)
+        bots.append(bot)
+        return bot, connection
+    yield processor, connect
+    processor.stop_processor()
+    server.close()
+    for bot in bots:
+        bot.close()
+
+def _status_ping(bot: BotClient, timestamp: int):
+    bot.send(handshake.SHandshakePacket(JEProtocolVersion.v1_21_8.value, bot.host, bot.port, 1))
+    bot.send(status.SStatusRequest())
+    bot.send(status.SPingRequest(timestamp))
+
+def test_status_ping(engine):
+    processor, connect = engine
+    bot, _ = connect()
+    _status_ping(bot, 1234)
+    packet_id, packet_buffer = bot.receive()
+    assert packet_id == 0x00 and 'Pyncraft Server' in packet_buffer.read_utf8_string()
+    packet_id, packet_buffer = bot.receive()
+    assert packet_id == 0x01 and packet_buffer.read_int64() == 1234
+
+def test_pending_replies_expire(engine):
+    processor, connect = engine
+    bot, connection = connect()
+    future = connection.request(clientbound_play.CKeepAlive(1), 0.05)
+    with pytest.raises(FutureTimeoutError):
+        future.result(2)
+
+class _LargePacket(ClientboundPacket):
+    @property
+    def packet_id(self):
+        return 0x7F
+
+    def to_bytes(self, con_state):
+        packet_buffer = JEPacketBuffer()
+        packet_buffer.write(bytes(1024 * 1024))
+        return packet_buffer
+
+def test_reading_resumes_after_the_output_drains(engine):
+    processor, connect = engine
+    bot, connection = connect(write_high_water_mark=64 * 1024, write_backlog_factor=1024)
+    # クライアントが読まない間に送信が詰まり、受信が止まる
+    for _ in range(32):
+        connection.queue_packet(_LargePacket())
+    deadline = time.monotonic() + 5
+    while not connection.packet_wrapper.congested() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert connection.packet_wrapper.congested()
+    _status_ping(bot, 99)
+    received = []
+    while (packet_id := bot.receive()[0]) == 0x7F:
+        received.append(packet_id)
+    assert len(received) == 32
+    assert packet_id == 0x00
+    assert bot.receive()[0] == 0x01
+
+def test_stop_closes_open_connections():
+    processor = AsyncConnectionProcessor()
+    processor.start_processor()
+    server = socket.create_server(('127.0.0.1', 0))
+    with server, BotClient('127.0.0.1', server.getsockname()[1], 5) as bot:
+        client, address = server.accept()
+        processor.add_connection(Connection(client, address, _listener()))
+        processor.stop_processor()
+        assert not processor._processor_thread.is_alive()
+        assert len(processor.registry) == 0
+        # サーバー側のソケットが閉じられている
+        with pytest.raises(ConnectionResetError):
+            bot.receive()
+
+def test_stalled_client_is_disconnected_at_the_backlog_limit(engine):
+    processor, connect = engine
+    bot, connection = connect(write_high_water_mark=64 * 1024, write_backlog_factor=4)
+    # クライアントは一切受信しない
+    deadline = time.monotonic() + 5
+    while connection.con_state.get_state() is not JEPacketConnectionState.CLOSED:
+        assert time.monotonic() < deadline
+        connection.queue_packet(PreEncodedPacket(_LargePacket()))
+        time.sleep(0.01)
+    while len(processor.registry):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
@@ -0,0 +1,84 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+import uuid
+
+import pytest
+
+import core
+from loadgen import StubSessionServer
+from networking.auth import SessionAuthenticator
+from networking.enum import JEPacketConnectionState
+import networking.mcpacket.clientbound.login as clientbound_login
+from networking.mcpacket.serverbound.login import SEncryptionResponse, offline_uuid
+
+def _authenticate(session: StubSessionServer, timeout: float = 5):
+    session.start()
+    authenticator = SessionAuthenticator(session.url, 1, timeout)
+    try:
+        return authenticator.authenticate('bot0', 'hash').result(10)
+    finally:
+        authenticator.shutdown()
+        session.stop()
+
+def test_authenticated_profile():
+    profile = _authenticate(StubSessionServer())
+    assert profile['name'] == 'bot0'
+    assert profile['id'] == offline_uuid('bot0').hex
+
+def test_not_authenticated():
+    # hasJoinedはプレイヤーが認証されていない場合に204を返す
+    assert _authenticate(StubSessionServer(status=204)) is None
+
+def test_session_server_timeout():
+    with pytest.raises(Exception):
+        _authenticate(StubSessionServer(delay=1), timeout=0.1)
+
+def test_malformed_profile():
+    with pytest.raises(ValueError):
+        _authenticate(StubSessionServer(body=b'{"id": '))
+
+class _ConState:
+    def __init__(self):
+        self.username = 'bot0'
+        self.uuid = None
+        self.network_compression_threshold = -1
+        self.sent = []
+        self.disconnected = None
+
+    def get_state(self):
+        return JEPacketConnectionState.LOGIN
+
+    def send(self, packet):
+        self.sent.append(packet)
+
+    def disconnect(self, packet):
+        self.disconnected = packet
+
+def _on_authenticated(result=None, exception=None) -> _ConState:
+    future = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    con_state = _ConState()
+    SEncryptionResponse._on_authenticated(future, con_state)
+    return con_state
+
+@pytest.mark.parametrize('result, exception', [
+    (None, None),
+    ({'name': 'bot0'}, None),
+    ({'id': 'not-a-uuid', 'name': 'bot0'}, None),
+    (None, TimeoutError()),
+])
+def test_failed_authentication_disconnects(result, exception):
+    con_state = _on_authenticated(result, exception)
+    assert isinstance(con_state.disconnected, clientbound_login.CDisconnect)
+    assert con_state.sent == []
+
+def test_profile_without_properties_logs_in():
+    profile_id = uuid.uuid4()
+    for properties in ({}, {'properties': []}):
+        con_state = _on_authenticated({'id': profile_id.hex, 'name': 'bot0', **properties})
+        assert con_state.disconnected is None
+        login_success, = con_state.sent
+        assert login_success.uuid == profile_id and login_success.property_name is None
@@ -0,0 +1,40 @@
+import core
+from networking.capture import INBOUND, OUTBOUND, CaptureWriter, read_capture
+from networking.enum import JEPacketConnectionState
+from networking.replay import CaptureReplayer
+import networking.mcpacket.serverbound.handshake as handshake
+import networking.mcpacket.serverbound.status as status
+
+def _payload(packet) -> bytes:
+    return bytes((packet._packet_id,)) + packet.to_bytes(None).get_value()
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    capture = CaptureWriter(path)
+    connection_id = capture.new_connection()
+    capture.record(connection_id, INBOUND, JEPacketConnectionState.STATUS, b'\x00')
+    capture.record(connection_id, OUTBOUND, JEPacketConnectionState.PLAY, memoryview(b'\x26' + bytes(8)))
+    capture.close()
+    records = list(read_capture(path))
+    assert [(record.connection_id, record.direction, record.state, record.data) for record in records] == [
+        (1, INBOUND, JEPacketConnectionState.STATUS, b'\x00'),
+        (1, OUTBOUND, JEPacketConnectionState.PLAY, b'\x26' + bytes(8)),
+    ]
+    assert records[0].timestamp <= records[1].timestamp
+
+def test_replay_status_ping(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    capture = CaptureWriter(path)
+    for _ in range(3):
+        connection_id = capture.new_connection()
+        capture.record(connection_id, INBOUND, JEPacketConnectionState.HANDSHAKING, _payload(handshake.SHandshakePacket(772, 'localhost', 25565, 1)))
+        capture.record(connection_id, INBOUND, JEPacketConnectionState.STATUS, _payload(status.SStatusRequest()))
+        capture.record(connection_id, INBOUND, JEPacketConnectionState.STATUS, _payload(status.SPingRequest(42)))
+    capture.close()
+    result = CaptureReplayer.from_file(path).run()
+    assert result['errors'] == {}
+    assert result['connections'] == 3
+    assert result['packets_in'] == 9
+    # Statusリスポンスとpong
+    assert result['packets_out'] == 6
+    assert set(result['stage_seconds']) == {'decode', 'handle', 'encode', 'flush'}
@@ -0,0 +1,63 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import core
+from core.pyncraftserver import ConfigurationSession
+import networking.mcpacket.clientbound.configuration as configuration
+
+class _Connection:
+    def __init__(self):
+        self._address = ('configuring', 0)
+        self.requests = [] # (パケット, Future)
+        self.queued = []
+        self.disconnected = None
+
+    def request(self, packet, timeout=0) -> Future:
+        future = Future()
+        self.requests.append((packet, future))
+        return future
+
+    def queue_packet(self, packet):
+        self.queued.append(packet)
+
+    def disconnect(self, packet):
+        self.disconnected = packet
+
+def _session():
+    server = SimpleNamespace(configuration_timeout=10, KNOWN_PACKS=[['minecraft', 'core', '1.21.8']], registry_packets=['registry1', 'registry2'])
+    connection = _Connection()
+    session = ConfigurationSession(server, connection)
+    session.start()
+    return session, connection
+
+def test_configuration_completes():
+    session, connection = _session()
+    assert session.stage == ConfigurationSession.KNOWN_PACKS
+    packet, future = connection.requests[-1]
+    assert isinstance(packet, configuration.CKnownPacks)
+    future.set_result(SimpleNamespace(packs=[{'pack_name': 'minecraft'}]))
+    assert session.stage == ConfigurationSession.FINISHING
+    assert session.known_packs == [{'pack_name': 'minecraft'}]
+    assert connection.queued == ['registry1', 'registry2']
+    packet, future = connection.requests[-1]
+    assert isinstance(packet, configuration.CFinishConfiguration)
+    future.set_result(SimpleNamespace())
+    assert session.stage == ConfigurationSession.DONE
+    assert connection.disconnected is None
+
+def test_timed_out_reply_disconnects():
+    for replies in range(2):
+        session, connection = _session()
+        for _ in range(replies):
+            connection.requests[-1][1].set_result(SimpleNamespace(packs=[]))
+        connection.requests[-1][1].set_exception(TimeoutError())
+        assert session.stage == ConfigurationSession.FAILED
+        assert isinstance(connection.disconnected, configuration.CDisconnect)
+        assert len(connection.requests) == replies + 1
+
+def test_cancelled_reply_stops_without_disconnecting():
+    session, connection = _session()
+    connection.requests[-1][1].cancel()
+    assert session.stage == ConfigurationSession.FAILED
+    assert connection.disconnected is None
+    assert connection.queued == []
@@ -0,0 +1,168 @@
+
+import socket
+import time
+from types import SimpleNamespace
+
+import core
+from networking.connection import Connection, ConnectionProcessor, ConnectionRegistry, InboundPacketQueue, JEConnectionState
+from networking.enum import JEPacketConnectionState
+from networking.mcpacket import ClientboundPacket
+from networking.mcpacket.io import JEPacketBuffer, PreEncodedPacket
+import networking.mcpacket.serverbound.play as play
+
+_LISTENER = SimpleNamespace(server_status=None, private=None, public=None, public_der=None, server_id='', online_mode=True, authenticator=None, compression_threshold=-1, compressor=None)
+
+class _Connection:
+    def __init__(self):
+        self.con_state = JEConnectionState(_LISTENER, self)
+        self.queued = []
+
+    def queue_packet(self, packet):
+        self.queued.append(packet)
+
+def test_registry_tracks_state_transitions():
+    registry = ConnectionRegistry()
+    first, second = _Connection(), _Connection()
+    registry.add(first)
+    registry.add(second)
+    assert set(registry.connections_in(JEPacketConnectionState.HANDSHAKING)) == {first, second}
+    play = registry.connections_in(JEPacketConnectionState.PLAY)
+    generation = registry.generation(JEPacketConnectionState.PLAY)
+    assert play == ()
+    first.con_state._switch_state(JEPacketConnectionState.PLAY)
+    assert registry.generation(JEPacketConnectionState.PLAY) != generation
+    assert registry.connections_in(JEPacketConnectionState.PLAY) == (first,)
+    assert registry.connections_in(JEPacketConnectionState.HANDSHAKING) == (second,)
+    # 接続の出入りがなければ同じ一覧を使い回す
+    assert registry.connections_in(JEPacketConnectionState.PLAY) is registry.connections_in(JEPacketConnectionState.PLAY)
+    registry.remove(first)
+    first.con_state._switch_state(JEPacketConnectionState.CLOSED)
+    assert registry.connections_in(JEPacketConnectionState.PLAY) == ()
+    assert registry.connections_in(JEPacketConnectionState.CLOSED) == ()
+    assert registry.connections_in() == (second,)
+
+class _CountingPacket(ClientboundPacket):
+    encoded = 0
+
+    @property
+    def packet_id(self):
+        return 0x01
+
+    def to_bytes(self, con_state):
+        _CountingPacket.encoded += 1
+        packet_buffer = JEPacketBuffer()
+        packet_buffer.write(bytes(300))
+        return packet_buffer
+
+def test_broadcast_encodes_once():
+    processor = ConnectionProcessor()
+    connections = [_Connection() for _ in range(5)]
+    for connection in connections:
+        processor.registry.add(connection)
+        connection.con_state._switch_state(JEPacketConnectionState.PLAY)
+    connections[0].con_state.compression_threshold = 256
+    assert processor.broadcast(_CountingPacket()) == 5
+    assert _CountingPacket.encoded == 1
+    frames = {connection.queued[0].frame(connection.con_state) for connection in connections}
+    assert len(frames) == 2
+
+def test_inbound_packets_are_drained_in_batches_by_type():
+    queue = InboundPacketQueue()
+    first, second = _Connection(), _Connection()
+    sessions = [play.SPlayerSession(None, index, b'', b'') for index in range(3)]
+    queue.put(sessions[0], first)
+    queue.put(_CountingPacket(), first)
+    queue.put(sessions[1], second)
+    queue.put(sessions[2], first)
+    batches = queue.drain()
+    assert len(queue) == 0
+    assert batches[play.SPlayerSession] == [(sessions[0], first.con_state), (sessions[1], second.con_state), (sessions[2], first.con_state)]
+    play.SPlayerSession.handle_batch(batches[play.SPlayerSession])
+    assert first.con_state.expiration == 2 and second.con_state.expiration == 1
+
+class _Update(ClientboundPacket):
+    droppable = True
+
+    @property
+    def packet_id(self):
+        return 0x02
+
+    def to_bytes(self, con_state):
+        packet_buffer = JEPacketBuffer()
+        packet_buffer.write(bytes(16))
+        return packet_buffer
+
+def test_stalled_client_backlog_stays_bounded():
+    listener = SimpleNamespace(**vars(_LISTENER), write_high_water_mark=64 * 1024, write_backlog_factor=4, slow_consumer_policy='pause',
+                               capture=None, adaptive_compression=None, keep_alive_interval=15, keep_alive_timeout=30)
+    server_socket, client_socket = socket.socketpair()
+    processor = ConnectionProcessor()
+    connection = Connection(server_socket, ('stalled', 0), listener)
+    processor.add_connection(connection)
+    processor.start_processor()
+    try:
+        # クライアントは一切受信しない
+        packet = PreEncodedPacket(_CountingPacket())
+        packet.frame(connection.con_state)
+        peak = 0
+        deadline = time.monotonic() + 10
+        while connection.con_state.get_state() is not JEPacketConnectionState.CLOSED and time.monotonic() < deadline:
+            connection.queue_packet(_Update())
+            connection.queue_packet(packet)
+            peak = max(peak, connection.packet_wrapper.pending_bytes() + connection._queued_bytes)
+        assert connection.con_state.get_state() is JEPacketConnectionState.CLOSED
+        assert peak <= 4 * 64 * 1024 + 300 * 2
+        assert connection.dropped_packets > 0
+        assert connection._outgoing_packets == []
+        while len(processor.registry):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        processor.stop_processor()
+        client_socket.close()
+
+def test_disconnect_sends_then_closes():
+    listener = SimpleNamespace(**vars(_LISTENER), write_high_water_mark=64 * 1024, write_backlog_factor=4, slow_consumer_policy='pause',
+                               capture=None, adaptive_compression=None, keep_alive_interval=15, keep_alive_timeout=30)
+    server_socket, client_socket = socket.socketpair()
+    processor = ConnectionProcessor()
+    connection = Connection(server_socket, ('closing', 0), listener)
+    processor.add_connection(connection)
+    processor.start_processor()
+    try:
+        connection.con_state.disconnect(_CountingPacket())
+        client_socket.settimeout(5)
+        data = b''
+        while chunk := client_socket.recv(4096):
+            data += chunk
+        # パケット長 + パケットID + データの後にソケットが閉じられる
+        assert len(data) == 2 + 1 + 300
+        deadline = time.monotonic() + 5
+        while len(processor.registry):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        processor.stop_processor()
+        client_socket.close()
+
+def test_keep_alive_timeout_closes_the_connection():
+    listener = SimpleNamespace(**vars(_LISTENER), write_high_water_mark=64 * 1024, write_backlog_factor=4, slow_consumer_policy='pause',
+                               capture=None, adaptive_compression=None, keep_alive_interval=0, keep_alive_timeout=0.05)
+    server_socket, client_socket = socket.socketpair()
+    processor = ConnectionProcessor()
+    connection = Connection(server_socket, ('silent', 0), listener)
+    processor.add_connection(connection)
+    connection.con_state._switch_state(JEPacketConnectionState.PLAY)
+    processor.start_processor()
+    try:
+        # クライアントはkeep-aliveに応答しない
+        connection.update_link()
+        deadline = time.monotonic() + 5
+        while len(processor.registry):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert connection.con_state.get_state() is JEPacketConnectionState.CLOSED
+        assert server_socket.fileno() == -1
+    finally:
+        processor.stop_processor()
+        client_socket.close()
@@ -0,0 +1,191 @@
+import pytest
+
+import core
+from networking.enum import JEPacketConnectionState
+from networking.mcpacket.codec import encode_varint
+from networking.mcpacket.io import JEPacketBuffer, JEPacketWrapper, FrameBuffer, OutputQueue, PreEncodedPacket
+from networking.metrics import metrics
+import networking.mcpacket.serverbound.status as status
+
+class _State:
+    def __init__(self, state, compression_threshold=-1):
+        self._state = state
+        self.compression_threshold = compression_threshold
+
+    def get_state(self):
+        return self._state
+
+class _Socket:
+    # 1回のsendmsgでlimitバイトまでしか送信しないソケット
+    def __init__(self, limit=None):
+        self.data = bytearray()
+        self.limit = limit
+
+    def sendmsg(self, buffers):
+        data = b''.join(buffers)[:self.limit]
+        if not data:
+            raise BlockingIOError()
+        self.data += data
+        return len(data)
+
+def _frame(payload: bytes) -> bytes:
+    buffer = JEPacketBuffer()
+    buffer.write_varint(len(payload))
+    buffer.write(payload)
+    return buffer.get_value()
+
+def test_frame_buffer_partial_and_pipelined():
+    frames = FrameBuffer(capacity=8)
+    data = _frame(b'\x01abc') + _frame(b'\x02' + b'x' * 300)
+    frames.extend(data[:3])
+    assert frames.next_frame() is None
+    frames.extend(data[3:10])
+    assert bytes(frames.next_frame()) == b'\x01abc'
+    assert frames.next_frame() is None
+    frames.extend(data[10:])
+    assert bytes(frames.next_frame()) == b'\x02' + b'x' * 300
+    assert frames.next_frame() is None
+    assert len(frames) == 0
+
+def test_frame_buffer_rejects_oversized_frames():
+    frames = FrameBuffer()
+    frames.extend(encode_varint(2097152))
+    with pytest.raises(ValueError):
+        frames.next_frame()
+    frames = FrameBuffer()
+    frames.extend(encode_varint(2097151) + b'\x00')
+    assert frames.next_frame() is None
+
+def test_read_packet_pipelined():
+    wrapper = JEPacketWrapper(None)
+    con_state = _State(JEPacketConnectionState.STATUS)
+    for timestamp in range(100):
+        wrapper._input_buffer.extend(_frame(b'\x01' + timestamp.to_bytes(8, 'big')))
+    timestamps = []
+    while (packet := wrapper.read_packet(con_state)) is not None:
+        assert isinstance(packet, status.SPingRequest)
+        timestamps.append(packet.timestamp)
+    assert timestamps == list(range(100))
+
+def test_metrics_are_recorded_only_when_enabled(monkeypatch):
+    wrapper = JEPacketWrapper(None)
+    con_state = _State(JEPacketConnectionState.STATUS)
+    monkeypatch.setattr(metrics, '_latency', {})
+    monkeypatch.setattr(metrics, '_packets', {})
+    wrapper._input_buffer.extend(_frame(b'\x01' + bytes(8)))
+    assert wrapper.read_packet(con_state) is not None
+    assert metrics.snapshot() == {'latency': [], 'packets': []}
+    monkeypatch.setattr(metrics, 'enabled', True)
+    wrapper._input_buffer.extend(_frame(b'\x01' + bytes(8)))
+    assert wrapper.read_packet(con_state) is not None
+    snapshot = metrics.snapshot()
+    assert [entry['stage'] for entry in snapshot['latency']] == ['decode']
+    assert snapshot['packets'][0]['packets'] == 1
+
+def _compressed_frame(data_length: int, data: bytes) -> bytes:
+    import zlib
+    return _frame(encode_varint(data_length) + zlib.compress(data))
+
+def test_read_packet_rejects_payloads_larger_than_the_data_length():
+    con_state = _State(JEPacketConnectionState.STATUS, compression_threshold=0)
+    ping = b'\x01' + (1234).to_bytes(8, 'big')
+    wrapper = JEPacketWrapper(None)
+    wrapper._input_buffer.extend(_compressed_frame(len(ping), ping))
+    assert wrapper.read_packet(con_state).timestamp == 1234
+    # 申告した長さを超える部分は解凍されない (64MiBのデータでも解凍するのはdata_lengthまで)
+    for data_length, data in ((len(ping), ping + bytes(64 * 1024 * 1024)), (len(ping) + 1, ping)):
+        wrapper = JEPacketWrapper(None)
+        wrapper._input_buffer.extend(_compressed_frame(data_length, data))
+        with pytest.raises(ValueError, match='Badly compressed packet'):
+            wrapper.read_packet(con_state)
+
+def test_write_packet_framing():
+    import zlib
+    import networking.mcpacket.clientbound.status as clientbound_status
+    for threshold, compressed in ((-1, False), (0, True), (256, False)):
+        wrapper = JEPacketWrapper(None)
+        wrapper.write_packet(clientbound_status.CPongResponse(42), _State(JEPacketConnectionState.STATUS, threshold))
+        frames = FrameBuffer()
+        sink = _Socket()
+        assert wrapper._output_queue.flush(sink)
+        frames.extend(sink.data)
+        frame = JEPacketBuffer(frames.next_frame(), read_only=True)
+        if threshold >= 0:
+            data_length = frame.read_varint()
+            assert (data_length > 0) == compressed
+            if compressed:
+                frame = JEPacketBuffer(zlib.decompress(frame.remaining_bytes()), read_only=True)
+        assert frame.read_varint() == 0x01
+        assert frame.read_int64() == 42
+
+def test_output_queue_partial_writes():
+    queue = OutputQueue()
+    segments = [bytes([i]) * (i + 1) for i in range(50)]
+    for segment in segments:
+        queue.append(segment)
+    sink = _Socket(limit=7)
+    flushes = 1
+    while not queue.flush(sink):
+        flushes += 1
+    assert flushes > 1
+    assert len(queue) == 0
+    assert bytes(sink.data) == b''.join(segments)
+
+def test_varint_varlong_round_trip():
+    buffer = JEPacketBuffer()
+    varints = [0, 1, 127, 128, 255, 16383, 16384, 2147483647, -1, -2147483648]
+    varlongs = [0, 127, 128, 9223372036854775807, -1, -9223372036854775808]
+    for value in varints:
+        buffer.write_varint(value)
+    for value in varlongs:
+        buffer.write_varlong(value)
+    assert buffer.get_value()[:2] == b'\x00\x01'
+    buffer = JEPacketBuffer(buffer.get_value(), read_only=True)
+    assert [buffer.read_varint() for _ in varints] == varints
+    assert [buffer.read_varlong() for _ in varlongs] == varlongs
+    assert buffer.remaining_bytes() == b''
+
+def test_pre_encoded_packet_matches_write_packet():
+    import networking.mcpacket.clientbound.configuration as configuration
+    packet = configuration.CKnownPacks([['minecraft', 'core', '1.21.8']] * 50)
+    pre_encoded = PreEncodedPacket(packet)
+    for threshold in (-1, 0, 4096):
+        con_state = _State(JEPacketConnectionState.CONFIGURATION, threshold)
+        direct, cached = JEPacketWrapper(None), JEPacketWrapper(None)
+        direct.write_packet(packet, con_state)
+        cached.write_packet(pre_encoded, con_state)
+        direct_sink, cached_sink = _Socket(), _Socket()
+        direct._output_queue.flush(direct_sink)
+        cached._output_queue.flush(cached_sink)
+        assert direct_sink.data == cached_sink.data
+        assert pre_encoded.frame(con_state) is pre_encoded.frame(con_state)
+
+def test_pre_encoded_packet_runs_the_on_written_hook():
+    import networking.mcpacket.clientbound.login as login
+    con_state = _State(JEPacketConnectionState.LOGIN)
+    wrapper = JEPacketWrapper(None)
+    wrapper.write_packet(PreEncodedPacket(login.CSetCompression(256)), con_state)
+    assert con_state.compression_threshold == 256
+
+def test_offloaded_compression_keeps_queue_order():
+    import networking.mcpacket.clientbound.configuration as configuration
+    from networking.compression import PacketCompressor
+    con_state = _State(JEPacketConnectionState.CONFIGURATION, 0)
+    con_state.compressor = PacketCompressor(offload_size=1024, workers=1)
+    small, large = configuration.CKnownPacks([['a', 'b', 'c']]), configuration.CKnownPacks([['minecraft', 'core', '1.21.8']] * 500)
+    offloaded, inline = JEPacketWrapper(None), JEPacketWrapper(None)
+    for packet in (small, large, small):
+        offloaded.write_packet(packet, con_state)
+    con_state.compressor.offload_size = 1 << 30
+    for packet in (small, large, small):
+        inline.write_packet(packet, con_state)
+    offloaded_sink, inline_sink = _Socket(), _Socket()
+    # 圧縮が終わるまで後続のパケットも送信されない
+    while not offloaded._output_queue.flush(offloaded_sink):
+        offloaded.waiting().result(5)
+    inline._output_queue.flush(inline_sink)
+    assert offloaded_sink.data == inline_sink.data
+    stats = con_state.compressor.stats.snapshot()
+    assert stats['offloaded'] == 1 and stats['packets'] == 6
+    assert stats['saved_bytes'] > 0
+    con_state.compressor.shutdown()
@@ -1,9 +1,157 @@
+import io
+import os
+import zlib
 
-from core.level import RegionFile
+import nbtlib
+import pytest
+
+from core.level import Chunk, RegionCache, RegionFile
 
 def test_region():
     region_file = RegionFile(0, 0)
     region = region_file.read(0, 0)
     assert region is not None
     assert region.x == 0
-    assert region.z == 0
\ No newline at end of file
+    assert region.z == 0
+def _chunk_nbt(x: int, z: int) -> bytes:
+    buffer = io.BytesIO()
+    nbtlib.File({'xPos': nbtlib.Int(x), 'zPos': nbtlib.Int(z)}).write(buffer)
+    return buffer.getvalue()
+
+def _write_region(path, chunks: dict[int, bytes]):
+    # chunk index -> uncompressed NBT, each stored zlib-compressed in its own sectors
+    header = bytearray(0x2000)
+    body = bytearray()
+    for index, data in chunks.items():
+        payload = zlib.compress(data)
+        sector = 2 + len(body) // 0x1000
+        entry = (len(payload) + 1).to_bytes(4, 'big') + b'\x02' + payload
+        entry += bytes(-len(entry) % 0x1000)
+        header[index * 4:index * 4 + 4] = (sector << 8 | len(entry) // 0x1000).to_bytes(4, 'big')
+        header[0x1000 + index * 4:0x1000 + index * 4 + 4] = (1700000000 + index).to_bytes(4, 'big')
+        body += entry
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(bytes(header) + bytes(body))
+
+def test_region_file_decodes_only_requested_chunks(tmp_path):
+    _write_region(tmp_path / 'region' / 'r.-1.2.mca', {0: _chunk_nbt(-32, 64), 33: _chunk_nbt(-31, 65)})
+    region_file = RegionFile(-1, 2, str(tmp_path))
+    try:
+        chunk = region_file.read(-31, 65)
+        assert (chunk.x, chunk.z) == (-31, 65)
+        assert chunk.chunk_data['xPos'] == -31
+        assert region_file.timestamp(1, 1) == 1700000033
+        assert region_file.has_chunk(0, 0)
+        assert not region_file.has_chunk(5, 5)
+        assert region_file.read(5, 5).chunk_data is None
+    finally:
+        region_file.close()
+
+def test_region_cache_closes_least_recently_used(tmp_path):
+    for region_x in range(3):
+        _write_region(tmp_path / 'region' / f'r.{region_x}.0.mca', {0: _chunk_nbt(region_x * 32, 0)})
+    cache = RegionCache(str(tmp_path), max_open=2)
+    first = cache.region(0, 0)
+    assert cache.read_chunk(0, 0).chunk_data['xPos'] == 0
+    assert cache.read_chunk(32, 0).chunk_data['xPos'] == 32
+    assert cache.read_chunk(64, 0).chunk_data['xPos'] == 64
+    assert cache.region(0, 0) is not first
+    cache.close()
+
+def test_region_file_writes_dirty_chunks_to_free_sectors(tmp_path):
+    _write_region(tmp_path / 'region' / 'r.0.0.mca', {0: _chunk_nbt(0, 0), 1: _chunk_nbt(1, 0)})
+    region_file = RegionFile(0, 0, str(tmp_path))
+    try:
+        chunks = [region_file.read(0, 0), region_file.read(1, 0)]
+        size = (tmp_path / 'region' / 'r.0.0.mca').stat().st_size
+        chunks[0].chunk_data['Status'] = nbtlib.String('full')
+        chunks[0].dirty = True
+        assert region_file.save(chunks) == 1
+        assert not chunks[0].dirty
+        # The new copy never overwrites the old one, it is appended and the old sector is freed afterwards.
+        assert (tmp_path / 'region' / 'r.0.0.mca').stat().st_size == size + 0x1000
+        assert region_file._locations[0] == 4 << 8 | 1
+        assert region_file._used[2:5] == b'\x00\x01\x01'
+        assert region_file.read(0, 0).chunk_data['Status'] == 'full'
+
+        # A chunk that outgrows the free runs is moved to the end, and a new chunk takes a freed sector.
+        chunks[0].chunk_data['Padding'] = nbtlib.ByteArray([byte - 128 for byte in os.urandom(0x2000)])
+        region_file.write(chunks[0], timestamp=1)
+        new_chunk = Chunk(2, 0)
+        new_chunk.chunk_data = nbtlib.File({'xPos': nbtlib.Int(2)})
+        region_file.write(new_chunk)
+        assert len(region_file.read(0, 0).chunk_data['Padding']) == 0x2000
+        assert region_file.read(2, 0).chunk_data['xPos'] == 2
+        assert region_file.timestamp(0, 0) == 1
+    finally:
+        region_file.close()
+    reopened = RegionFile(0, 0, str(tmp_path))
+    try:
+        assert reopened.read(1, 0).chunk_data['xPos'] == 1
+        assert reopened.read(2, 0).chunk_data['xPos'] == 2
+        # header (2) + chunk (2, 0) in a freed sector + chunk (1, 0) + a free sector + chunk (0, 0) in 3 appended sectors
+        assert (tmp_path / 'region' / 'r.0.0.mca').stat().st_size == 8 * 0x1000
+    finally:
+        reopened.close()
+
+def test_region_cache_saves_loaded_dirty_chunks(tmp_path):
+    _write_region(tmp_path / 'region' / 'r.0.0.mca', {0: _chunk_nbt(0, 0), 1: _chunk_nbt(1, 0)})
+    cache = RegionCache(str(tmp_path))
+    try:
+        chunk = cache.read_chunk(0, 0)
+        assert cache.read_chunk(0, 0) is chunk
+        cache.read_chunk(1, 0)
+        assert cache.save_all() == 0
+        chunk.chunk_data['Status'] = nbtlib.String('full')
+        chunk.dirty = True
+        assert cache.save_all() == 1
+        assert cache.save_all() == 0
+        chunk.dirty = True
+        cache.unload_chunk(0, 0)
+        assert not chunk.dirty
+        assert (0, 0) not in cache.chunks
+    finally:
+        cache.close()
+    reopened = RegionFile(0, 0, str(tmp_path))
+    try:
+        assert reopened.read(0, 0).chunk_data['Status'] == 'full'
+    finally:
+        reopened.close()
+
+def test_region_file_stores_large_chunks_externally(tmp_path):
+    region_file = RegionFile(0, 0, str(tmp_path))
+    try:
+        payload = os.urandom(0x100000)
+        region_file.write_payload(3, 4, 3, payload)
+        assert (tmp_path / 'region' / 'c.3.4.mcc').read_bytes() == payload
+        assert region_file.read_payload(3, 4) == (3, payload)
+        region_file.write_payload(3, 4, 3, b'\x00')
+        assert not (tmp_path / 'region' / 'c.3.4.mcc').exists()
+        assert region_file.read_payload(3, 4) == (3, b'\x00')
+    finally:
+        region_file.close()
+
+def test_region_file_keeps_the_external_chunk_until_the_header_is_updated(tmp_path, monkeypatch):
+    region_file = RegionFile(0, 0, str(tmp_path))
+    payload = os.urandom(0x100000)
+    try:
+        region_file.write_payload(3, 4, 3, payload)
+        assert not (tmp_path / 'region' / 'c.3.4.mcc.tmp').exists()
+        # Simulates a crash before the location entry of the shrunk chunk is written.
+        writes = []
+        def pwrite(fd, data, offset):
+            writes.append(offset)
+            if len(writes) == 2:
+                raise OSError('crash')
+            return len(data)
+        monkeypatch.setattr(os, 'pwrite', pwrite)
+        with pytest.raises(OSError):
+            region_file.write_payload(3, 4, 3, b'\x00')
+        monkeypatch.undo()
+    finally:
+        region_file.close()
+    reopened = RegionFile(0, 0, str(tmp_path))
+    try:
+        assert reopened.read_payload(3, 4) == (3, payload)
+    finally:
+        reopened.close()
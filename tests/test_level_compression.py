@@ -0,0 +1,89 @@
+import os
+import struct
+
+import nbtlib
+import pytest
+
+from core.level import Chunk, RegionFile, compression_type, custom_compression
+from core.level import compression
+from core.level.compression import COMPRESSION_CUSTOM, COMPRESSION_LZ4, compress, decompress
+
+def _read(compression_type: int, payload) -> bytes:
+    stream, size = decompress(compression_type, payload)
+    data = stream.read()
+    assert len(data) == size
+    return data
+
+@pytest.mark.parametrize('name', ['gzip', 'zlib', 'none', 'lz4'])
+def test_compression_round_trip(name):
+    data = os.urandom(1000) + bytes(0x30000) # spans several LZ4 blocks
+    assert _read(compression_type(name), compress(compression_type(name), data)) == data
+
+def test_large_zlib_payloads_reuse_the_stream_buffer():
+    first = os.urandom(compression.STREAM_THRESHOLD * 2)
+    second = b'x' * 100 + os.urandom(compression.STREAM_THRESHOLD)
+    stream, size = decompress(2, compress(2, first))
+    assert size == len(first) and stream.read() == first
+    reused, size = decompress(2, compress(2, second))
+    assert reused is stream
+    assert size == len(second) and reused.read() == second
+
+def test_lz4_block_stream_without_the_lz4_package(monkeypatch):
+    monkeypatch.setattr(compression, 'lz4_block', None)
+    # "abc" + a 9-byte overlapping match (offset 3) + "hello"
+    block = b'\x35abc\x03\x00\x50hello'
+    header = struct.Struct('<8sBiii')
+    payload = header.pack(b'LZ4Block', 0x26, len(block), 17, 0) + block + header.pack(b'LZ4Block', 0x16, 0, 0, 0)
+    assert _read(COMPRESSION_LZ4, payload) == b'abcabcabcabchello'
+
+@pytest.mark.parametrize('block', [
+    b'\x15a\x00\x00', # offset 0
+    b'\x15a\x02\x00', # offset before the start of the block
+    b'\x15a\x01', # truncated offset
+])
+def test_corrupt_lz4_block_is_rejected(monkeypatch, block):
+    monkeypatch.setattr(compression, 'lz4_block', None)
+    header = struct.Struct('<8sBiii')
+    # The previous block's output must not be reachable from the next block.
+    payload = header.pack(b'LZ4Block', 0x16, 1, 1, 0) + b'x' + header.pack(b'LZ4Block', 0x26, len(block), 6, 0) + block
+    with pytest.raises(ValueError, match='Corrupt LZ4 block'):
+        decompress(COMPRESSION_LZ4, payload)
+
+def test_pure_lz4_decoder_matches_the_lz4_package(monkeypatch):
+    lz4_block = pytest.importorskip('lz4.block')
+    monkeypatch.setattr(compression, 'lz4_block', lz4_block)
+    data = os.urandom(1000) + bytes(0x30000) + b'pyncraft' * 1000
+    payload = compress(COMPRESSION_LZ4, data)
+    monkeypatch.setattr(compression, 'lz4_block', None)
+    assert _read(COMPRESSION_LZ4, payload) == data
+
+def test_lz4_without_the_lz4_package_warns(monkeypatch):
+    monkeypatch.setattr(compression, 'lz4_block', None)
+    warnings = []
+    monkeypatch.setattr(compression.logger, 'warning', lambda message, *args: warnings.append(message))
+    assert compression_type('lz4') == COMPRESSION_LZ4
+    assert compression_type('zlib') != COMPRESSION_LZ4
+    assert len(warnings) == 1 and 'lz4' in warnings[0]
+
+def test_lz4_checksum_matches_lz4_java():
+    assert compression.xxhash32(b'Nobody inspects the spammish repetition') == 0xE2293B2F
+    assert compression._lz4_checksum(b'abc') == compression.xxhash32(b'abc', 0x9747B28C) & 0x0FFFFFFF
+
+def test_custom_compression_marker():
+    custom_compression('pyncraft:reversed')(lambda data: bytes(data)[::-1])
+    assert _read(COMPRESSION_CUSTOM, b'\x00\x11pyncraft:reversed' + b'cba') == b'abc'
+    with pytest.raises(ValueError, match='unknown:codec'):
+        decompress(COMPRESSION_CUSTOM, b'\x00\x0dunknown:codec')
+    with pytest.raises(ValueError):
+        compression_type('zstd')
+
+def test_region_file_writes_configured_compression(tmp_path):
+    region_file = RegionFile(0, 0, str(tmp_path), compression=compression_type('lz4'))
+    try:
+        chunk = Chunk(5, 6)
+        chunk.chunk_data = nbtlib.File({'xPos': nbtlib.Int(5)})
+        region_file.write(chunk)
+        assert region_file.read_payload(5, 6)[0] == COMPRESSION_LZ4
+        assert region_file.read(5, 6).chunk_data['xPos'] == 5
+    finally:
+        region_file.close()
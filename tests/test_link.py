@@ -0,0 +1,38 @@
+
+from types import SimpleNamespace
+
+from networking.compression import PacketCompressor
+from networking.link import AdaptiveCompression, LinkStats
+from networking.mcpacket.io import compression_level
+
+def _con_state(link: LinkStats):
+    return SimpleNamespace(compression_threshold=256, send_threshold=-1, compression_level=None, link=link)
+
+def test_fast_links_skip_compression_and_slow_links_compress_hard():
+    tuner = AdaptiveCompression(max_threshold=2097152, min_level=1, max_level=9)
+    compressor = PacketCompressor(workers=0)
+    lan = LinkStats()
+    lan.record_rtt(0.001)
+    lan_state = _con_state(lan)
+    tuner.tune(lan_state)
+    # 圧縮しないフレームがパケットの最大長を超えないようにしきい値は上限で止まる
+    assert lan_state.send_threshold == 2097151 and lan_state.compression_level == 1
+    assert compression_level(lan_state, compressor, 100000) is None
+    assert compression_level(lan_state, compressor, 2097151) == 1
+
+    remote = LinkStats()
+    remote.record_rtt(0.2)
+    remote_state = _con_state(remote)
+    tuner.tune(remote_state)
+    assert remote_state.send_threshold == 256 and remote_state.compression_level == 9
+    assert compression_level(remote_state, compressor, 300) == 9
+
+def test_throughput_is_measured_only_while_backlogged():
+    link = LinkStats()
+    link.sample(0, 0, now=0.0)
+    link.sample(1000, 0, now=1.0)
+    assert link.throughput is None
+    link.sample(2000, 5000, now=2.0)
+    link.sample(2000 + 512 * 1024, 5000, now=3.0)
+    assert link.throughput == 512 * 1024
+    assert AdaptiveCompression().congestion(link) == 1.0
@@ -0,0 +1,35 @@
+import json
+from urllib.request import urlopen
+
+from loadgen import LoadReport, StubSessionServer
+from networking.mcpacket.serverbound.login import offline_uuid
+
+def test_offline_uuid_matches_vanilla():
+    assert str(offline_uuid('Notch')) == 'b50ad385-829d-3141-a216-7e7d7539ba7f'
+
+def test_report_summarises_phases_and_errors():
+    report = LoadReport()
+    for milliseconds in range(1, 101):
+        report.record('login', milliseconds / 1000)
+    report.success()
+    report.failure('disconnected during login: Authentication failed')
+    report.failure('disconnected during login: Authentication failed')
+    report.finish()
+    summary = report.summary()
+    assert summary['succeeded'] == 1 and summary['failed'] == 2
+    assert summary['phases']['login']['count'] == 100
+    assert summary['phases']['login']['p50'] == 51
+    assert summary['phases']['login']['max'] == 100
+    assert summary['errors'] == {'disconnected during login: Authentication failed': 2}
+    assert 'login' in report.format()
+
+def test_stub_session_server_accepts_any_player():
+    session = StubSessionServer()
+    session.start()
+    try:
+        with urlopen(f'{session.url}/session/minecraft/hasJoined?username=bot0&serverId=abc') as response:
+            profile = json.loads(response.read())
+    finally:
+        session.stop()
+    assert profile['name'] == 'bot0'
+    assert profile['id'] == offline_uuid('bot0').hex
@@ -0,0 +1,52 @@
+import logging
+
+from core.logger import logger
+
+class _Formatted:
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return 'formatted'
+
+def test_disabled_debug_does_not_format_arguments():
+    argument = _Formatted()
+    logger.set_level('INFO', 'INFO')
+    try:
+        logger.debug('Incoming packet: %s', argument)
+        assert argument.count == 0
+        assert not logger.is_enabled_for(logging.DEBUG)
+    finally:
+        logger.set_level('INFO')
+
+def test_debug_reaches_the_file_with_the_default_levels():
+    logger.set_level('INFO')
+    assert logger.is_enabled_for(logging.DEBUG)
+    assert logger._file_handler.level == logging.DEBUG
+    assert logger._console_handler.level == logging.INFO
+
+def test_records_are_written_by_the_queue_listener(tmp_path):
+    handler = logging.FileHandler(tmp_path / 'test.log')
+    handler.setFormatter(logging.Formatter('%(threadName)s %(message)s'))
+    logger._listener.handlers += (handler,)
+    try:
+        logger.set_level('INFO')
+        logger.debug('Incoming packet: %s', _Formatted())
+        # キューに積まれたレコードを書き出すまで待つ
+        logger._listener.stop()
+        logger._listener.start()
+    finally:
+        logger.set_level('INFO')
+        logger._listener.handlers = logger._listener.handlers[:-1]
+        handler.close()
+    assert (tmp_path / 'test.log').read_text() == 'MainThread Incoming packet: formatted\n'
+
+def test_log_file_is_created_in_the_log_dir_on_first_write(tmp_path):
+    log_dir = tmp_path / 'logs'
+    logger.set_log_dir(str(log_dir))
+    assert not log_dir.exists()
+    logger.warning('written to %s', 'the log dir')
+    logger._listener.stop()
+    logger._listener.start()
+    assert 'written to the log dir' in (log_dir / 'log.log').read_text()
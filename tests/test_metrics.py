@@ -0,0 +1,40 @@
+
+from networking.enum import JEPacketConnectionState
+from networking.metrics import Histogram, NetworkMetrics, prometheus_text
+
+def test_histogram_log2_buckets():
+    histogram = Histogram()
+    for nanoseconds in (0, 1, 1000, 1023, 1024):
+        histogram.observe(nanoseconds)
+    histogram.observe(5000, count=3)
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 8
+    assert snapshot['sum_ns'] == 0 + 1 + 1000 + 1023 + 1024 + 15000
+    assert snapshot['buckets'] == {1: 1, 2: 1, 1024: 2, 2048: 1, 8192: 3}
+
+def test_prometheus_text_is_cumulative():
+    metrics = NetworkMetrics()
+    metrics.observe('decode', JEPacketConnectionState.PLAY, 0x1B, 1500)
+    metrics.observe('decode', JEPacketConnectionState.PLAY, 0x1B, 100)
+    metrics.count_packet('in', JEPacketConnectionState.PLAY, 0x1B, 9)
+    text = prometheus_text(metrics.snapshot())
+    labels = 'stage="decode",state="PLAY",packet_id="0x1B"'
+    assert f'pyncraft_packet_stage_seconds_bucket{{{labels},le="1.28e-07"}} 1' in text
+    assert f'pyncraft_packet_stage_seconds_bucket{{{labels},le="2.048e-06"}} 2' in text
+    assert f'pyncraft_packet_stage_seconds_count{{{labels}}} 2' in text
+    assert 'pyncraft_packet_bytes_total{direction="in",state="PLAY",packet_id="0x1B"} 9' in text
+
+def test_prometheus_text_groups_samples_by_family():
+    metrics = NetworkMetrics()
+    metrics.count_packet('in', JEPacketConnectionState.PLAY, 0x1B, 9)
+    metrics.count_packet('out', JEPacketConnectionState.PLAY, 0x2C, 20)
+    families = []
+    for line in prometheus_text(metrics.snapshot()).splitlines():
+        family = line.split()[2] if line.startswith('# TYPE') else line.split('{')[0].split()[0]
+        for suffix in ('_bucket', '_sum', '_count'):
+            if family.startswith('pyncraft_packet_stage_seconds') and family.endswith(suffix):
+                family = family[:-len(suffix)]
+        if not families or families[-1] != family:
+            families.append(family)
+    # 1つのメトリクスのサンプルが途中で別のメトリクスに分断されない
+    assert len(families) == len(set(families))
@@ -0,0 +1,38 @@
+
+import pytest
+
+import core
+from networking.mcpacket.io import PreEncodedPacket
+import networking.mcpacket.clientbound.configuration as configuration
+import networking.mcpacket.serverbound.configuration as config
+from networking.reply import ReplyCorrelator
+
+def test_replies_resolve_per_send_in_order():
+    first, second = ReplyCorrelator(), ReplyCorrelator()
+    a = first.expect(configuration.CFinishConfiguration())
+    b = first.expect(PreEncodedPacket(configuration.CFinishConfiguration()))
+    c = second.expect(configuration.CFinishConfiguration())
+    reply = config.SFinishConfigurationAcknowledged()
+    assert first.resolve(reply)
+    assert a.result(0) is reply
+    assert not b.done() and not c.done()
+    assert first.resolve(reply)
+    assert b.result(0) is reply
+    assert not first.resolve(reply)
+    assert not c.done()
+
+def test_replies_expire_and_cancel():
+    replies = ReplyCorrelator()
+    expiring = replies.expect(configuration.CFinishConfiguration(), timeout=1)
+    waiting = replies.expect(configuration.CFinishConfiguration())
+    assert replies.expire() == 0
+    assert replies.expire(now=float('inf')) == 1
+    with pytest.raises(TimeoutError):
+        expiring.result(0)
+    # 失効したFutureは読み飛ばして次の送信へ対応付ける
+    reply = config.SFinishConfigurationAcknowledged()
+    assert replies.resolve(reply)
+    assert waiting.result(0) is reply
+    pending = replies.expect(configuration.CFinishConfiguration())
+    replies.cancel_all()
+    assert pending.cancelled()
@@ -0,0 +1,62 @@
+
+import uuid
+
+import pytest
+
+import core
+from networking.mcpacket import ClientboundPacket, schema
+from networking.mcpacket.io import JEPacketBuffer
+import networking.mcpacket.serverbound.handshake as handshake
+
+@schema.packet_fields(
+    ('entity_id', schema.VarInt),
+    ('position', schema.Compound(('x', schema.Double), ('y', schema.Double), ('z', schema.Double))),
+    ('yaw', schema.Float),
+    ('on_ground', schema.Boolean),
+    ('owner', schema.UUID),
+    ('name', schema.Optional(schema.String(16))),
+    ('slots', schema.Array(schema.Int16)),
+    ('tags', schema.Array(schema.Identifier)),
+    ('payload', schema.PrefixedBytes()),
+    ('time', schema.VarLong),
+)
+class _SamplePacket(ClientboundPacket):
+    @property
+    def packet_id(self):
+        return 0x7F
+
+def test_round_trip():
+    packet = _SamplePacket()
+    packet.entity_id = -5
+    packet.position = {'x': 1.5, 'y': -64.0, 'z': 1e9}
+    packet.yaw = 90.0
+    packet.on_ground = True
+    packet.owner = uuid.uuid4()
+    packet.name = None
+    packet.slots = [1, -2, 300]
+    packet.tags = ['minecraft:stone', 'ストーン']
+    packet.payload = b'\x00\x01\x02'
+    packet.time = 1 << 40
+    data = packet.to_bytes(None).get_value()
+    decoded = _SamplePacket.from_bytes(JEPacketBuffer(data, read_only=True))
+    for name, _ in _SamplePacket._fields:
+        assert getattr(decoded, name) == getattr(packet, name)
+
+def test_matches_handwritten_encoding():
+    buffer = JEPacketBuffer()
+    buffer.write_varint(772)
+    buffer.write_utf8_string('localhost', 255)
+    buffer.write_uint16(25565)
+    buffer.write_varint(2)
+    packet_buffer = JEPacketBuffer(buffer.get_value(), read_only=True)
+    packet = handshake.SHandshakePacket.from_bytes(packet_buffer)
+    assert (packet.protocol_version, packet.server_address, packet.server_port, packet.intent) == (772, 'localhost', 25565, 2)
+    assert packet_buffer.remaining_bytes() == b''
+    assert packet.to_bytes(None).get_value() == buffer.get_value()
+
+def test_field_types_must_implement_decode_and_encode():
+    class DecodeOnly(schema.FieldType):
+        def decode(self, buffer, offset: int):
+            return None, offset
+    with pytest.raises(TypeError):
+        DecodeOnly()
@@ -0,0 +1,27 @@
+
+import json
+import uuid
+
+import core
+from networking.mcpacket.io import JEPacketBuffer
+from networking.status import ServerStatus
+
+def _status_json(status: ServerStatus) -> dict:
+    buffer = JEPacketBuffer(status.response().to_bytes(None).get_value(), read_only=True)
+    return json.loads(buffer.read_utf8_string())
+
+def test_response_is_cached_until_inputs_change():
+    status = ServerStatus('Pyncraft Server', 20)
+    response = status.response()
+    assert status.response() is response
+    player_uuid = uuid.uuid4()
+    status.player_joined(player_uuid, 'Steve')
+    assert status.response() is not response
+    players = _status_json(status)['players']
+    assert players['online'] == 1
+    assert players['sample'] == [{'name': 'Steve', 'id': str(player_uuid)}]
+    response = status.response()
+    status.set_motd('Pyncraft Server')
+    assert status.response() is response
+    status.player_left(player_uuid)
+    assert _status_json(status)['players']['online'] == 0
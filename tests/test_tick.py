@@ -0,0 +1,41 @@
+
+import threading
+import time
+
+from core.tick import TickHistogram, TickScheduler
+
+def test_phases_run_in_order_and_are_timed():
+    scheduler = TickScheduler(tps=20)
+    calls = []
+    for phase in reversed(TickScheduler.PHASES):
+        scheduler.add_handler(phase, lambda phase=phase: calls.append(phase))
+    scheduler.tick()
+    scheduler.tick()
+    assert calls == list(TickScheduler.PHASES) * 2
+    stats = scheduler.stats()
+    assert stats['tick_count'] == 2
+    assert stats['mspt']['count'] == 2
+    assert set(stats['phases']) == set(TickScheduler.PHASES)
+
+def test_overloaded_ticks_are_skipped_beyond_backlog():
+    scheduler = TickScheduler(tps=100, max_backlog=2)
+    @scheduler.phase('world')
+    def slow_tick():
+        if scheduler.tick_count == 0:
+            time.sleep(0.1)
+        elif scheduler.tick_count >= 5:
+            scheduler.stop()
+    thread = threading.Thread(target=scheduler.run)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    # 10ティック分遅れたうちmax_backlogを超えた分は実行されない
+    assert scheduler.skipped_ticks >= 5
+
+def test_histogram_buckets():
+    histogram = TickHistogram(window=3)
+    for milliseconds in (0.5, 3, 40, 1000):
+        histogram.record(milliseconds)
+    buckets = histogram.histogram()
+    assert buckets[5] == 1 and buckets[50] == 1 and buckets[float('inf')] == 1
+    assert histogram.summary()['max'] == 1000
@@ -0,0 +1,55 @@
+import json
+import time
+
+from core.tick import TickScheduler
+from core.tracing import Tracer, tracer
+
+def test_disabled_tracer_records_nothing():
+    trace = Tracer()
+    trace.begin_tick(0)
+    span = trace.span('handle', 'handle')
+    with span:
+        pass
+    assert span is trace.span('other')
+    trace.end_tick()
+    assert trace.events() == []
+
+def test_sampled_ticks_are_kept():
+    trace = Tracer()
+    trace.configure(True, sample_every=2)
+    for tick in range(4):
+        trace.begin_tick(tick)
+        with trace.span('world', 'tick'):
+            pass
+        trace.end_tick()
+    ticks = [event['args']['tick'] for event in trace.events() if event.get('name') == 'tick']
+    assert ticks == [0, 2]
+
+def test_only_ticks_over_budget_are_kept():
+    trace = Tracer()
+    trace.configure(True, budget_ms=5)
+    for tick in range(3):
+        trace.begin_tick(tick)
+        with trace.span('world', 'tick'):
+            if tick == 1:
+                time.sleep(0.01)
+        trace.end_tick()
+    events = [event for event in trace.events() if event['ph'] == 'X']
+    assert [event['name'] for event in events] == ['world', 'tick']
+    assert events[1]['args'] == {'tick': 1, 'over_budget': True}
+    assert events[0]['dur'] >= 5000
+
+def test_scheduler_phases_are_written_as_chrome_trace(tmp_path):
+    scheduler = TickScheduler(tps=20)
+    tracer.configure(True, sample_every=1)
+    try:
+        scheduler.tick()
+        path = tmp_path / 'trace.json'
+        assert tracer.dump(str(path)) == len(TickScheduler.PHASES) + 1
+    finally:
+        tracer.configure(False)
+        tracer.clear()
+    trace = json.loads(path.read_text())
+    names = [event['name'] for event in trace['traceEvents']]
+    assert 'thread_name' in names
+    assert set(TickScheduler.PHASES) < set(names)